@@ -0,0 +1,131 @@
+# client acceptor
+
+import asyncio
+import ssl
+import time
+from collections import deque
+
+import framing
+
+
+def server_ssl_context(certfile, keyfile, num_tickets=2):
+    """
+    TLS context for the client port. The server hands out session tickets, so a
+    client that reconnects (Wi-Fi blip, laptop lid) resumes its session with an
+    abbreviated handshake instead of a full certificate exchange.
+    """
+    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ssl_context.load_cert_chain(certfile=certfile, keyfile=keyfile)
+    ssl_context.options &= ~ssl.OP_NO_TICKET
+    ssl_context.num_tickets = num_tickets  # TLS 1.3 tickets sent after each handshake
+    return ssl_context
+
+
+class AcceptorMetrics:
+    """Connect latency statistics of the client acceptor (times in seconds)."""
+
+    def __init__(self, window=1000):
+        self.handshake = deque(maxlen=window)
+        self.registration = deque(maxlen=window)
+        self.total = deque(maxlen=window)
+        self.accepted = 0
+        self.resumed = 0  # accepted connections that resumed a TLS session
+        self.rejected = 0
+        self.timeouts = 0
+        self.failed = 0
+        self.in_progress = 0
+        self.peak_in_progress = 0
+
+    def started(self):
+        self.in_progress += 1
+        self.peak_in_progress = max(self.peak_in_progress, self.in_progress)
+
+    def finished(self):
+        self.in_progress -= 1
+
+    def record(self, handshake, registration):
+        self.handshake.append(handshake)
+        self.registration.append(registration)
+        self.total.append(handshake + registration)
+
+    @staticmethod
+    def percentiles(samples):
+        if not samples:
+            return "-"
+        ordered = sorted(samples)
+        def at(fraction):
+            return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+        return f"p50 {at(0.5):.1f} / p95 {at(0.95):.1f} / max {ordered[-1] * 1000:.1f} ms"
+
+    def summary(self):
+        return (f"accepted: {self.accepted} ({self.resumed} resumed TLS sessions), rejected: {self.rejected}, timeouts: {self.timeouts}, "
+                f"failed: {self.failed}, peak concurrent handshakes: {self.peak_in_progress}\n"
+                f"handshake: {self.percentiles(self.handshake)}\n"
+                f"registration: {self.percentiles(self.registration)}\n"
+                f"connect total: {self.percentiles(self.total)}")
+
+
+class ClientAcceptor:
+    """
+    Accepts student connections. The listening socket is plain TCP and every
+    accepted connection upgrades to TLS and sends its name in its own coroutine,
+    so a burst of clients is handshaken concurrently and a client that stalls
+    only runs into its own timeout instead of blocking the ones behind it.
+    """
+
+    def __init__(self, ssl_context, backlog=128, handshake_timeout=10.0, registration_timeout=10.0):
+        self.ssl_context = ssl_context
+        self.backlog = backlog
+        self.handshake_timeout = handshake_timeout
+        self.registration_timeout = registration_timeout
+        self.metrics = AcceptorMetrics()
+
+    async def start(self, host, port, handle_connection, reuse_port=False):
+        # with reuse_port several processes listen on the same port and the kernel spreads the connections
+        return await asyncio.start_server(handle_connection, host, port, backlog=self.backlog, reuse_port=reuse_port)
+
+    async def accept(self, reader, writer, register):
+        """
+        Run the TLS handshake, answer the client's COMPRESS frame and read its name, then call
+        register(writer, client_ip, client_name, codec) which returns True if the name was accepted.
+        Returns the accepted client name, or None if the connection was dropped.
+        """
+        client_ip = writer.get_extra_info("peername")[0]
+        accepted_at = time.perf_counter()
+        self.metrics.started()
+        try:
+            await writer.start_tls(self.ssl_context, ssl_handshake_timeout=self.handshake_timeout)
+            handshake_done = time.perf_counter()
+            resumed = writer.get_extra_info("ssl_object").session_reused
+
+            # the client announces the compression it decodes first, then sends its name
+            frame_type, payload = await asyncio.wait_for(framing.read_frame(reader), self.registration_timeout)
+            codec = None
+            if frame_type == framing.COMPRESS:
+                codec = framing.choose_codec(payload)
+                framing.write_frame(writer, framing.COMPRESS, framing.codec_offer())
+                frame_type, payload = await asyncio.wait_for(framing.read_frame(reader), self.registration_timeout)
+            client_name = payload.decode().strip() if frame_type == framing.TEXT else ""
+            print(f"[SERVER] Received client name: {client_name}")
+
+            if not await register(writer, client_ip, client_name, codec):
+                self.metrics.rejected += 1
+                writer.close()
+                return None
+        except (asyncio.TimeoutError, ConnectionAbortedError):  # start_tls aborts a handshake that times out
+            print(f"Client {client_ip} timed out during connect")
+            self.metrics.timeouts += 1
+            writer.close()
+            return None
+        except (asyncio.IncompleteReadError, framing.FrameError, ConnectionError, ssl.SSLError, OSError, UnicodeDecodeError) as e:
+            print(f"Error handling client connections: {e}")
+            self.metrics.failed += 1
+            writer.close()
+            return None
+        finally:
+            self.metrics.finished()
+
+        self.metrics.accepted += 1
+        self.metrics.resumed += resumed
+        self.metrics.record(handshake_done - accepted_at, time.perf_counter() - handshake_done)
+        return client_name
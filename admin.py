@@ -1,5 +1,6 @@
 # admin code
 
+import contextlib
 import socket
 import tkinter as tk
 from tkinter import ttk, messagebox, Canvas, simpledialog, filedialog
@@ -13,6 +14,11 @@ import time
 import threading
 import queue
 import sys
+import framing
+import screen_capture
+import tile_delta
+
+REQUEST_WAIT = 2  # seconds the GUI waits for the request before it to finish with the main socket
 
 """
 AdminClient is the main class for the admin interface in the classroom management system.
@@ -30,13 +36,20 @@ class AdminClient:
         self.socket = None
         self.test_socket = None
         self.msg_clientlist_socket = None
+        self.codec = None  # compression for commands and uploads, negotiated when connecting
+        # held from sending a request on self.socket until its reply is read (see _request): the GUI, the
+        # reply threads, the wall and the client list refresh of the msg thread all use the socket
+        # (reentrant, a reply handler may send the next request)
+        self.request_lock = threading.RLock()
 
         # Client tracking
         self.connected_clients = []
         self.test_status = {}  # Tracks if client is currently taking a test
         self.selected_file_info = {}
+        self.file_digests = {}  # file path -> (size, mtime, sha256), so a handout is hashed only once
         self.msg_mode = False
         self.shutdown = False
+        self.live_views = {}  # casefolded client name -> live view window state
 
         # Build the user interface  
         self._setup_ui()
@@ -87,6 +100,13 @@ class AdminClient:
                 print ("admin requested connection, ", self.admin_port)
                 self.socket.connect((self.admin_ip, self.admin_port))
                 print ("admin was approved connection")
+
+                # tell the server which compression we decode and learn what it decodes
+                framing.send_frame(self.socket, framing.COMPRESS, framing.codec_offer())
+                frame_type, payload = framing.recv_frame(self.socket)
+                if frame_type == framing.COMPRESS:
+                    self.codec = framing.choose_codec(payload)
+                print ("compression: ", self.codec)
             except:
                 print("cannot connect to server")
                 messagebox.showwarning("connection Error", "cannot connect to server.")
@@ -191,6 +211,16 @@ class AdminClient:
         self.last_file_button = tk.Button(command_frame, text="Request Last File", command=self._request_last_file)
         self.last_file_button.pack(side=tk.LEFT, padx=5, pady=5)
 
+        # how the student's machine encodes the next screenshot (faster / smaller / sharper)
+        self.screenshot_encoder = tk.StringVar(value=screen_capture.PRESETS[0])
+        encoder_menu = tk.OptionMenu(command_frame, self.screenshot_encoder, *screen_capture.PRESETS)
+        encoder_menu.pack(side=tk.LEFT, padx=5, pady=5)
+
+        # frames per second of a live view
+        self.live_view_fps = tk.StringVar(value="4")
+        fps_menu = tk.OptionMenu(command_frame, self.live_view_fps, "1", "2", "4", "8")
+        fps_menu.pack(side=tk.LEFT, padx=5, pady=5)
+
         # History - split into two parts
         # History - split into two parts with equal width using grid
         history_frame.grid_rowconfigure(0, weight=1)
@@ -263,7 +293,9 @@ class AdminClient:
             ("Test", self.Test),
             ("Test Status", lambda: self.show_test_status(refresh=True)),
             ("Msg", self.Msg),
-            ("Remove Client", self.Remove_Client)
+            ("Remove Client", self.Remove_Client),
+            ("Live View", self.live_view),
+            ("Wall", self.wall)
         ]
 
         # Place buttons in a grid
@@ -278,11 +310,11 @@ class AdminClient:
             client_bottom_frame.rowconfigure(i, weight=1)
 
         # The label
-        tk.Label(client_bottom_frame, text="Connected Clients:", font=("Arial", 12)).grid(row=6, column=0, columnspan=2, pady=(10, 2))
+        tk.Label(client_bottom_frame, text="Connected Clients:", font=("Arial", 12)).grid(row=7, column=0, columnspan=2, pady=(10, 2))
 
         # Frame for Listbox & Scrollbar
         listbox_frame = tk.Frame(client_bottom_frame)
-        listbox_frame.grid(row=7, column=0, columnspan=2, sticky="nsew", padx=5, pady=(5, 2))
+        listbox_frame.grid(row=8, column=0, columnspan=2, sticky="nsew", padx=5, pady=(5, 2))
 
         # Listbox with Scrollbar
         self.client_listbox = tk.Listbox(listbox_frame, font=("Arial", 11), height=9) 
@@ -342,10 +374,17 @@ class AdminClient:
             try:
                 while True:
                     print("trying to get message")
-                    message = self.msg_clientlist_socket.recv(4096).decode() #.recv(4096).decode("utf-8")
-                    print("got message")
-                    if not message:
+                    try:
+                        frame_type, payload = framing.recv_frame(self.msg_clientlist_socket)
+                    except ConnectionError:
                         break
+                    if frame_type == framing.SCREEN_DELTA:
+                        # live view of a client's screen: "name | tiles that changed"
+                        client_name, delta = framing.unpack_file(payload)
+                        self._show_screen_delta(client_name, delta)
+                        continue
+                    message = payload.decode()
+                    print("got message")
 
                     if message == "refresh client list, new client connected":
                         # reply for an auto refresh as sent by the server to the admin
@@ -361,10 +400,19 @@ class AdminClient:
                         # accepting messages from client (through server) and display on right button side.
                         msg = message.split("msg") [1]
                         self._log_client_message(msg)
+                    elif message.startswith("SCREENSHOT SAVED AS"):
+                        # a client sent the screenshot the admin asked for
+                        self.last_file_button.config(state=tk.NORMAL)
+                        self._log_history(message)
+                    elif message == "Error: SCREENSHOT SAVING FAILED":
+                        self._log_history(message)
+                    elif "is answering a test" in message:
+                        self._test_started(message)
                     elif "has been disconnected" in message:
                         self._refresh_client_list()
                         print("refresh client list, a client_disconnected")
-                        client_disconnected = message.split(" ")[1]
+                        # "Client a has been disconnected." or "Client a, b has been disconnected." after a timeout
+                        client_disconnected = message.split(" has been disconnected")[0].removeprefix("Client ")
                         print("client_disconnected- ", client_disconnected)
                         self._log_history(f"{client_disconnected} has been disconnected")
 
@@ -507,13 +555,98 @@ class AdminClient:
                 # Disable the last file button
                 self.last_file_button.config(state=tk.DISABLED)
 
-                command = f"SCREENSHOT: {client_name}"
+                command = f"SCREENSHOT {self.screenshot_encoder.get()}: {client_name}"
                 self._send_command(command)
         except Exception as e:
             print(f"Error while taking screenshot: {e}")
             messagebox.showerror("Screenshot Error", f"An error occurred while taking the screenshot: {e}")
 
 
+    def wall(self):
+        # one mosaic of every client's screen, made by the server the size of our canvas
+        if not self.socket:
+            messagebox.showwarning("Connection Error", "You must connect to the server first.")
+            return
+        size = f"{max(self.screenshot_canvas.winfo_width(), 1)}x{max(self.screenshot_canvas.winfo_height(), 1)}"
+        self._log_history("Requesting the class wall...")
+        threading.Thread(target=self._receive_wall, args=(size,), daemon=True).start()
+
+    def _receive_wall(self, size):
+        try:
+            with self._request():
+                framing.send_text(self.socket, f"WALL {size}", self.codec)
+                frame_type, payload = framing.recv_frame(self.socket)
+            if frame_type != framing.FILE:
+                self._log_history(f"Wall failed: {payload.decode(errors='ignore')}")
+                return
+            file_name, data = framing.unpack_file(payload)
+            image = Image.open(BytesIO(data))
+            image.load()
+            print(f"Received {file_name}, {len(data)} bytes")
+            self.root.after(0, self._show_wall, image)
+        except Exception as e:
+            self._log_history(f"Error receiving the wall: {e}")
+
+    def _show_wall(self, image):
+        self.disable_screenshot_scroll()
+        photo = ImageTk.PhotoImage(image)
+        self.screenshot_canvas.delete("all")
+        self.screenshot_canvas.create_image(0, 0, image=photo, anchor=tk.NW)
+        self.screenshot_canvas.image = photo
+        self._log_history("Class wall displayed.")
+
+    def live_view(self):
+        try:
+            client_name = self._choose_client(allow_all=False)
+            if not client_name:
+                return
+            key = client_name.casefold()
+            if key not in self.live_views:
+                window = tk.Toplevel(self.root)
+                window.title(f"Live View - {client_name}")
+                window.geometry("800x450")
+                label = tk.Label(window, bg="black")
+                label.pack(fill=tk.BOTH, expand=True)
+                window.protocol("WM_DELETE_WINDOW", lambda: self._close_live_view(client_name))
+                self.live_views[key] = {"window": window, "label": label, "canvas": tile_delta.TileCanvas(), "pending": False}
+            # a repeated request just changes the settings of the running view
+            self._send_command(f"MONITOR {self.live_view_fps.get()} {self.screenshot_encoder.get()}: {client_name}")
+        except Exception as e:
+            print(f"Error while starting the live view: {e}")
+            messagebox.showerror("Live View Error", f"An error occurred while starting the live view: {e}")
+
+    def _close_live_view(self, client_name):
+        view = self.live_views.pop(client_name.casefold(), None)
+        if view is not None:
+            view["window"].destroy()
+        if self.socket:
+            self._send_command(f"MONITOR STOP: {client_name}")
+
+    def _show_screen_delta(self, client_name, delta):
+        # runs on the msg listener thread: the screen is rebuilt here, the window is redrawn by tkinter
+        view = self.live_views.get(client_name.casefold())
+        if view is None:
+            return
+        try:
+            view["canvas"].apply(delta)
+        except ValueError as e:
+            print(f"[ERROR] Bad screen delta from {client_name}: {e}")
+            return
+        if not view["pending"]:  # redraw at most once per tkinter turn, however many deltas arrived
+            view["pending"] = True
+            self.root.after(0, self._draw_live_view, view)
+
+    def _draw_live_view(self, view):
+        view["pending"] = False
+        image = view["canvas"].image()
+        if image is None or not view["window"].winfo_exists():
+            return
+        width, height = max(view["label"].winfo_width(), 1), max(view["label"].winfo_height(), 1)
+        image = ImageOps.contain(image, (width, height), Image.Resampling.BILINEAR)
+        photo = ImageTk.PhotoImage(image)
+        view["label"].config(image=photo)
+        view["label"].image = photo
+
     def help(self):
         self._send_command("HELP")
 
@@ -708,50 +841,57 @@ class AdminClient:
 
 
         
-    def handle_server_reply(self, command, client_name=None):
-        # handling reply from server
+    @contextlib.contextmanager
+    def _request(self):
+        """
+        Hold the main socket for one request and its reply. The server answers
+        every request with exactly one reply, so the lock is never held waiting
+        for a frame that does not come. The GUI thread gives up after
+        REQUEST_WAIT seconds instead of freezing, the other threads wait their turn.
+        """
+        on_gui = threading.current_thread() is threading.main_thread()
+        if not self.request_lock.acquire(timeout=REQUEST_WAIT if on_gui else -1):
+            raise TimeoutError("the connection to the server is busy with another request, try again")
         try:
-            if client_name.lower() == "all":
-                a = self.connected_clients
-                print ("sendall in handle server reply")
-            else:
-                a= [client_name]
-            for client in a:
-                    print(f"Handling reply for client {client_name}\n")
-                    try:
-                        response = self.socket.recv(1024).decode()
-                    except Exception as e:
-                        print(f"Error getting response: {e}")
-                        self._log_history(f"Error getting response: {e}")
+            yield
+        finally:
+            self.request_lock.release()
 
-                    
-                    if response:                    
-                        if response.startswith("SCREENSHOT SAVED AS"):
-                            # Enable the last file button
-                            self.last_file_button.config(state=tk.NORMAL)
-                        elif "sent MSG you got a new grade" in response:
-                            self._send_command("GETGRADES")
-                            
-                        self._log_history(f"Client {client_name} -> Command: {command}\nResponse: {response}\n")
-
-                        if "is answering a test" in response:
-                            c_name = response.split ("is") [0].strip()
-                            self.test_status[c_name] = True
-                            self.history_text.insert(tk.END, f"[INFO] Test status for {c_name}: Started\n")
-                            print("self.test_status", self.test_status)
-                            self.show_test_status()
-                            # create a new socket on another port
-                            print(f"{client_name} is answering a test... waiting up to 60 seconds for results")
-                            threading.Thread(target=self.handle_test_answer, args=(), daemon=True).start()                        
-                                          
+    def handle_server_reply(self, command, client_name=None, file_path=None, file_name=None):
+        # sending a command and handling the server's reply: one report of all the clients of the command
+        try:
+            with self._request():
+                response = self._send_request(command, file_path, file_name)
+                if response is None:
+                    response = framing.recv_text(self.socket)
+        except Exception as e:
+            print(f"Error getting response: {e}")
+            self._log_history(f"Error getting response: {e}")
+            return
+
+        try:
+            if "sent MSG you got a new grade" in response:
+                self._send_command("GETGRADES")
+            self._log_history(f"Client {client_name} -> Command: {command}\nResponse: {response}\n")
         except Exception as e:
             print(f"Error getting reply from server: {e}")
 
+    def _test_started(self, message):
+        # "<name> is answering a test", sent by the server on the msg socket: wait for the test answer
+        c_name = message.split ("is") [0].strip()
+        self.test_status[c_name] = True
+        self.history_text.insert(tk.END, f"[INFO] Test status for {c_name}: Started\n")
+        print("self.test_status", self.test_status)
+        self.show_test_status()
+        # create a new socket on another port
+        print(f"{c_name} is answering a test... waiting up to 60 seconds for results")
+        threading.Thread(target=self.handle_test_answer, args=(), daemon=True).start()
+
             
     def handle_test_answer(self):
         # getting response from server of client's Test answers.
         try:
-            second_response = self.test_socket.recv(1024).decode()
+            second_response = framing.recv_text(self.test_socket)
             if "TEST_ANSWER" in second_response:
                 client_name = second_response.split(":")[1].strip()
                 self.test_status[client_name] = False
@@ -793,6 +933,41 @@ class AdminClient:
             print(f"Error in _get_command: {e}")
             self._log_history(f"Command entry error: {e}")
             
+    def _show_text(self, response, font=("Arial", 20)):
+        # displays a text reply of the server on the black canvas
+        print(response)
+        # Estimate the height needed based on number of lines
+        num_lines = response.count('\n') + 1
+        print ("num_lines- ",num_lines)
+        line_height = 30  # Approximate pixel height per line with font size 20
+        total_height = num_lines * line_height + 200  # Some extra padding
+
+        self.enable_screenshot_scroll(total_height)
+
+        self.screenshot_canvas.delete("all")
+        self.screenshot_canvas.create_text(10, 10, text=response, font=font, fill="white", anchor="nw")
+
+    def _receive_grades(self, command):
+        """The text of a GETGRADES page: GRADE_ROWS frames until GRADE_END, or an error message."""
+        lines = []
+        while True:
+            frame_type, payload = framing.recv_frame(self.socket)
+            if frame_type == framing.TEXT:
+                return payload.decode()  # "Error: ..." or a database error
+            if frame_type == framing.GRADE_ROWS:
+                lines.append(payload.decode())
+            elif frame_type == framing.GRADE_END:
+                fields = framing.unpack_fields(payload)
+                break
+        if not lines:
+            return "No grades data available."
+        response = "current grades:\n" + "\n".join(lines)
+        if fields.get("next", "0") != "0":
+            # the next page continues where this one stopped, with the same filters
+            filters = [token for token in command.split()[1:] if not token.startswith("before=")]
+            response += f"\n\nolder grades: {' '.join(['GETGRADES'] + filters + ['before=' + fields['next']])}"
+        return response
+
     def _send_command(self, command):
         #this def is sending commands to the server.
         
@@ -814,33 +989,29 @@ class AdminClient:
             elif command == "CLIENTLIST":
                 self._refresh_client_list()
 
-            # Request grade list from server
-            elif command == "GETGRADES":
-                self.socket.sendall(command.encode())
-                response = self.socket.recv(4096).decode()
-                print(response)
-                if response != "Database error occurred. Please try again later.":
-                    response = "current grades:\n" + response
-                # Estimate the height needed based on number of lines
-                num_lines = response.count('\n') + 1
-                print ("num_lines- ",num_lines)
-                line_height = 30  # Approximate pixel height per line with font size 20
-                total_height = num_lines * line_height + 200  # Some extra padding
-
-                self.enable_screenshot_scroll(total_height)
-
-                self.screenshot_canvas.delete("all")
-                self.screenshot_canvas.create_text(10, 10, text=response, font=("Arial", 20), fill="white", anchor="nw")
+            # Request grade list from server: one page, newest first, streamed in row batches
+            elif command.startswith("GETGRADES"):
+                with self._request():
+                    framing.send_text(self.socket, command, self.codec)
+                    response = self._receive_grades(command)
+                self._show_text(response)
+
+            # Request the grade statistics of the class, or of one student with name=, or the item analysis
+            # of the tests, or of the questions of one test file
+            elif command.startswith(("GRADESTATS", "ITEMANALYSIS")):
+                with self._request():
+                    framing.send_text(self.socket, command, self.codec)
+                    _, payload = framing.recv_frame(self.socket)
+                self._show_text(payload.decode(), font=("Courier", 20))  # fixed width lines up the histogram and the tables
 
             else:
                 # Handle file transfer commands
+                file_path = file_name = None
                 if "SENDFILE" in command:
                     if "SENDFILE1" in command: #handles sendfile from the same directory of the project
                         print ("command ", command)
                         file_name = command.split(':')[0].replace('SENDFILE1','').strip()
-                        ip = command.split(':')[1] # need to also check for errors
-                        with open(file_name, "rb") as f:
-                            data = f.read()
+                        file_path = file_name
                     else:   #handles sendfile from other directorys
                         print("command ", command)
                         file_info = self.selected_file_info.get(command)
@@ -849,32 +1020,12 @@ class AdminClient:
                             return
 
                         file_path, file_name = file_info
-                        ip = command.split(':')[1].strip()
-                        with open(file_path, "rb") as f:
-                            data = f.read()
 
-                    checksum = hashlib.md5(data).hexdigest()
-                    print(f"Sending file of size {len(data)} bytes with checksum {checksum}")
-
-                    # Send file protocol commands
-                    self.socket.sendall(command.encode())
-                    self.socket.sendall(b"DATA_NAME") # fix: take the daniel.txt from the command
-                    self.socket.sendall(file_name.encode())
-                    self.socket.sendall(b"DATA_START")                   
-                    self.socket.sendall(data)
-                    self.socket.sendall(b"DATA_END")
-
-                    print(f"Sent file {file_name} to server.")
-                 
-                    
-                else: # including SCREENSHOT: supports BLOCK: ip, UNBLOCK: ip, MSG, GRADE, Remove, xxxx: IP
-                      # add IMG xxxx: IP
-                    print ("sending command - ",command.encode())
-                    self.socket.sendall(command.encode())
+                client_target = command.split(":")[1].strip() if ":" in command else None
 
-                client_target = command.split(":")[1].strip()
- 
-                threading.Thread(target=self.handle_server_reply, args=(command, client_target), daemon=True).start()
+                # the reply thread sends the command too, so no other request gets between it and its replies
+                threading.Thread(target=self.handle_server_reply, args=(command, client_target, file_path, file_name),
+                                 daemon=True).start()
 
 
                 
@@ -882,6 +1033,56 @@ class AdminClient:
             self._log_history(f"Error sending command: {e}\n")
             
 
+    def _send_request(self, command, file_path=None, file_name=None):
+        # sends a command, with a SENDFILE its file. Called with request_lock held, returns the
+        # server's reply if it refused the file offer (it is the only reply then), otherwise None
+        if file_path is None: # including SCREENSHOT: supports BLOCK: ip, UNBLOCK: ip, MSG, GRADE, Remove, xxxx: IP
+                              # add IMG xxxx: IP
+            print ("sending command - ",command)
+            framing.send_text(self.socket, command, self.codec)
+            return
+
+        # Send file protocol commands: the file is first offered by its hash,
+        # it is only uploaded if the server does not have it in its file cache.
+        # The upload is streamed in chunks and the server forwards each chunk
+        # to the clients as it arrives
+        file_size, digest = self._file_digest(file_path)
+        framing.send_text(self.socket, command, self.codec)
+        framing.send_frame(self.socket, framing.FILE_OFFER, framing.pack_file_offer(digest, file_name, file_size))
+        frame_type, payload = framing.recv_frame(self.socket)
+        if frame_type == framing.TEXT:
+            return payload.decode()
+        if frame_type == framing.FILE_HAVE:
+            print(f"Server already has {file_name} ({digest.hex()[:12]}), nothing to upload")
+        else:
+            framing.send_frame(self.socket, framing.FILE_BEGIN, framing.pack_file_begin(file_name, file_size))
+            with open(file_path, "rb") as f:
+                while True:
+                    chunk = f.read(framing.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    framing.send_frame(self.socket, framing.FILE_CHUNK, chunk, codec=self.codec)
+            framing.send_frame(self.socket, framing.FILE_END)
+            print(f"Sent file of size {file_size} bytes with checksum {digest.hex()}")
+
+        print(f"Sent file {file_name} to server.")
+
+    def _file_digest(self, file_path):
+        # returns (size, sha256 digest) of a file, recomputed only when the file changed
+        stat = os.stat(file_path)
+        cached = self.file_digests.get(file_path)
+        if cached and cached[:2] == (stat.st_size, stat.st_mtime):
+            return stat.st_size, cached[2]
+        checksum = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            while True:
+                chunk = f.read(framing.CHUNK_SIZE)
+                if not chunk:
+                    break
+                checksum.update(chunk)
+        self.file_digests[file_path] = (stat.st_size, stat.st_mtime, checksum.digest())
+        return stat.st_size, checksum.digest()
+
     def _log_history(self, message):
         # displays log history information in the bottom-left corner of the screen
         try:
@@ -914,12 +1115,11 @@ class AdminClient:
 
         try:
 
-            # Send the CLIENTLIST request
-            self.socket.sendall(b"CLIENTLIST")
-
             try:
-                # Try to receive the response from the server
-                response = self.socket.recv(1024).decode()
+                # Send the CLIENTLIST request and receive the response from the server
+                with self._request():
+                    framing.send_text(self.socket, "CLIENTLIST")
+                    response = framing.recv_text(self.socket)
                 print ("response of clientlist**",response,"&&")
                 
                 # Check if there are no clients connected
@@ -952,6 +1152,8 @@ class AdminClient:
                 self._log_history(f"Connected Clients: {client_list}\n")
 
 
+            except TimeoutError as e:
+                self._log_history(f"Cannot refresh client list: {e}")
             except:
                 self._log_history("Error: No clients are connected.")
 
@@ -973,22 +1175,15 @@ class AdminClient:
             self.disable_screenshot_scroll()
             client_name = self._choose_client(allow_all=False)
             if client_name:
-                self.socket.sendall(f"LASTFILE - {client_name}".encode())
-                chunk = self.socket.recv(1024)
-                if chunk.decode().startswith("Error: No files found for client"):
+                with self._request():
+                    framing.send_text(self.socket, f"LASTFILE - {client_name}")
+                    frame_type, payload = framing.recv_frame(self.socket)
+                if frame_type == framing.TEXT and payload.startswith(b"Error: No files found for client"):
                     print ("no last file from client - {client_name}")
                     self._log_history(f"no last file from client - {client_name}")
                     return
-                elif "Error: No files found on server" not in chunk.decode():
-                    # Start collecting file data
-                    data = chunk.replace(b"FILE_START", b"")
-                    
-                    while True:
-                        chunk = self.socket.recv(4096)
-                        if b"FILE_END" in chunk:
-                            data += chunk.replace(b"FILE_END", b"")
-                            break
-                        data += chunk
+                elif frame_type == framing.FILE:
+                    _, data = framing.unpack_file(payload)
 
                     checksum = hashlib.md5(data).hexdigest()
                     print(f"Received file of size {len(data)} bytes with checksum {checksum}")
@@ -0,0 +1,960 @@
+# asyncio server engine
+
+import asyncio
+import re
+import selectors
+import sys
+import time
+from datetime import datetime
+
+import framing
+import thumbnail_wall
+from acceptor import ClientAcceptor
+from broadcast import ClientSender, StreamFanOut, broadcast
+from client_registry import ClientRecord, ClientRegistry
+from db_executor import DatabaseExecutor
+from file_cache import FileCache
+from grade_query import ROWS_PER_FRAME, GradeQuery, format_rows, read_page
+from grade_stats import format_stats, parse_name, read_stats
+from grade_writer import GradeWriter
+from item_analysis import add_answers, item_report, report_answers_write
+from screenshot_store import ScreenshotStore
+from screenshot_upload import ScreenshotUpload
+from tile_delta import TileHistory
+from timer_wheel import TimerWheel
+
+try:
+    import resource
+except ImportError:  # Windows has no resource module
+    resource = None
+
+
+"""
+AsyncServerEngine is the networking core of the classroom server.
+Every admin and client connection is served by its own coroutine on a single
+event loop, so admin commands, client messages, screenshots and file relays
+are handled concurrently and the connection tables are only touched from one thread.
+"""
+
+def new_event_loop():
+    """
+    Event loop for the server. On Linux / macOS this is a selector loop on the
+    platform's best selector (epoll / kqueue): sockets stay registered for the
+    life of the connection, writes wait for write readiness instead of blocking,
+    and there is no FD_SETSIZE limit like with select(). Windows keeps the
+    default proactor (IOCP) loop, its selector loop is select() based.
+    """
+    if sys.platform == "win32":
+        return asyncio.ProactorEventLoop()
+    return asyncio.SelectorEventLoop(selectors.DefaultSelector())
+
+
+def raise_open_file_limit():
+    """Raise the soft limit of open files to the hard limit, every client needs one. Returns the limit."""
+    if resource is None:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+            soft = hard
+        except (ValueError, OSError) as e:
+            print(f"Cannot raise the open file limit above {soft}: {e}")
+    return soft
+
+
+class AsyncServerEngine:
+    def __init__(self, server_ip, admin_port, admin_port_test, client_port, client_msg_clientlist_port, ssl_context, session=None,
+                 client_backlog=1024, handshake_timeout=10.0, file_cache=None, max_send_queue=8 * 1024 * 1024,
+                 heartbeat_interval=10.0, idle_timeout=35.0, screenshot_store=None, compact_interval=600.0):
+        self.start_time = datetime.now()
+
+        # Configuration
+        self.server_ip = server_ip
+        self.admin_port = admin_port
+        self.admin_port_test = admin_port_test
+        self.client_port = client_port
+        self.client_msg_clientlist_port = client_msg_clientlist_port
+        self.ssl_context = ssl_context
+        self.session = session
+        # every database call runs on this thread, the event loop never waits for SQLite
+        self.database = DatabaseExecutor(session) if session is not None else None
+        self.grades = GradeWriter(self.database)  # GRADE rows, written in batches
+        if screenshot_store is None:
+            screenshot_store = ScreenshotStore(self.database)
+            screenshot_store.load()
+        self.screenshots = screenshot_store  # the saved screenshots, by client and time
+        self.compact_interval = compact_interval  # seconds between passes of the screenshot retention and transcoding
+        self.acceptor = ClientAcceptor(ssl_context, backlog=client_backlog, handshake_timeout=handshake_timeout,
+                                       registration_timeout=handshake_timeout)
+        self.file_cache = file_cache if file_cache is not None else FileCache()
+        self.offer_timeout = 5.0  # how long to wait for a client to answer a file offer
+        self.max_send_queue = max_send_queue  # bytes a client may fall behind before it is disconnected
+        self.heartbeat_interval = heartbeat_interval  # a client that was quiet this long gets a PING
+        self.idle_timeout = idle_timeout  # a client that was quiet this long (no PONG either) is disconnected
+        self.timers = TimerWheel(tick=min(1.0, heartbeat_interval / 4))  # next heartbeat check of every client
+        self.max_monitor_backlog = 4 * 1024 * 1024  # live view bytes the admin may fall behind before deltas are skipped
+        self.wall_timeout = 5.0  # how long WALL waits for the clients' screenshots
+        self.wall_requests = {}  # writer -> WallRequest still waiting for that client's screenshot
+
+        # Admin streams (main, test answers, messages / clientlist)
+        self.admin_reader = None
+        self.admin_writer = None
+        self.admin_codec = None  # compression the admin negotiated on its main stream
+        self.admin_test_writer = None
+        self.admin_msg_clientlist_writer = None
+
+        self.clients = ClientRegistry()  # connected clients by writer, name and IP
+
+        self.servers = []
+        self.connection_tasks = set()  # coroutines serving the client / auxiliary admin connections
+        self.pending_report = None  # task sending the delivery report of the last command
+        self.ready = asyncio.Event()  # set once all ports are listening
+        self.stopped = asyncio.Event()  # set when the admin disconnects
+
+    async def serve(self):
+        """Start listening on all ports and run until the admin disconnects."""
+        try:
+            self.servers = [
+                await asyncio.start_server(self.handle_admin, self.server_ip, self.admin_port, ssl=self.ssl_context),
+                await asyncio.start_server(self.handle_admin_test, self.server_ip, self.admin_port_test),
+                await asyncio.start_server(self.handle_admin_msg_clientlist, self.server_ip, self.client_msg_clientlist_port),
+                await self.start_client_listener(),
+            ]
+        except Exception as e:
+            print(f"[ERROR] Failed to bind server sockets: {e}")
+            self.close_servers()
+            raise
+
+        print(f"Server is listening for admin on port {self.admin_port}")
+        print(f"Server is listening for clients on port {self.client_port}")
+        self.ready.set()
+
+        heartbeat = asyncio.create_task(self.run_heartbeat())
+        compactor = asyncio.create_task(self.run_compactor())
+        try:
+            await self.stopped.wait()
+        finally:
+            heartbeat.cancel()
+            compactor.cancel()
+            await self.shutdown()
+
+    async def start_client_listener(self):
+        return await self.acceptor.start(self.server_ip, self.client_port, self.handle_client)
+
+    def close_servers(self):
+        for server in self.servers:
+            server.close()
+
+    async def shutdown(self):
+        # Clean up connections
+        self.close_servers()
+        await self.grades.close()
+        for record in list(self.clients):
+            record.writer.close()
+        for writer in (self.admin_writer, self.admin_test_writer, self.admin_msg_clientlist_writer):
+            if writer is not None:
+                writer.close()
+        # let the connection coroutines see their streams close before the loop stops
+        if self.connection_tasks:
+            await asyncio.wait(self.connection_tasks, timeout=2)
+        if self.database is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.database.close)
+        print("server shutting down")
+
+    async def send(self, writer, frame_type, *parts):
+        """Queue one frame on a stream and wait until the transport accepted it."""
+        codec = self.admin_codec if writer is self.admin_writer else None
+        framing.write_frame(writer, frame_type, *parts, codec=codec)
+        await writer.drain()
+
+    async def send_text(self, writer, text):
+        await self.send(writer, framing.TEXT, text.encode())
+
+    async def notify_admin_msg_clientlist(self, msg):
+        # message / clientlist updates travel over the plain msg socket
+        if self.admin_msg_clientlist_writer is None:
+            print("cannot refresh clientlist")
+            return
+        try:
+            await self.send_text(self.admin_msg_clientlist_writer, msg)
+        except Exception as e:
+            print(f"Failed to send message to admin: {e}")
+
+    # --- Admin connections ---
+
+    async def handle_admin(self, reader, writer):
+        if self.admin_writer is not None:
+            print("Rejected second admin connection")
+            writer.close()
+            return
+
+        print("Admin connected ", writer.get_extra_info("peername"))
+        print("Admin client connected successfully with SSL.")
+        self.admin_reader = reader
+        self.admin_writer = writer
+        try:
+            while True:
+                frame_type, payload = await framing.read_frame(reader)
+                if frame_type == framing.COMPRESS:  # sent once by the admin after connecting
+                    self.admin_codec = framing.choose_codec(payload)
+                    print(f"admin compression: {self.admin_codec}")
+                    await self.send(writer, framing.COMPRESS, framing.codec_offer())
+                    continue
+                if frame_type != framing.TEXT:
+                    print(f"Unexpected frame type {frame_type} from admin")
+                    continue
+                command = payload.decode('latin-1', errors='ignore')
+                if command == "bye":
+                    print("Admin disconnected")
+                    break
+                await self.handle_admin_command(command)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            print("Admin disconnected")
+        except Exception as e:
+            print(f"Error in admin connection: {e}")
+        finally:
+            self.stopped.set()
+
+    async def handle_admin_test(self, reader, writer):
+        print("Admin test connected ", writer.get_extra_info("peername"))
+        self.admin_test_writer = writer
+        await self.wait_for_close(reader)  # nothing is expected from the admin here
+
+    async def handle_admin_msg_clientlist(self, reader, writer):
+        print("Admin msg / clientlist connected ", writer.get_extra_info("peername"))
+        self.admin_msg_clientlist_writer = writer
+        print("refresh client list, admin connected")
+        await self.notify_admin_msg_clientlist("refresh client list, admin connected")
+        await self.wait_for_close(reader)
+
+    async def wait_for_close(self, reader):
+        task = asyncio.current_task()
+        self.connection_tasks.add(task)
+        try:
+            await reader.read()
+        except OSError:
+            pass
+        finally:
+            self.connection_tasks.discard(task)
+
+    async def handle_admin_command(self, command):
+        print("in server read message")
+        print(command)
+
+        # Command handling - replies are sent after the reports of earlier commands
+        if command in ("CLIENTLIST", "ACCEPTSTATS", "CACHESTATS", "STORESTATS") or command.startswith("LASTFILE"):
+            await self.wait_for_reports()
+
+        if command == "CLIENTLIST":
+            client_list = self.clients.client_list()
+            print("Current client:", client_list)
+            try:
+                await self.send_text(self.admin_writer, client_list)
+            except Exception as e:
+                print(f"Error sending client list to admin: {e}")
+
+        elif command.startswith("GETGRADES"):
+            # "GETGRADES [name=] [from=] [to=] [before=] [limit=]", one page read on the DB thread and streamed
+            # after the reports of earlier commands
+            self.pending_report = self.start_task(self.send_grades(command[len("GETGRADES"):].strip(), self.pending_report))
+
+        elif command.startswith("GRADESTATS"):
+            # "GRADESTATS [name=]", read from the summary tables on the DB thread, in order with the other reports
+            self.pending_report = self.start_task(self.send_grade_stats(command[len("GRADESTATS"):].strip(),
+                                                                        self.pending_report))
+
+        elif command.startswith("ITEMANALYSIS"):
+            # "ITEMANALYSIS [test file name]", the answers matrices analyzed on the DB thread
+            self.pending_report = self.start_task(self.send_item_analysis(command[len("ITEMANALYSIS"):].strip(),
+                                                                          self.pending_report))
+
+        elif command == "ACCEPTSTATS":
+            await self.send_text(self.admin_writer, self.acceptor.metrics.summary())
+
+        elif command == "CACHESTATS":
+            await self.send_text(self.admin_writer, self.file_cache.summary())
+
+        elif command == "STORESTATS":
+            await self.send_text(self.admin_writer, self.screenshots.summary())
+
+        elif command.startswith("LASTFILE"):
+            client_name = command.split("-")[1].strip()
+            await self.send_last_file(client_name)
+
+        elif command.startswith("WALL"):
+            # "WALL" or "WALL <width>x<height>", answered once every client sent its screenshot or the time is up
+            self.pending_report = self.start_task(self.send_wall(command[len("WALL"):].strip(), self.pending_report))
+
+        else:  # Handling commands like SENDFILE, SCREENSHOT, BLOCK, UNBLOCK, MSGxxx, GRADExxx, REMOVE
+            await self.handle_targeted_command(command)
+
+    async def handle_targeted_command(self, command):
+        cmd = command.split(":")[0].strip()  # Extract command
+        command_parts = command.split(":")
+        if len(command_parts) > 1:
+            command_target = command_parts[1].strip()  # Extract target (name or IP)
+        else:
+            print(f"Invalid command format: {command}")
+            await self.wait_for_reports()
+            await self.send_text(self.admin_writer, "Error: Invalid command format")
+            return
+        print("command ", cmd)
+        print("command_target", command_target)
+
+        # Convert name or IP to the list of target clients
+        targets = self.get_target_ip(command_target)
+
+        if not targets:
+            print(f"Error: Target '{command_target}' not found.")
+            await self.wait_for_reports()
+            await self.send_text(self.admin_writer, f"Error: Target '{command_target}' not found.")
+            return
+
+        file_name = ""
+        if "GRADE" in cmd:
+            if not await self.save_grade(cmd, command, targets):
+                return
+            cmd = re.sub(r"GRADE (\d+)", r"MSG you got a new grade - \1", cmd)
+            print("Got a new grade - must update DB", cmd)
+
+        if cmd.startswith("SCREENSHOT"):
+            for record in targets:
+                self.wall_requests.pop(record.writer, None)  # the next screenshot is the admin's, not a late one for a wall
+
+        if cmd.startswith("MONITOR") and "STOP" not in cmd:
+            # show the screen the server already has at once, the client only sends what changes from now on
+            for record in targets:
+                if record.screen is not None:
+                    self.relay_screen(record, record.screen.replay())
+
+        # Sending command to selected clients, all of them at once
+        senders = [record.sender for record in targets]
+        print("sending command to clients ", [sender.name for sender in senders], ":", cmd)
+        started = time.perf_counter()
+        if "SENDFILE" in cmd:
+            # the file follows the command as FILE_BEGIN / FILE_CHUNK... / FILE_END frames
+            file_name = cmd.split(':')[0].replace('SENDFILE', '').strip()
+            print("server in SENDFILE", file_name)
+            await self.wait_for_reports()  # the answer to the file offer must not overtake an earlier report
+            await self.report_delivery(cmd, file_name, started, self.relay_file(senders))
+        else:
+            # the command is queued on every client right away, the admin's next command
+            # is handled while it is still being written to slow clients
+            delivery = broadcast(senders, framing.TEXT, cmd.encode())
+            self.pending_report = self.start_task(self.report_delivery(cmd, file_name, started, delivery, self.pending_report))
+
+    async def report_delivery(self, cmd, file_name, started, delivery, previous=None):
+        """
+        Wait until a command reached its clients and report every client's
+        completion back to the admin, as one reply: the admin reads exactly one
+        per command. What the clients send back later (a screenshot saved, a
+        test started) goes over the msg socket.
+        """
+        results = await delivery
+        if previous is not None:
+            await previous  # reports go out in command order
+        if results is None:
+            return
+        print(f"{cmd} delivered to {len(results)} clients in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        reply = ""
+        for sender, result in results:
+            if isinstance(result, Exception):
+                reply += f"Error: Failed to send {cmd} to {sender.name}: {result}\n"
+            else:
+                reply += f"sent {cmd} to: {sender.name} ({sender.ip}) in {result * 1000:.1f} ms\n"
+        print("server sending reply to admin, ", reply)
+        try:
+            await self.send_text(self.admin_writer, reply)
+        except Exception as e:
+            print(f"[ERROR] Sending the report of {cmd} to the admin failed: {e}")
+
+    async def wait_for_reports(self):
+        if self.pending_report is not None:
+            await self.pending_report
+
+    def start_task(self, coro):
+        task = asyncio.create_task(coro)
+        self.connection_tasks.add(task)
+        task.add_done_callback(self.connection_tasks.discard)
+        return task
+
+    async def relay_file(self, senders):
+        """
+        Stream a file from the admin to the target clients chunk by chunk (cut-through),
+        so students start receiving while the admin is still uploading.
+        The admin first offers the file's hash. The offer is passed on to the clients
+        and only those that do not have the content cached get the file; it is sent
+        from the server's file cache if possible, otherwise the admin uploads it and
+        the upload is stored in the cache on the way.
+        Returns the per client results, or None if the upload was broken.
+        """
+        frame_type, payload = await framing.read_frame(self.admin_reader)
+        if frame_type != framing.FILE_OFFER:
+            return await self.relay_upload(frame_type, payload, senders)
+
+        try:
+            digest, file_name, size = framing.unpack_file_offer(payload)
+        except framing.FrameError as e:
+            print(f"[ERROR] Bad file offer from admin: {e}")
+            await self.send_text(self.admin_writer, f"Error: Bad file offer: {e}")
+            return None
+
+        # clients that received the same content before take it from their own cache
+        senders, results = await self.offer_to_clients(senders, payload, digest)
+        if not senders:
+            print(f"all clients already have {file_name}")
+            await self.send(self.admin_writer, framing.FILE_HAVE)
+            return results
+
+        path = self.file_cache.lookup(digest, size)
+        if path is not None:
+            print(f"{file_name} found in the file cache")
+            await self.send(self.admin_writer, framing.FILE_HAVE)
+            relayed = await self.relay_cached_file(path, file_name, size, senders)
+        else:
+            await self.send(self.admin_writer, framing.FILE_NEED)
+            frame_type, payload = await framing.read_frame(self.admin_reader)
+            relayed = await self.relay_upload(frame_type, payload, senders, self.file_cache.writer(digest, size))
+        return None if relayed is None else results + relayed
+
+    async def offer_to_clients(self, senders, offer, digest):
+        """
+        Send a FILE_OFFER to the clients and wait for their answers.
+        Returns the senders that need the file, and the results of the clients
+        that already have it (or could not be reached).
+        """
+        answers = await asyncio.gather(*(self.offer_to_client(sender, offer, digest) for sender in senders),
+                                       return_exceptions=True)
+        need, results = [], []
+        for sender, answer in zip(senders, answers):
+            if isinstance(answer, Exception):
+                results.append((sender, answer))
+            elif answer[0] == framing.FILE_HAVE:
+                print(f"{sender.name} already has the file")
+                results.append((sender, answer[1]))
+            else:
+                need.append(sender)
+        return need, results
+
+    async def offer_to_client(self, sender, offer, digest):
+        record = self.clients.get(sender.writer)
+        if record is None:
+            raise ConnectionError(f"{sender.name} disconnected")
+        future = asyncio.get_running_loop().create_future()
+        record.offer = (digest, future)
+        started = time.perf_counter()
+        try:
+            await sender.send_frame(framing.FILE_OFFER, offer)
+            answer = await asyncio.wait_for(future, self.offer_timeout)
+        except asyncio.TimeoutError:
+            answer = framing.FILE_NEED  # a client that does not answer gets the whole file
+        finally:
+            record.offer = None
+        return answer, time.perf_counter() - started
+
+    async def relay_upload(self, frame_type, payload, senders, cache_entry=None):
+        """
+        Relay the file the admin uploads, starting with its FILE_BEGIN frame.
+        If cache_entry is given the file is also written into the file cache.
+        """
+        if frame_type != framing.FILE_BEGIN:
+            print(f"Expected FILE_BEGIN after SENDFILE, got type {frame_type}")
+            if cache_entry:
+                cache_entry.discard()
+            await self.send_text(self.admin_writer, "Error: File data missing")
+            return None
+        try:
+            file_name, size = framing.unpack_file_begin(payload)
+        except framing.FrameError as e:
+            print(f"[ERROR] Bad file upload from admin: {e}")
+            if cache_entry:
+                cache_entry.discard()
+            await self.send_text(self.admin_writer, f"Error: File upload failed: {e}")
+            return None
+        print(f"relaying {file_name} ({size} bytes)")
+
+        loop = asyncio.get_running_loop()
+        fan_out = StreamFanOut(senders)
+        await fan_out.send(framing.FILE_BEGIN, payload)
+        received = 0
+        try:
+            if cache_entry and cache_entry.size != size:
+                raise framing.FrameError(f"offered {cache_entry.size} bytes but sent {size}")
+            while True:
+                frame_type, flags, packed = await framing.read_raw_frame(self.admin_reader)
+                chunk = framing.decompress(flags, packed)
+                if frame_type == framing.FILE_END:
+                    break
+                if frame_type != framing.FILE_CHUNK or received + len(chunk) > size:
+                    raise framing.FrameError(f"unexpected frame type {frame_type} in file stream")
+                received += len(chunk)
+                frame = framing.EncodedFrame(framing.FILE_CHUNK, chunk)
+                if flags:  # clients of the admin's codec get the chunk as the admin compressed it
+                    frame.add_encoding(framing.codec_for_flags(flags), flags, packed)
+                await fan_out.send_encoded(frame)
+                if cache_entry:
+                    await loop.run_in_executor(None, cache_entry.write, chunk)
+            if received != size:
+                raise framing.FrameError(f"file ended after {received} of {size} bytes")
+        except framing.FrameError as e:
+            print(f"[ERROR] Broken file upload from admin: {e}")
+            if cache_entry:
+                cache_entry.discard()
+            await fan_out.send(framing.FILE_ABORT)
+            await fan_out.finish()
+            await self.send_text(self.admin_writer, f"Error: File upload failed: {e}")
+            return None
+        except (asyncio.IncompleteReadError, ConnectionError):
+            if cache_entry:
+                cache_entry.discard()
+            await fan_out.send(framing.FILE_ABORT)
+            await fan_out.finish()
+            raise
+
+        await fan_out.send(framing.FILE_END)
+        if cache_entry and not cache_entry.commit():
+            print(f"[ERROR] {file_name} does not match the offered hash, not cached")
+        return await fan_out.finish()
+
+    async def relay_cached_file(self, path, file_name, size, senders):
+        """Stream a file from the file cache to the target clients."""
+        loop = asyncio.get_running_loop()
+        fan_out = StreamFanOut(senders)
+        await fan_out.send(framing.FILE_BEGIN, framing.pack_file_begin(file_name, size))
+        try:
+            with open(path, "rb") as f:
+                while True:
+                    chunk = await loop.run_in_executor(None, f.read, framing.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    await fan_out.send(framing.FILE_CHUNK, chunk)
+        except OSError as e:
+            print(f"[ERROR] Reading {file_name} from the file cache failed: {e}")
+            await fan_out.send(framing.FILE_ABORT)
+            await fan_out.finish()
+            await self.send_text(self.admin_writer, f"Error: File cache read failed: {e}")
+            return None
+        await fan_out.send(framing.FILE_END)
+        return await fan_out.finish()
+
+    async def send_grades(self, args, previous=None):
+        """Stream a page of grades to the admin: GRADE_ROWS frames and a GRADE_END with the cursor of the next page."""
+        error = rows = None
+        try:
+            query = GradeQuery.parse(args)
+            self.grades.flush()  # the grades given so far, queued or not, are written before the query runs
+            rows, cursor = await self.database.run(read_page, query)
+        except ValueError as e:
+            error = f"Error: {e}"
+        except Exception as e:
+            print(f"Database error in GETGRADES: {e}")
+            error = "Database error occurred. Please try again later."
+        if previous is not None:
+            await previous
+        try:
+            if error is not None:
+                await self.send_text(self.admin_writer, error)
+                return
+            for start in range(0, len(rows), ROWS_PER_FRAME):
+                await self.send(self.admin_writer, framing.GRADE_ROWS, format_rows(rows[start:start + ROWS_PER_FRAME]).encode())
+            await self.send(self.admin_writer, framing.GRADE_END, framing.pack_fields(rows=len(rows), next=cursor or 0))
+        except Exception as e:
+            print(f"[ERROR] Sending grades to the admin failed: {e}")
+
+    async def send_grade_stats(self, args, previous=None):
+        """Send the admin the GRADESTATS of a student, or of the class and every student."""
+        try:
+            name = parse_name(args)
+            self.grades.flush()  # queued grades are counted
+            reply = format_stats(*await self.database.run(read_stats, name))
+        except ValueError as e:
+            reply = f"Error: {e}"
+        except Exception as e:
+            print(f"Database error in GRADESTATS: {e}")
+            reply = "Database error occurred. Please try again later."
+        if previous is not None:
+            await previous
+        try:
+            await self.send_text(self.admin_writer, reply)
+        except Exception as e:
+            print(f"[ERROR] Sending grade statistics to the admin failed: {e}")
+
+    def save_test_answers(self, payload, client_info):
+        """Append a client's answers to the answers matrix of the test, on the DB thread."""
+        try:
+            digest, file_name, answers, key, options = framing.unpack_test_responses(payload)
+        except (framing.FrameError, UnicodeDecodeError) as e:
+            print(f"[ERROR] Bad test answers from {client_info.name}: {e}")
+            return
+        if not key:
+            print(f"[ERROR] The answers of {client_info.name} to {file_name} have no questions")
+            return
+        if self.database is None:
+            print(f"[ERROR] No database, the answers of {client_info.name} to {file_name} were not saved")
+            return
+        self.database.run(add_answers, digest.hex(), file_name, client_info.name.upper(), time.time(), answers, key,
+                          options).add_done_callback(report_answers_write)
+        print(f"Answers of {client_info.name} to {file_name} queued for the database")
+
+    async def send_item_analysis(self, name, previous=None):
+        """Send the admin the ITEMANALYSIS of every test, or of the questions of one test file."""
+        try:
+            reply = await self.database.run(item_report, name or None)
+        except Exception as e:
+            print(f"Database error in ITEMANALYSIS: {e}")
+            reply = "Database error occurred. Please try again later."
+        if previous is not None:
+            await previous
+        try:
+            await self.send_text(self.admin_writer, reply)
+        except Exception as e:
+            print(f"[ERROR] Sending the item analysis to the admin failed: {e}")
+
+    async def save_grade(self, cmd, command, targets):
+        """
+        Store a GRADE command in the database, returns False if the target has no name.
+        "all" or "*" grades every client of targets, they are never stored as a name.
+        """
+        gr = cmd.replace("GRADE", "").strip()
+        client_name_or_ip = command.split(":")[1].strip()
+
+        if client_name_or_ip.casefold() in ("all", "*"):
+            for record in targets:
+                self.grades.add(record.name.upper(), gr)
+            print(f"New entries queued for the database: {len(targets)} clients - {gr}")
+            return True
+
+        # Check if the provided identifier is an IP (contains ".")
+        if "." in client_name_or_ip:
+            names = self.clients.names_for_ip(client_name_or_ip)
+            if names:
+                client_name = names[0]
+            else:
+                error_msg = f"Error: No name found for IP {client_name_or_ip}"
+                print(error_msg)
+                await self.wait_for_reports()
+                await self.send_text(self.admin_writer, error_msg)
+                return False
+        else:
+            client_name = client_name_or_ip
+
+        client_name = client_name.upper()
+
+        # Insert into the database, with the next batch of grades
+        self.grades.add(client_name, gr)
+        print(f"New entry queued for the database: {client_name} - {gr}")
+        return True
+
+    def get_target_ip(self, client_name_or_ip):
+        """
+        Return a list of client records matching the given client name or IP.
+        - If "all" or "*", return all clients.
+        - If name, return the client with that name (any case).
+        - If IP, return the clients connected from it.
+        """
+        return self.clients.resolve(client_name_or_ip)
+
+    async def send_last_file(self, client_name):
+        """Send the most recent screenshot of a client to the admin."""
+        try:
+            if not self.screenshots:
+                await self.send_text(self.admin_writer, "Error: No files found on server.")
+                print("there is no last file")
+                return
+            # only screenshots taken since the server started count
+            entry = self.screenshots.latest(client_name, since=self.start_time.replace(microsecond=0))
+            if entry is None:
+                client_name = client_name.upper()
+                await self.send_text(self.admin_writer, f"Error: No files found for client '{client_name}'.")
+                print(f"No files found for client: {client_name}")
+                return
+            last_file = entry.name
+
+            print("Sending the most recent screenshot file to the admin.")
+            data = await self.screenshots.read(entry)  # on a worker thread, slow storage does not stop the other clients
+
+            print(f"Sending file of size {len(data)} bytes with sha256 {entry.sha256}")
+            await self.send(self.admin_writer, framing.FILE, *framing.file_parts(last_file, data))
+            print(f"Sent file {last_file} to admin.")
+
+        except Exception as e:
+            print(f"[ERROR] Error sending last file: {e}")
+            try:
+                await self.send_text(self.admin_writer, "Error: Failed to send the last file.")
+            except Exception:
+                print("[ERROR] Failed to notify admin about file send failure.")
+
+    # --- Client connections ---
+
+    async def handle_client(self, reader, writer):
+        task = asyncio.current_task()
+        self.connection_tasks.add(task)
+        try:
+            print("client connection received")
+            client_name = await self.acceptor.accept(reader, writer, self.register_client)
+            if client_name:
+                await self.serve_client(reader, writer, client_name)
+        finally:
+            self.connection_tasks.discard(task)
+
+    async def register_client(self, writer, client_ip, client_name, codec=None):
+        """Accept or reject the name a new client sent, returns True if it was accepted."""
+        # Check if the client name is already connected
+        if not client_name or self.clients.name_in_use(client_name):
+            await self.send_text(writer, "error- Client name already in use")
+            print(f"Rejected duplicate client name: {client_name}")
+            return False
+        await self.send_text(writer, "OK")
+
+        self.add_client(writer, client_ip, client_name, codec)
+        print("refresh client list, new client connected")
+        await self.notify_admin_msg_clientlist("refresh client list, new client connected")
+        return True
+
+    async def serve_client(self, reader, writer, client_name):
+        try:
+            while writer in self.clients:
+                frame_type, payload = await framing.read_frame(reader)
+                await self.handle_client_frame(writer, frame_type, payload)
+        except asyncio.IncompleteReadError:
+            print(f"{client_name} disconnected")
+        except (framing.FrameError, ConnectionError, OSError) as e:
+            print(f"Client Connection error with {client_name}: {e}")
+        finally:
+            self.remove_client(writer)
+
+    def add_client(self, writer, client_ip, client_name, codec=None):
+        # Store the client connection with IP and name
+        sender = ClientSender(writer, client_name, client_ip, max_queued=self.max_send_queue, codec=codec)
+        self.clients.add(ClientRecord(writer, client_name, client_ip, sender, ScreenshotUpload()))
+        self.timers.schedule(writer, self.heartbeat_interval)
+        print(f"New client connected from {client_ip} with name: {client_name}")
+
+    def remove_client(self, writer):
+        """Remove a client from the registry and close its stream."""
+        record = self.clients.remove(writer)
+        if record is None:
+            return
+        self.timers.cancel(writer)
+        wall = self.wall_requests.pop(writer, None)
+        if wall is not None:
+            wall.fail(writer)
+        record.sender.close()
+        writer.close()
+
+    async def handle_client_frame(self, writer, frame_type, payload):
+        client_info = self.clients.get(writer)
+        if client_info is None:  # dropped (heartbeat, REMOVE, shutdown) with this frame already read
+            return
+        client_info.last_seen = time.monotonic()  # any frame shows the client is alive
+        if frame_type == framing.PONG:
+            return
+        if frame_type in (framing.PIC_BEGIN, framing.PIC_CHUNK, framing.PIC_END):  # client screenshot.
+            await self.handle_screenshot_frame(frame_type, payload, client_info)
+            return
+        if frame_type == framing.SCREEN_DELTA:  # live view of the client's screen
+            self.handle_screen_delta(payload, client_info)
+            return
+        if frame_type in (framing.FILE_HAVE, framing.FILE_NEED):  # answer to a file offer
+            offer = client_info.offer
+            if offer and offer[0] == bytes(payload) and not offer[1].done():
+                offer[1].set_result(frame_type)
+            return
+        if frame_type == framing.TEST_RESPONSES:  # every answer of a finished test, its TEST_ANSWER follows
+            self.save_test_answers(payload, client_info)
+            return
+        msg = payload.decode('latin-1', errors='ignore')
+
+        if msg.startswith("msg"):  # message from client to admin.
+            print("message from client to admin")
+            await self.notify_admin_msg_clientlist(msg)
+        elif "is answering a test" in msg:  # confirmation that the client is starting a test
+            print("sending answering a test")
+            await self.notify_admin_msg_clientlist(msg)
+        elif msg.startswith("TEST_ANSWER"):  # sending the client's test grade to the admin
+            print("sending test answers over second socket")
+            await self.send_text(self.admin_test_writer, msg)
+        elif msg.startswith("shutting down"):  # client shutting down
+            client_name_to_remove = msg.split("-")[1].strip()
+            record = self.clients.find_name(client_name_to_remove)
+            if record is None:
+                print(f"Error: Client {client_name_to_remove} not found in mappings.")
+                return
+            self.remove_client(record.writer)
+            print(f"Client {client_name_to_remove} removed and connection closed.")
+
+            # Notify the admin that the client disconnected
+            await self.notify_admin_msg_clientlist(f"Client {client_name_to_remove} has been disconnected.")
+        else:
+            print(f"Unknown message from {client_info.name}: {msg[:50]}")
+
+    # --- Heartbeat ---
+
+    async def run_heartbeat(self):
+        """
+        Every tick look at the clients whose check is due: PING the ones that were
+        quiet for heartbeat_interval, disconnect the ones quiet for idle_timeout
+        and tell the admin about all of them in one message.
+        """
+        while True:
+            await asyncio.sleep(self.timers.tick)
+            now = time.monotonic()
+            expired = []
+            for writer in self.timers.advance():
+                record = self.clients.get(writer)
+                if record is None:
+                    continue
+                idle = now - record.last_seen
+                if idle >= self.idle_timeout:
+                    expired.append(record)
+                elif idle >= self.heartbeat_interval:
+                    ping = record.sender.send_frame(framing.PING)
+                    ping.add_done_callback(ignore_result)  # a dead client is caught by its deadline
+                    self.timers.schedule(writer, min(self.heartbeat_interval, self.idle_timeout - idle))
+                else:
+                    self.timers.schedule(writer, self.heartbeat_interval - idle)
+            if expired:
+                await self.expire_clients(expired)
+
+    async def run_compactor(self):
+        """Apply the screenshot retention policy and transcode old screenshots every compact_interval."""
+        while True:
+            try:
+                removed, transcoded = await self.screenshots.compact()
+                if removed or transcoded:
+                    print(f"screenshot store: removed {removed}, transcoded {transcoded}")
+            except Exception as e:
+                print(f"[ERROR] Screenshot compaction failed: {e}")
+            await asyncio.sleep(self.compact_interval)
+
+    async def expire_clients(self, records):
+        for record in records:
+            self.remove_client(record.writer)
+        names = ", ".join(record.name for record in records)
+        print(f"Clients timed out: {names}")
+        await self.notify_admin_msg_clientlist(f"Client {names} has been disconnected.")
+
+    async def handle_screenshot_frame(self, frame_type, payload, client_info):
+        """Drive the client's screenshot upload state machine with one PIC_* frame."""
+        upload = client_info.upload
+        try:
+            if frame_type == framing.PIC_BEGIN:
+                fields = framing.unpack_fields(payload)
+                upload.begin(int(fields["size"]), fields.get("format", "png"))
+                print(f"receiving screenshot from {client_info.name}, {upload.expected} bytes")
+            elif frame_type == framing.PIC_CHUNK:
+                upload.feed(payload)
+            else:
+                extension = upload.extension
+                data = upload.finish()
+                wall = self.wall_requests.pop(client_info.writer, None)
+                if wall is not None:
+                    wall.deliver(client_info.writer, data)
+                    return
+                await self.handle_client_screenshot(data, client_info, extension)
+        except (framing.FrameError, KeyError, ValueError) as e:
+            print(f"[ERROR] Bad screenshot upload from {client_info.name}: {e}")
+            upload.reset()
+            await self.notify_admin_msg_clientlist("Error: SCREENSHOT SAVING FAILED")
+
+    async def handle_client_screenshot(self, data, client_info, extension="png"):
+        """Save a screenshot received from a client with their name in the filename."""
+        print("received client screenshot", len(data))
+
+        try:
+            # hashed and written on worker threads so the event loop keeps serving the other connections
+            entry = await self.screenshots.save(client_info.name, data, extension)
+
+            print(f"Screenshot saved as {entry.path}")
+            await self.notify_admin_msg_clientlist(f"SCREENSHOT SAVED AS {entry.name}")
+
+        except Exception as e:
+            print(f"[ERROR] Error saving screenshot: {e}")
+            await self.notify_admin_msg_clientlist("Error: SCREENSHOT SAVING FAILED")
+
+
+    # --- Thumbnail wall ---
+
+    async def send_wall(self, args, previous=None):
+        """Ask every client for a small screenshot and send the admin one mosaic of all of them."""
+        if previous is not None:
+            await previous  # replies go out in command order, and one wall runs at a time
+        error = data = None
+        try:
+            width, height = thumbnail_wall.parse_size(args)
+            records = list(self.clients)
+            if records:
+                data, file_name = await self.make_wall(records, width, height)
+            else:
+                error = "Error: No clients connected."
+        except ValueError as e:
+            error = f"Error: {e}"
+        except Exception as e:
+            print(f"[ERROR] Making the wall failed: {e}")
+            error = f"Error: The wall could not be made: {e}"
+        try:
+            if error is not None:
+                await self.send_text(self.admin_writer, error)
+            else:
+                await self.send(self.admin_writer, framing.FILE, *framing.file_parts(file_name, data))
+        except Exception as e:
+            print(f"[ERROR] Sending the wall to the admin failed: {e}")
+
+    async def make_wall(self, records, width, height):
+        """(JPEG of the mosaic, file name): a small screenshot of each of records, asked for at once."""
+        started = time.perf_counter()
+        columns, rows, thumb_width, thumb_height = thumbnail_wall.layout(len(records), width, height)
+        request = thumbnail_wall.WallRequest(records, (thumb_width, thumb_height))
+        frame = framing.EncodedFrame(framing.TEXT, f"SCREENSHOT {thumbnail_wall.capture_spec(thumb_width)}".encode())
+        for record in records:
+            self.wall_requests[record.writer] = request
+            request.asked(record.writer, record.sender.send(*frame.encode(record.sender.codec)))
+
+        shots = await request.collect(self.wall_timeout)
+        answered = sum(image is not None for _, image in shots)
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(None, thumbnail_wall.compose, shots, columns, rows, (thumb_width, thumb_height))
+        file_name = f"wall_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.jpg"
+        print(f"WALL of {answered}/{len(records)} clients, {len(data)} bytes in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return data, file_name
+
+    # --- Live view ---
+
+    def handle_screen_delta(self, payload, client_info):
+        """Remember a delta of the client's screen and pass it on to the admin."""
+        screen = client_info.screen
+        if screen is None:
+            screen = client_info.screen = TileHistory()
+        try:
+            screen.apply(payload)
+        except ValueError as e:
+            print(f"[ERROR] Bad screen delta from {client_info.name}: {e}")
+            return
+        if screen.behind:
+            # the admin missed deltas: send every delta that still shows on the screen
+            screen.behind = False
+            self.relay_screen(client_info, screen.replay())
+        else:
+            self.relay_screen(client_info, [payload])
+
+    def relay_screen(self, record, deltas):
+        """
+        Queue deltas on the admin's msg socket without waiting for it: a live view
+        must not hold up the client's connection. When the admin is too far
+        behind the deltas are skipped and replayed from the history later.
+        """
+        writer = self.admin_msg_clientlist_writer
+        if writer is None or writer.is_closing() or writer.transport.get_write_buffer_size() > self.max_monitor_backlog:
+            record.screen.behind = True
+            return
+        for delta in deltas:
+            framing.write_frame(writer, framing.SCREEN_DELTA, *framing.file_parts(record.name, delta))
+
+
+def ignore_result(future):
+    # retrieve the outcome of a fire-and-forget send so asyncio does not log it
+    if not future.cancelled():
+        future.exception()
+
@@ -0,0 +1,95 @@
+# benchmark: latency of a command / file sent to "ALL" as the number of clients grows
+# usage: python -m benchmarks.bench_broadcast [rounds]
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import framing
+from benchmarks.common import EngineHarness, receive_file
+
+
+CLIENT_COUNTS = [1, 5, 10, 20, 40, 80]
+FILE_SIZE = 1024 * 1024
+
+
+async def measure(harness, clients, rounds):
+    """Send MSG to ALL and time until every client and the admin got it."""
+    samples = []
+    for i in range(rounds):
+        command = f"MSG ping {i}: ALL"
+        start = time.perf_counter()
+        await harness.admin_command(command)
+        await asyncio.gather(*(framing.read_frame(reader) for reader, _ in clients))
+        await framing.read_frame(harness.admin_reader)  # "sent MSG ... to: ..." reply
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def read_slowly(reader, writer, delay):
+    """A client on bad Wi-Fi: reads the file stream 64 KB at a time with a pause in between."""
+    frame_type, payload = await framing.read_frame(reader)  # FILE_OFFER, the client never has the file
+    framing.write_frame(writer, framing.FILE_NEED, payload[:framing.DIGEST_SIZE])
+    await writer.drain()
+    while True:
+        frame_type, _, length = framing.unpack_header(await reader.readexactly(framing.HEADER_SIZE))
+        while length:
+            length -= len(await reader.read(min(length, 64 * 1024)))
+            await asyncio.sleep(delay)
+        if frame_type == framing.FILE_END:
+            return
+
+
+async def send_file(harness, clients, slow_client=None):
+    """SENDFILE to ALL, returns (time until the fast clients got it, time until the admin's report)."""
+    data = os.urandom(FILE_SIZE)
+    start = time.perf_counter()
+    slow = asyncio.create_task(read_slowly(*slow_client, 0.01)) if slow_client else None
+    receiving = asyncio.gather(*(receive_file(reader, writer) for reader, writer in clients))
+    await harness.admin_send_file("ALL", "bench.png", data)
+    await receiving
+    fast_done = time.perf_counter() - start
+    await framing.read_frame(harness.admin_reader)
+    if slow:
+        await slow
+    return fast_done, time.perf_counter() - start
+
+
+async def main(rounds):
+    harness = EngineHarness()
+    await harness.start()
+    clients = []
+    results = []
+    files = []
+    try:
+        for count in CLIENT_COUNTS:
+            while len(clients) < count:
+                clients.append(await harness.connect_client(f"bench{len(clients)}"))
+            samples = await measure(harness, clients, rounds)
+            results.append((count, statistics.median(samples), max(samples)))
+            if count in (1, 10, 40):
+                files.append((count, *(await send_file(harness, clients))))
+
+        # one student on a slow link must not hold up the rest of the class
+        slow_client = await harness.connect_client("slow")
+        fast, total = await send_file(harness, clients, slow_client)
+        slow_client[1].close()
+    finally:
+        for _, writer in clients:
+            writer.close()
+        await harness.stop()
+
+    print(f"MSG to ALL\n{'clients':>8} {'median ms':>10} {'max ms':>10}")
+    for count, median, worst in results:
+        print(f"{count:>8} {median * 1000:>10.2f} {worst * 1000:>10.2f}")
+    print(f"SENDFILE of {FILE_SIZE // 1024} KB to ALL\n{'clients':>8} {'ms':>10}")
+    for count, _, total_time in files:
+        print(f"{count:>8} {total_time * 1000:>10.2f}")
+    print(f"{len(clients)} clients + 1 slow client: fast clients done after {fast * 1000:.0f} ms, "
+          f"slow client / admin report after {total * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20))
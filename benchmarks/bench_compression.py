@@ -0,0 +1,104 @@
+# benchmark: what negotiated compression saves on the wire for typical classroom payloads
+# usage: python -m benchmarks.bench_compression [clients]
+
+import asyncio
+import glob
+import random
+import sys
+import time
+
+import framing
+from benchmarks.common import EngineHarness
+
+WIFI_MBIT = 20  # a shared classroom access point, for the estimated transfer time
+
+
+def text_handout(size):
+    """Text made of random words of the repository's test files, not a repeated file (that compresses far too well)."""
+    words = " ".join(open(path, encoding="utf-8", errors="ignore").read() for path in sorted(glob.glob("*.txt"))).split()
+    rng = random.Random(1)
+    lines = []
+    length = 0
+    while length < size:
+        line = " ".join(rng.choice(words) for _ in range(rng.randint(4, 14)))
+        lines.append(line)
+        length += len(line.encode()) + 1
+    return "\n".join(lines).encode()[:size]
+
+
+def payloads():
+    """(label, frame type, payload) of the things the server sends most."""
+    handout = text_handout(64 * 1024)
+    grades = "\n".join(f"ID: {i}, Name: Student{i}, Grade: {random.randint(40, 100)}" for i in range(2000)).encode()
+    client_list = ", ".join(f"Student{i} (10.0.{i // 250}.{i % 250})" for i in range(500)).encode()
+    yield "MSG to a class", framing.TEXT, b"MSG please open the test now and answer all questions"
+    yield "text handout 64 KB", framing.FILE_CHUNK, handout
+    yield "GETGRADES 2000 rows", framing.TEXT, grades
+    yield "CLIENTLIST 500", framing.TEXT, client_list
+    for path in ("MTA.png", "code.docx"):
+        with open(path, "rb") as f:
+            yield path, framing.FILE_CHUNK, f.read(framing.CHUNK_SIZE)
+
+
+def payload_table():
+    lines = [f"{'payload':<20} {'bytes':>8} {'zlib':>8} {'ms':>6} {'lzma':>8} {'ms':>6}"]
+    for label, frame_type, payload in payloads():
+        row = f"{label:<20} {len(payload):>8}"
+        for codec in ("zlib", "lzma"):
+            start = time.perf_counter()
+            flags, parts = framing.compress(frame_type, (payload,), codec)
+            elapsed = (time.perf_counter() - start) * 1000
+            size = sum(len(part) for part in parts)
+            row += f" {size if flags else 'as is':>8} {elapsed:>6.2f}"
+        lines.append(row)
+    return lines
+
+
+async def receive_counting(reader, writer):
+    """Receive a SENDFILE like client.py, returns the bytes that crossed the network."""
+    wire = 0
+    while True:
+        frame_type, flags, payload = await framing.read_raw_frame(reader)
+        wire += framing.HEADER_SIZE + len(payload)
+        framing.decompress(flags, payload)
+        if frame_type == framing.FILE_OFFER:
+            framing.write_frame(writer, framing.FILE_NEED, payload[:framing.DIGEST_SIZE])
+            await writer.drain()
+        elif frame_type == framing.FILE_END:
+            return wire
+
+
+async def send_handout(codec, clients, data):
+    harness = EngineHarness(admin_codec=codec)
+    await harness.start()
+    connections = []
+    try:
+        for i in range(clients):
+            connections.append(await harness.connect_client(f"zip{i}", codec))
+        start = time.perf_counter()
+        receiving = asyncio.gather(*(receive_counting(reader, writer) for reader, writer in connections))
+        await harness.admin_send_file("ALL", "handout.txt", data)
+        wire = sum(await receiving)
+        elapsed = time.perf_counter() - start
+        await framing.read_frame(harness.admin_reader)
+    finally:
+        for _, writer in connections:
+            writer.close()
+        await harness.stop()
+    return wire, elapsed
+
+
+async def main(clients):
+    lines = payload_table()
+    data = text_handout(2 * 1024 * 1024)
+    lines.append(f"SENDFILE of a {len(data) // 1024} KB text handout to {clients} clients")
+    for codec in (None, "zlib", "lzma"):
+        wire, elapsed = await send_handout(codec, clients, data)
+        airtime = wire * 8 / (WIFI_MBIT * 1e6)
+        lines.append(f"  {codec or 'none':<5} {wire / 1e6:>7.1f} MB to the clients, {elapsed * 1000:>6.0f} ms on localhost, "
+                     f"~{airtime:.1f} s on {WIFI_MBIT} Mbit/s Wi-Fi")
+    print("\n".join(lines))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 40))
@@ -0,0 +1,61 @@
+# benchmark: a whole class pressing "Start Client" at the same moment
+# usage: python -m benchmarks.bench_connect_burst [clients]
+
+import asyncio
+import multiprocessing
+import sys
+import threading
+import time
+
+import framing
+from acceptor import AcceptorMetrics
+from benchmarks.common import EngineHarness, connect_blocking_client
+
+
+def burst_process(port, clients, results):
+    """Connect all clients at once from threads, like separate student machines would."""
+    barrier = threading.Barrier(clients)
+    latencies = []
+    socks = []
+    lock = threading.Lock()
+
+    def connect(i):
+        barrier.wait()
+        start = time.perf_counter()
+        sock = connect_blocking_client(port, f"burst{i}")
+        with lock:
+            latencies.append(time.perf_counter() - start)
+            socks.append(sock)
+
+    threads = [threading.Thread(target=connect, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put(latencies)
+    for sock in socks:
+        sock.close()
+
+
+async def main(clients):
+    harness = EngineHarness()
+    await harness.start()
+
+    results = multiprocessing.Queue()
+    burst = multiprocessing.Process(target=burst_process, args=(harness.ports["client"], clients, results))
+    burst.start()
+    latencies = await asyncio.get_running_loop().run_in_executor(None, results.get)
+    burst.join()
+
+    await harness.admin_command("ACCEPTSTATS")
+    _, server_stats = await framing.read_frame(harness.admin_reader)
+    await harness.stop()
+
+    print(f"{clients} simultaneous connects (client side, connect -> name accepted):")
+    print(f"  {AcceptorMetrics.percentiles(latencies)}")
+    print("server acceptor metrics:")
+    print("  " + server_stats.decode().replace("\n", "\n  "))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100))
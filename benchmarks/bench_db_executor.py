@@ -0,0 +1,127 @@
+# benchmark: event loop latency while a query reads a big grades table, on the loop against on the DB thread
+# usage: python -m benchmarks.bench_db_executor [grades]
+
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+import framing
+from benchmarks.common import EngineHarness
+from database import Base, Student, make_engine
+from db_executor import DatabaseExecutor
+from grade_query import MAX_PAGE_SIZE
+
+QUERIES = 5
+TICK = 0.001  # seconds between the probes of the loop
+MESSAGE_GAP = 0.002  # seconds between a student's messages to the admin
+
+
+def list_grades(session):
+    """GETGRADES before pages: the whole table as one reply."""
+    try:
+        students = session.query(Student.id, Student.name, Student.grade).all()
+    finally:
+        session.rollback()
+    return "\n".join([f"ID: {student_id}, Name: {name}, Grade: {grade}" for student_id, name, grade in students])
+
+
+async def probe(lags, stop):
+    """How late the loop wakes up a task that sleeps TICK, the delay every socket sees."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(TICK)
+        lags.append(loop.time() - start - TICK)
+
+
+async def loop_lag(session, database):
+    lags, stop = [], asyncio.Event()
+    prober = asyncio.create_task(probe(lags, stop))
+    await asyncio.sleep(0.05)
+    start = time.perf_counter()
+    for _ in range(QUERIES):
+        if database is None:
+            list_grades(session)  # the query on the event loop
+        else:
+            await database.run(list_grades)
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await prober
+    return elapsed / QUERIES, lags
+
+
+async def message_latency(engine, seconds_of_grades):
+    """A student's messages reach the admin's msg socket while the admin reads the largest page of grades QUERIES times."""
+    harness = EngineHarness(session=sessionmaker(bind=engine)())
+    await harness.start()
+    reader, writer = await harness.connect_client("chatty")
+    latencies = []
+    sent = {}
+
+    async def talk():
+        for number in range(int(seconds_of_grades / MESSAGE_GAP)):
+            sent[number] = time.perf_counter()
+            framing.write_frame(writer, framing.TEXT, f"msg {number}".encode())
+            await writer.drain()
+            await asyncio.sleep(MESSAGE_GAP)
+
+    async def listen(count):
+        while len(latencies) < count:
+            _, payload = await framing.read_frame(harness.msg_reader)
+            latencies.append(time.perf_counter() - sent[int(bytes(payload).split()[1])])
+
+    count = int(seconds_of_grades / MESSAGE_GAP)
+    listener = asyncio.create_task(listen(count))
+    talker = asyncio.create_task(talk())
+    for _ in range(QUERIES):
+        await harness.admin_command(f"GETGRADES limit={MAX_PAGE_SIZE}")
+        while (await framing.read_frame(harness.admin_reader))[0] != framing.GRADE_END:
+            pass
+    await talker
+    await listener
+    writer.close()
+    await harness.stop()
+    return latencies
+
+
+def describe(samples):
+    samples = sorted(samples)
+    return (f"median {statistics.median(samples) * 1000:6.2f} ms, p99 {samples[int(len(samples) * 0.99)] * 1000:7.2f} ms, "
+            f"max {samples[-1] * 1000:7.2f} ms")
+
+
+async def main(grades):
+    lines = [f"the whole table of {grades} grades read {QUERIES} times"]
+    with tempfile.TemporaryDirectory() as directory:
+        engine = make_engine(f"sqlite:///{os.path.join(directory, 'grades.db')}")
+        Base.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(insert(Student), [{"name": f"STUDENT{i % 40}", "grade": i % 101, "date_time": datetime(2026, 3, 1)}
+                                                 for i in range(grades)])
+
+        session = sessionmaker(bind=engine)()
+        query, lags = await loop_lag(session, None)
+        lines.append(f"  on the event loop:  {query * 1000:6.0f} ms per query, loop lag {describe(lags)}")
+        database = DatabaseExecutor(sessionmaker(bind=engine)())
+        query, lags = await loop_lag(None, database)
+        lines.append(f"  on the DB thread:   {query * 1000:6.0f} ms per query, loop lag {describe(lags)}")
+        database.close()
+        session.close()
+
+        latencies = await message_latency(engine, QUERIES * query)
+        lines.append(f"  server with the DB thread, student -> admin messages every {MESSAGE_GAP * 1000:.0f} ms during "
+                     f"GETGRADES pages of {MAX_PAGE_SIZE}: {describe(latencies)}")
+        engine.dispose()
+    print("\n".join(lines))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000))
@@ -0,0 +1,63 @@
+# benchmark: handing out the same file to class after class, first upload vs file cache hits
+# usage: python -m benchmarks.bench_file_cache [megabytes] [clients]
+
+import asyncio
+import os
+import sys
+import time
+
+import framing
+from benchmarks.common import EngineHarness, receive_file
+
+
+async def hand_out(harness, students, data):
+    """Send the file to all students, returns (admin busy seconds, total seconds, uploaded)."""
+    start = time.perf_counter()
+    receiving = asyncio.gather(*(receive_file(reader, writer, cache) for reader, writer, cache in students))
+    uploaded = await harness.admin_send_file("ALL", "painted_image.png", data)
+    admin_done = time.perf_counter() - start
+    received = await receiving
+    await framing.read_frame(harness.admin_reader)  # the delivery report
+    assert all(content == data for _, content in received)
+    return admin_done, time.perf_counter() - start, uploaded
+
+
+async def connect_class(harness, name, clients):
+    students = []
+    for i in range(clients):
+        reader, writer = await harness.connect_client(f"{name}{i}")
+        students.append((reader, writer, {}))  # every student has its own (empty) file cache
+    return students
+
+
+async def main(megabytes, clients):
+    harness = EngineHarness()
+    await harness.start()
+    data = os.urandom(megabytes * 1024 * 1024)
+
+    report = [f"{megabytes} MB handout to {clients} clients"]
+    first_class = await connect_class(harness, "first", clients)
+    for attempt, students in (("first class", first_class), ("resent to the first class", first_class)):
+        admin_done, total, uploaded = await hand_out(harness, students, data)
+        report.append(f"  {attempt}: uploaded {uploaded}, admin busy {admin_done * 1000:.1f} ms, "
+                      f"all clients done {total * 1000:.0f} ms")
+    for _, writer, _ in first_class:
+        writer.close()
+        await writer.wait_closed()
+    await asyncio.sleep(0.2)  # let the server drop the first class
+
+    second_class = await connect_class(harness, "second", clients)
+    admin_done, total, uploaded = await hand_out(harness, second_class, data)
+    report.append(f"  second class: uploaded {uploaded}, admin busy {admin_done * 1000:.1f} ms, "
+                  f"all clients done {total * 1000:.0f} ms")
+    report.append(f"  server cache: {harness.engine.file_cache.summary()}")
+
+    for _, writer, _ in second_class:
+        writer.close()
+    await harness.stop()
+    print("\n".join(report))
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    asyncio.run(main(*(args + [20, 5][len(args):])))
@@ -0,0 +1,53 @@
+# benchmark: SENDFILE relay, time to first byte and completion for a large handout
+# usage: python -m benchmarks.bench_file_relay [megabytes] [clients]
+
+import asyncio
+import os
+import sys
+import time
+
+import framing
+from benchmarks.common import EngineHarness
+
+
+async def receive(reader, writer, start, marks):
+    """Read the streamed file and note when the first chunk and the end arrived."""
+    _, offer = await framing.read_frame(reader)
+    framing.write_frame(writer, framing.FILE_NEED, offer[:framing.DIGEST_SIZE])
+    await writer.drain()
+    while True:
+        frame_type, _ = await framing.read_frame(reader)
+        if frame_type == framing.FILE_CHUNK and "first" not in marks:
+            marks["first"] = time.perf_counter() - start
+        if frame_type == framing.FILE_END:
+            marks["done"] = time.perf_counter() - start
+            return
+
+
+async def main(megabytes, clients):
+    harness = EngineHarness()
+    await harness.start()
+    students = [await harness.connect_client(f"student{i}") for i in range(clients)]
+    data = os.urandom(megabytes * 1024 * 1024)
+
+    marks = [{} for _ in students]
+    start = time.perf_counter()
+    receiving = asyncio.gather(*(receive(reader, writer, start, mark) for (reader, writer), mark in zip(students, marks)))
+    await harness.admin_send_file("ALL", "handout.png", data)
+    uploaded = time.perf_counter() - start
+    await receiving
+    await framing.read_frame(harness.admin_reader)
+
+    for _, writer in students:
+        writer.close()
+    await harness.stop()
+
+    print(f"{megabytes} MB to {clients} clients")
+    print(f"  admin upload finished after {uploaded * 1000:.0f} ms")
+    print(f"  first chunk at a client after {min(m['first'] for m in marks) * 1000:.1f} ms")
+    print(f"  all clients complete after {max(m['done'] for m in marks) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    asyncio.run(main(*(args + [20, 5][len(args):])))
@@ -0,0 +1,104 @@
+# benchmark: GETGRADES on a big grades table, the whole table against pages, before and after the indexes
+# usage: python -m benchmarks.bench_grade_queries [grades]
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import sessionmaker
+
+from database import Student, make_engine, migrate
+from grade_query import GradeQuery, format_rows, read_page
+
+REPEAT = 5
+STUDENTS = 400
+GRADES_PER_DAY = 2000
+
+
+def list_grades(session):
+    """GETGRADES before pages: every row of the table formatted into one reply."""
+    try:
+        students = session.query(Student.id, Student.name, Student.grade).all()
+    finally:
+        session.rollback()
+    return "\n".join([f"ID: {student_id}, Name: {name}, Grade: {grade}" for student_id, name, grade in students])
+
+
+def fill(engine, grades):
+    first_day = datetime(2025, 9, 1)
+    with engine.begin() as connection:
+        connection.execute(insert(Student), [{"name": f"STUDENT{i % STUDENTS}", "grade": i % 101,
+                                              "date_time": first_day + timedelta(seconds=i * 86400 // GRADES_PER_DAY)}
+                                             for i in range(grades)])
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        result = function(*args)
+    return (time.perf_counter() - start) / REPEAT, result
+
+
+def page(session, args):
+    rows, _ = read_page(session, GradeQuery.parse(args))
+    return format_rows(rows)
+
+
+def plan(engine, args):
+    statement = GradeQuery.parse(args).statement()
+    sql = str(statement.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True}))
+    with engine.connect() as connection:
+        return "; ".join(row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}"))
+
+
+def main(grades):
+    queries = [
+        ("newest page", ""),
+        ("page 100 back", f"before={grades - 100 * 200}"),
+        ("one student", "name=student7"),
+        ("one week", "from=2025-10-06 to=2025-10-12"),
+        ("student and week", "name=student7 from=2025-10-06 to=2025-10-12"),
+    ]
+    lines = [f"GETGRADES on {grades} grades of {STUDENTS} students, {GRADES_PER_DAY} a day, {REPEAT} runs each"]
+    with tempfile.TemporaryDirectory() as directory:
+        engine = make_engine(f"sqlite:///{os.path.join(directory, 'grades.db')}")
+        # a students.db of an older version: the table without the indexes and user_version 0
+        Student.__table__.create(engine)
+        with engine.begin() as connection:
+            for index in Student.__table__.indexes:
+                connection.exec_driver_sql(f"DROP INDEX {index.name}")
+        fill(engine, grades)
+        session = sessionmaker(bind=engine)()
+
+        elapsed, reply = timed(list_grades, session)
+        lines.append(f"  whole table (before): {elapsed * 1000:8.1f} ms, reply of {len(reply) / 1e6:.1f} MB")
+        results = {}
+        for label, args in queries:
+            results[label] = [timed(page, session, args)[0]]
+        plans = {label: [plan(engine, args)] for label, args in queries[2:]}
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            migrate(engine)
+        for label, args in queries:
+            results[label].append(timed(page, session, args)[0])
+            if label in plans:
+                plans[label].append(plan(engine, args))
+
+        lines.append(f"  {'page of 200':<18} {'no indexes':>11} {'indexes':>11}")
+        for label, (before, after) in results.items():
+            lines.append(f"  {label:<18} {before * 1000:8.2f} ms {after * 1000:8.2f} ms")
+        for label, (before, after) in plans.items():
+            lines.append(f"  plan of {label}: {before}  ->  {after}")
+        session.close()
+        engine.dispose()
+    print("\n".join(lines))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500000)
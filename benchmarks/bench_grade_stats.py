@@ -0,0 +1,99 @@
+# benchmark: GRADESTATS from the summary tables against recomputing from the grades, and the cost of keeping them
+# usage: python -m benchmarks.bench_grade_stats [grades]
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+from database import Student, make_engine, migrate
+from grade_stats import CLASS, Totals, as_number, format_stats, read_stats, rebuild
+from grade_writer import insert_grades
+
+STUDENTS = 400
+BATCH = 100  # grades of a GradeWriter transaction
+REPEAT = 5
+
+
+def grade_rows(count, start=0):
+    first_day = datetime(2025, 9, 1)
+    return [{"name": f"STUDENT{i % STUDENTS}", "grade": (i * 37) % 101, "date_time": first_day + timedelta(minutes=i)}
+            for i in range(start, start + count)]
+
+
+def recompute(session):
+    """GRADESTATS without the summary tables: every grade read and summed, one row at a time."""
+    totals = {}
+    try:
+        for name, grade, date_time in session.execute(Student.__table__.select()
+                                                      .with_only_columns(Student.name, Student.grade, Student.date_time)):
+            grade = as_number(grade)
+            if grade is None:
+                continue
+            for key in (name, CLASS):
+                if key not in totals:
+                    totals[key] = Totals()
+                totals[key].add(grade, date_time)
+    finally:
+        session.rollback()
+    return totals
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        function(*args)
+    return (time.perf_counter() - start) / REPEAT
+
+
+def insert_rate(session, rows, with_stats):
+    start = time.perf_counter()
+    for first in range(0, len(rows), BATCH):
+        if with_stats:
+            insert_grades(session, rows[first:first + BATCH])
+        else:
+            session.execute(insert(Student), rows[first:first + BATCH])
+            session.commit()
+    return len(rows) / (time.perf_counter() - start)
+
+
+def main(grades):
+    lines = [f"{STUDENTS} students, {REPEAT} runs each"]
+    with tempfile.TemporaryDirectory() as directory:
+        engine = make_engine(f"sqlite:///{os.path.join(directory, 'grades.db')}")
+        with contextlib.redirect_stdout(io.StringIO()):
+            migrate(engine)
+        session = sessionmaker(bind=engine)()
+
+        inserted = 0
+        for size in (10000, grades):
+            with engine.begin() as connection:
+                connection.execute(insert(Student), grade_rows(size - inserted, inserted))
+                start = time.perf_counter()
+                rebuild(connection)
+                vectorized = time.perf_counter() - start
+            inserted = size
+            lines.append(f"{size} grades:")
+            lines.append(f"  GRADESTATS class and students, summary tables: "
+                         f"{timed(lambda: format_stats(*read_stats(session))) * 1000:8.2f} ms")
+            lines.append(f"  GRADESTATS one student, summary tables:        "
+                         f"{timed(lambda: format_stats(*read_stats(session, 'STUDENT7'))) * 1000:8.2f} ms")
+            lines.append(f"  recomputed from every grade in Python:         {timed(recompute, session) * 1000:8.2f} ms")
+            lines.append(f"  rebuild of the tables with NumPy:              {vectorized * 1000:8.2f} ms")
+
+        rows = grade_rows(20000, inserted)
+        lines.append(f"inserts in transactions of {BATCH}: {insert_rate(session, rows[:10000], False):8.0f} grades/s without "
+                     f"the summary, {insert_rate(session, rows[10000:], True):8.0f} grades/s with it")
+        session.close()
+        engine.dispose()
+    print("\n".join(lines))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500000)
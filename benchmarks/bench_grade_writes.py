@@ -0,0 +1,93 @@
+# benchmark: grade inserts per second, commit per GRADE against the write-behind GradeWriter on a WAL database
+# usage: python -m benchmarks.bench_grade_writes [grades] [class size]
+
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+from database import PRAGMAS, Base, Student, make_engine
+from db_executor import DatabaseExecutor
+from grade_writer import GradeWriter
+
+GRADING_GAP = 0.005  # seconds between the admin's GRADE commands when a class is graded after a test
+
+
+def open_session(directory, name, echo, pragmas):
+    engine = make_engine(f"sqlite:///{os.path.join(directory, name)}", echo=echo, pragmas=pragmas)
+    Base.metadata.create_all(engine)
+    return engine, sessionmaker(bind=engine)()
+
+
+def commit_each(session, count):
+    """save_grade before: an ORM row and a commit per grade."""
+    for i in range(count):
+        session.add(Student(name=f"STUDENT{i % 40}", grade=i % 101))
+        session.commit()
+
+
+async def write_behind(database, count):
+    writer = GradeWriter(database)
+    for i in range(count):
+        writer.add(f"STUDENT{i % 40}", i % 101)
+    await writer.close()
+
+
+async def grade_class(session, database, size):
+    """The admin grades a class one GRADE command after the other, returns the time the event loop spent in the database."""
+    blocked = 0.0
+    batched = database is not None
+    writer = GradeWriter(database)
+    for i in range(size):
+        start = time.perf_counter()
+        if batched:
+            writer.add(f"STUDENT{i}", 90)
+        else:
+            session.add(Student(name=f"STUDENT{i}", grade=90))
+            session.commit()
+        blocked += time.perf_counter() - start
+        await asyncio.sleep(GRADING_GAP)
+    start = time.perf_counter()
+    written = writer.flush()
+    blocked += time.perf_counter() - start
+    await written  # on the DB thread, the loop was free meanwhile
+    return blocked, writer.batches
+
+
+async def main(count, size):
+    setups = (("before: echo, rollback journal", True, ()),
+              ("commit each, WAL", False, PRAGMAS),
+              ("GradeWriter, WAL", False, PRAGMAS))
+    lines = [f"{count} grades, then a class of {size} graded {GRADING_GAP * 1000:.0f} ms apart"]
+    with tempfile.TemporaryDirectory() as directory:
+        for number, (label, echo, pragmas) in enumerate(setups):
+            log = io.StringIO()
+            with contextlib.redirect_stdout(log):  # echo logs to the stdout of the time the engine is made
+                engine, session = open_session(directory, f"grades{number}.db", echo, pragmas)
+                database = DatabaseExecutor(session) if number == 2 else None
+                start = time.perf_counter()
+                if database is not None:
+                    await write_behind(database, count)
+                else:
+                    commit_each(session, count)
+                elapsed = time.perf_counter() - start
+                blocked, batches = await grade_class(session, database, size)
+            if database is not None:
+                database.close()
+            with engine.connect() as connection:
+                assert connection.exec_driver_sql("SELECT COUNT(*) FROM students").scalar() == count + size
+            lines.append(f"  {label:<32} {count / elapsed:>9.0f} grades/s, class: event loop blocked "
+                         f"{blocked * 1000:>6.1f} ms ({batches or size} transactions), "
+                         f"{len(log.getvalue()) / 1024:.0f} KB of SQL log")
+            session.close()
+            engine.dispose()
+    print("\n".join(lines))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000, int(sys.argv[2]) if len(sys.argv) > 2 else 40))
@@ -0,0 +1,101 @@
+# benchmark: heartbeat cost per tick and how fast dead clients are found
+# usage: python -m benchmarks.bench_heartbeat [clients]
+
+import asyncio
+import sys
+import time
+import timeit
+
+import framing
+from benchmarks.common import EngineHarness
+from client_registry import ClientRecord
+from timer_wheel import TimerWheel
+
+CLASS_SIZES = [1000, 10000, 100000]
+INTERVAL = 1.0
+TIMEOUT = 3.0
+
+
+def tick_cost(size):
+    """
+    One heartbeat tick (0.25 s, clients checked every 10 s): the wheel only looks at
+    the clients that are due, a scan compares last_seen of every client.
+    """
+    wheel = TimerWheel(tick=0.25)
+    records = [ClientRecord(object(), f"Student{i}", "10.0.0.1", None, None) for i in range(size)]
+    for i, record in enumerate(records):
+        wheel.schedule(record.writer, (i % 40) * 0.25 + 0.25)  # checks spread over 10 s
+    by_writer = {record.writer: record for record in records}
+
+    def wheel_tick():
+        now = time.monotonic()
+        for writer in wheel.advance():
+            record = by_writer[writer]
+            wheel.schedule(writer, 10.0 - (now - record.last_seen) % 10.0)
+
+    def full_scan():
+        now = time.monotonic()
+        return [record for record in records if now - record.last_seen >= 10.0]
+
+    wheel_us = min(timeit.repeat(wheel_tick, number=40, repeat=3)) / 40 * 1e6
+    scan_us = min(timeit.repeat(full_scan, number=40, repeat=3)) / 40 * 1e6
+    return wheel_us, scan_us
+
+
+async def answer_pings(reader, writer):
+    try:
+        while True:
+            frame_type, _ = await framing.read_frame(reader)
+            if frame_type == framing.PING:
+                framing.write_frame(writer, framing.PONG)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+
+
+async def detection(count):
+    """count clients answer pings, then a tenth of them go silent: time until the admin hears about them."""
+    harness = EngineHarness(heartbeat_interval=INTERVAL, idle_timeout=TIMEOUT)
+    await harness.start()
+    clients = []
+    responders = []
+    try:
+        for i in range(count):
+            clients.append(await harness.connect_client(f"beat{i}"))
+            responders.append(asyncio.create_task(answer_pings(*clients[-1])))
+        for task in responders[::10]:  # these clients hang without closing their connection
+            task.cancel()
+        silent = len(responders[::10])
+        start = time.perf_counter()
+        notices = 0
+        expired = 0
+        while expired < silent:
+            _, payload = await framing.read_frame(harness.msg_reader)
+            notices += 1
+            expired += payload.count(b",") + 1
+        detected = time.perf_counter() - start
+        remaining = len(harness.engine.clients)
+        await asyncio.sleep(2 * INTERVAL)  # the answering clients must survive their pings
+        survived = len(harness.engine.clients)
+    finally:
+        for task in responders:
+            task.cancel()
+        for _, writer in clients:
+            writer.close()
+        await harness.stop()
+    return silent, detected, notices, remaining, survived
+
+
+async def main(count):
+    lines = [f"tick cost\n{'clients':>8} {'wheel us':>9} {'full scan us':>13}"]
+    for size in CLASS_SIZES:
+        wheel_us, scan_us = tick_cost(size)
+        lines.append(f"{size:>8} {wheel_us:>9.1f} {scan_us:>13.1f}")
+    dead, detected, notices, remaining, survived = await detection(count)
+    lines.append(f"{count} clients, {dead} silent (PING after {INTERVAL:.0f} s, timeout {TIMEOUT:.0f} s): "
+                 f"all reported after {detected:.2f} s in {notices} admin message(s), "
+                 f"{remaining} clients left, {survived} still connected {2 * INTERVAL:.0f} s later")
+    print("\n".join(lines))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
@@ -0,0 +1,127 @@
+# benchmark: a semester of test answers, stored as answers matrices and analyzed with NumPy, against a row per answer
+# usage: python -m benchmarks.bench_item_analysis [tests] [students] [questions]
+
+import contextlib
+import hashlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+from database import make_engine, migrate
+from item_analysis import GROUP, add_answers, item_report
+
+OPTIONS = 4
+
+
+def semester(tests, students, questions):
+    """(test name, key, answers of every student) of a semester: able students and easy questions get more right."""
+    rng = random.Random(25)
+    ability = [rng.gauss(0, 1) for _ in range(students)]
+    for test in range(tests):
+        key = [rng.randint(1, OPTIONS) for _ in range(questions)]
+        ease = [rng.gauss(0.5, 1) for _ in range(questions)]
+        sheets = []
+        for student in range(students):
+            sheet = []
+            for question in range(questions):
+                if rng.random() < 1 / (1 + 2.718 ** -(ability[student] + ease[question])):
+                    sheet.append(key[question])
+                else:
+                    sheet.append(rng.choice([option for option in range(OPTIONS + 1) if option != key[question]]))
+            sheets.append(sheet)
+        yield f"test {test}.txt", key, sheets
+
+
+def row_per_answer_report(connection):
+    """Item analysis without the matrices: every answer is a row, summed up question by question in Python."""
+    tests = {}
+    for test, student, question, answer, right in connection.exec_driver_sql(
+            "SELECT test, student, question, answer, key FROM answers"):
+        sheets = tests.setdefault(test, {})
+        sheets.setdefault(student, {})[question] = (answer, answer == right)
+    lines = []
+    for test, sheets in tests.items():
+        scores = {student: sum(right for _, right in sheet.values()) for student, sheet in sheets.items()}
+        ranked = sorted(scores, key=scores.get)
+        group = max(1, round(len(ranked) * GROUP))
+        questions = len(next(iter(sheets.values())))
+        for question in range(questions):
+            right = sum(sheet[question][1] for sheet in sheets.values()) / len(sheets)
+            best = sum(sheets[student][question][1] for student in ranked[-group:]) / group
+            worst = sum(sheets[student][question][1] for student in ranked[:group]) / group
+            choices = [0] * (OPTIONS + 1)
+            for sheet in sheets.values():
+                choices[sheet[question][0]] += 1
+            lines.append(f"{test} {question} {right:.2f} {best - worst:+.2f} {choices}")
+    return "\n".join(lines)
+
+
+def main(tests, students, questions):
+    lines = [f"a semester of {tests} tests x {students} students x {questions} questions"]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "matrices.db")
+        engine = make_engine(f"sqlite:///{path}")
+        with contextlib.redirect_stdout(io.StringIO()):
+            migrate(engine)
+        session = sessionmaker(bind=engine)()
+
+        rows_path = os.path.join(directory, "rows.db")
+        rows_engine = make_engine(f"sqlite:///{rows_path}")
+        with rows_engine.begin() as connection:
+            connection.exec_driver_sql("CREATE TABLE answers (id INTEGER PRIMARY KEY, test TEXT, student TEXT, "
+                                       "question INTEGER, answer INTEGER, key INTEGER)")
+
+        submit = 0.0
+        for name, key, sheets in semester(tests, students, questions):
+            digest = hashlib.sha256(name.encode()).hexdigest()
+            for student, sheet in enumerate(sheets):
+                start = time.perf_counter()
+                add_answers(session, digest, name, f"STUDENT{student}", time.time(), bytes(sheet), bytes(key),
+                            bytes([OPTIONS] * questions))
+                submit += time.perf_counter() - start
+            with rows_engine.begin() as connection:
+                connection.exec_driver_sql("INSERT INTO answers (test, student, question, answer, key) VALUES (?, ?, ?, ?, ?)",
+                                           [(name, f"STUDENT{student}", question, answer, key[question])
+                                            for student, sheet in enumerate(sheets) for question, answer in enumerate(sheet)])
+        session.close()
+        engine.dispose()
+        rows_engine.dispose()
+        for engine_path in (path, rows_path):
+            with make_engine(f"sqlite:///{engine_path}").begin() as connection:
+                connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        lines.append(f"  a submission: {submit / (tests * students) * 1000:.2f} ms")
+        lines.append(f"  database: {os.path.getsize(path) / 1024:.0f} KB with the answers matrices, "
+                     f"{os.path.getsize(rows_path) / 1024:.0f} KB with a row per answer")
+
+        engine = make_engine(f"sqlite:///{path}")
+        session = sessionmaker(bind=engine)()
+        start = time.perf_counter()
+        report = item_report(session)
+        overview = time.perf_counter() - start
+        start = time.perf_counter()
+        for test in range(tests):
+            item_report(session, f"test {test}.txt")
+        every_question = time.perf_counter() - start
+        lines.append(f"  ITEMANALYSIS, a line for each of the {len(report.splitlines())} tests: {overview * 1000:8.1f} ms")
+        lines.append(f"  ITEMANALYSIS <test> of every test:          {every_question * 1000:8.1f} ms")
+        session.close()
+        engine.dispose()
+
+        rows_engine = make_engine(f"sqlite:///{rows_path}")
+        with rows_engine.connect() as connection:
+            start = time.perf_counter()
+            row_per_answer_report(connection)
+            lines.append(f"  every question from a row per answer, Python: {(time.perf_counter() - start) * 1000:6.1f} ms")
+        rows_engine.dispose()
+    print("\n".join(lines))
+
+
+if __name__ == "__main__":
+    arguments = [int(argument) for argument in sys.argv[1:4]]
+    main(*arguments + [60, 40, 25][len(arguments):])
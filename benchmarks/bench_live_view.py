@@ -0,0 +1,125 @@
+# benchmark: live view bytes and encode time, tile deltas against full screenshots, and the server relaying a class
+# usage: python -m benchmarks.bench_live_view [clients] [seconds]
+
+import asyncio
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+import framing
+import screen_capture
+import tile_delta
+from benchmarks.common import EngineHarness, sample_screen
+
+WIDTH, HEIGHT = 1920, 1080
+FRAMES = 20
+FPS = 5
+LAN_MBIT = 100  # the school's wired network, for how many students fit at FPS
+ENCODERS = ("png level=1", "jpeg quality=75", "png level=1 scale=0.5")
+
+
+def session(kind, frames=FRAMES):
+    """Consecutive screens of a student: nothing moving, typing into a document, scrolling a page."""
+    screen = np.asarray(sample_screen(WIDTH, HEIGHT)).copy()
+    rng = np.random.default_rng(1)
+    for frame in range(frames):
+        if kind == "typing":
+            line, column = 300 + 18 * (frame // 10), 400 + 12 * (frame % 10)
+            screen[line:line + 11, column:column + 12][rng.random((11, 12)) < 0.4] = 20
+        elif kind == "scrolling":
+            page = screen[200:900, 300:1300]
+            page[:-18] = page[18:].copy()
+            page[-18:] = 250
+            page[-14:-3][rng.random((11, 1000)) < 0.3] = 20
+        yield Image.fromarray(screen)
+
+
+def encode_table():
+    lines = [f"{WIDTH}x{HEIGHT}, {FRAMES} frames per session, after the first full frame",
+             f"{'session':<10} {'encoder':<22} {'full KB':>8} {'delta KB':>9} {'ms':>6} {'students at {} fps on {} Mbit/s'.format(FPS, LAN_MBIT):>34}"]
+    for kind in ("idle", "typing", "scrolling"):
+        for spec in ENCODERS:
+            encoder = screen_capture.Encoder.parse(spec)
+            tiles = tile_delta.TileEncoder()
+            sizes, times, full = [], [], 0
+            for number, image in enumerate(session(kind)):
+                start = time.perf_counter()
+                delta = tiles.encode(image, encoder)
+                elapsed = time.perf_counter() - start
+                if number == 0:
+                    full = len(encoder.encode(image))
+                    continue
+                sizes.append(len(delta) if delta is not None else 0)
+                times.append(elapsed)
+            per_second = (sum(sizes) / len(sizes)) * FPS
+            students = LAN_MBIT * 1e6 / 8 / per_second if per_second else float("inf")
+            full_students = LAN_MBIT * 1e6 / 8 / (full * FPS)
+            lines.append(f"{kind:<10} {spec:<22} {full / 1024:>8.0f} {sum(sizes) / len(sizes) / 1024:>9.1f} "
+                         f"{sum(times) / len(times) * 1000:>6.1f} {students:>18.0f} (full frames: {full_students:.1f})")
+    return lines
+
+
+async def stream(writer, deltas, interval):
+    for delta in deltas:
+        framing.write_frame(writer, framing.SCREEN_DELTA, delta)
+        await writer.drain()
+        await asyncio.sleep(interval)
+
+
+async def relay(clients, seconds):
+    """Every client streams a typing session at FPS, the admin rebuilds every screen from its msg socket."""
+    frames = int(seconds * FPS)
+    encoder = screen_capture.Encoder.parse("png level=1")
+    tiles = tile_delta.TileEncoder()
+    deltas = [delta for delta in (tiles.encode(image, encoder) for image in session("typing", frames)) if delta is not None]
+    expected = np.asarray(tiles.previous[:HEIGHT, :WIDTH])
+
+    harness = EngineHarness()
+    await harness.start()
+    connections = [await harness.connect_client(f"live{i}") for i in range(clients)]
+    canvases = {}
+    received = 0
+    last = deltas[-1]
+    finished = set()
+
+    async def admin_view():
+        # skipped deltas come back in a replay, so wait for every client's last delta rather than counting
+        nonlocal received
+        while len(finished) < clients:
+            frame_type, payload = await framing.read_frame(harness.msg_reader)
+            if frame_type == framing.SCREEN_DELTA:
+                name, delta = framing.unpack_file(payload)
+                canvases.setdefault(name, tile_delta.TileCanvas()).apply(delta)
+                received += 1
+                if delta == last:
+                    finished.add(name)
+
+    cpu, start = time.process_time(), time.perf_counter()
+    view = asyncio.create_task(admin_view())
+    await asyncio.gather(*(stream(writer, deltas, 1 / FPS) for _, writer in connections))
+    await asyncio.wait_for(view, 30)
+    elapsed, cpu = time.perf_counter() - start, time.process_time() - cpu
+    history = harness.engine.clients.find_name("live0").screen
+    kept = (len(history.deltas), history.replay_bytes())
+    for _, writer in connections:
+        writer.close()
+    await harness.stop()
+
+    rebuilt = sum(np.array_equal(np.asarray(canvas.image()), expected) for canvas in canvases.values())
+    return [f"relay: {clients} clients typing at {FPS} fps for {seconds} s, {clients * len(deltas)} deltas sent "
+            f"({sum(len(d) for d in deltas) * clients / 1e6:.1f} MB), {received} reached the admin (with replays) in {elapsed:.1f} s",
+            f"  CPU of server, clients and admin view together {cpu * 1000:.0f} ms, {cpu / received * 1e6:.0f} us per delta",
+            f"  admin rebuilt {rebuilt}/{clients} screens exactly, server history of one client: "
+            f"{kept[0]} deltas, {kept[1] / 1024:.0f} KB to replay"]
+
+
+async def main(clients, seconds):
+    lines = encode_table()
+    lines += await relay(clients, seconds)
+    print("\n".join(lines))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 30, float(sys.argv[2]) if len(sys.argv) > 2 else 4))
@@ -0,0 +1,69 @@
+# benchmark: a whole school on one server, broadcast latency with thousands of connections
+# usage: python -m benchmarks.bench_many_clients [clients]
+
+import asyncio
+import resource
+import statistics
+import sys
+import time
+
+import framing
+from async_server import new_event_loop, raise_open_file_limit
+from benchmarks.common import EngineHarness
+
+
+async def read_reports(harness):
+    """The admin's reply reader, delivery reports are not waited for by the benchmark."""
+    while True:
+        await framing.read_frame(harness.admin_reader)
+
+
+async def broadcast_round(harness, clients):
+    start = time.perf_counter()
+    await harness.admin_command("MSG hello: ALL")
+    await asyncio.gather(*(framing.read_frame(reader) for reader, _ in clients))
+    return time.perf_counter() - start
+
+
+async def main(count):
+    harness = EngineHarness()
+    harness.engine.max_send_queue = 1024 * 1024
+    await harness.start()
+    reports = asyncio.create_task(read_reports(harness))
+    report = [f"open file limit: {resource.getrlimit(resource.RLIMIT_NOFILE)[0]}"]
+
+    clients = []
+    start = time.perf_counter()
+    for i in range(count):
+        clients.append(await harness.connect_client(f"pupil{i}"))
+    report.append(f"{count} clients connected in {time.perf_counter() - start:.1f} s")
+
+    samples = [await broadcast_round(harness, clients) for _ in range(10)]
+    report.append(f"MSG to ALL: median {statistics.median(samples) * 1000:.0f} ms, max {max(samples) * 1000:.0f} ms")
+
+    # a client that stopped reading is sent far more than it takes in, it is disconnected
+    # once its send queue is full and the rest of the school does not wait for it
+    stuck_reader, stuck_writer = await harness.connect_client("stuck")
+    stuck_writer.transport.pause_reading()
+    text = "x" * (64 * 1024)
+    for _ in range(400):
+        await harness.admin_command(f"MSG {text}: stuck")
+    samples = [await broadcast_round(harness, clients) for _ in range(10)]
+    await asyncio.sleep(0.5)
+    dropped = harness.engine.clients.find_name("stuck") is None
+    report.append(f"MSG to ALL after 25 MB were sent to a stuck client: median {statistics.median(samples) * 1000:.0f} ms, "
+                  f"max {max(samples) * 1000:.0f} ms, stuck client disconnected: {dropped}")
+    report.append(f"peak memory: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024} MB")
+
+    reports.cancel()
+    for _, writer in clients:
+        writer.close()
+    stuck_writer.close()
+    await harness.stop()
+    print("\n".join(report))
+
+
+if __name__ == "__main__":
+    raise_open_file_limit()
+    with asyncio.Runner(loop_factory=new_event_loop) as runner:
+        runner.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
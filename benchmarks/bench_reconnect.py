@@ -0,0 +1,98 @@
+# benchmark: a class reconnecting at once after its connections dropped, full handshakes vs resumed TLS sessions
+# usage: python -m benchmarks.bench_reconnect [clients] [rounds]
+
+import asyncio
+import multiprocessing
+import sys
+import threading
+import time
+
+import framing
+from acceptor import AcceptorMetrics
+from benchmarks.common import EngineHarness
+from reconnect import ServerConnector
+
+
+def register(connector, name):
+    sock = connector.connect()
+    framing.send_text(sock, name)
+    response = framing.recv_text(sock)
+    if response != "OK":
+        raise RuntimeError(f"client {name} rejected: {response}")
+    connector.accepted(sock)
+    return sock
+
+
+def storm_process(port, clients, rounds, results):
+    """Every client connects once, then all drop their connection and reconnect together, rounds times."""
+    connectors = [ServerConnector("127.0.0.1", port) for _ in range(clients)]
+    socks = [register(connector, f"re{i}") for i, connector in enumerate(connectors)]
+    results.put("connected")
+
+    for round_number in range(rounds):
+        for resume in (False, True):
+            barrier = threading.Barrier(clients + 1)
+            latencies = [0.0] * clients
+            resumed = [False] * clients
+
+            def reconnect(i):
+                # without resumption every reconnect starts from a new context, like the client used to
+                connector = connectors[i] if resume else ServerConnector("127.0.0.1", port)
+                socks[i].close()
+                barrier.wait()
+                start = time.perf_counter()
+                socks[i] = register(connector, f"re{i}_{round_number}_{resume}")
+                latencies[i] = time.perf_counter() - start
+                resumed[i] = socks[i].session_reused
+
+            threads = [threading.Thread(target=reconnect, args=(i,)) for i in range(clients)]
+            for thread in threads:
+                thread.start()
+            barrier.wait()
+            start = time.perf_counter()
+            for thread in threads:
+                thread.join()
+            results.put((resume, time.perf_counter() - start, latencies, sum(resumed)))
+    results.put(None)
+    for sock in socks:
+        sock.close()
+
+
+async def main(clients, rounds):
+    harness = EngineHarness()
+    await harness.start()
+    loop = asyncio.get_running_loop()
+
+    results = multiprocessing.Queue()
+    storm = multiprocessing.Process(target=storm_process, args=(harness.ports["client"], clients, rounds, results))
+    storm.start()
+    storms = {False: [], True: []}
+    await loop.run_in_executor(None, results.get)  # the class is connected
+    cpu = time.process_time()  # the server's CPU time, the clients run in their own process
+    while True:
+        result = await loop.run_in_executor(None, results.get)
+        if result is None:
+            break
+        resume, wall, latencies, resumed = result
+        storms[resume].append((wall, latencies, resumed, time.process_time() - cpu))
+        cpu = time.process_time()
+    await loop.run_in_executor(None, storm.join)
+
+    await harness.admin_command("ACCEPTSTATS")
+    _, server_stats = await framing.read_frame(harness.admin_reader)
+    await harness.stop()
+
+    print(f"{clients} clients reconnecting at once, {rounds} rounds each")
+    for resume, label in ((False, "full handshake"), (True, "resumed session")):
+        walls = [wall for wall, _, _, _ in storms[resume]]
+        latencies = [latency for _, samples, _, _ in storms[resume] for latency in samples]
+        resumed = sum(count for _, _, count, _ in storms[resume])
+        server_cpu = min(cpu for _, _, _, cpu in storms[resume])
+        print(f"  {label:<16} whole class back after {min(walls) * 1000:.0f} ms, server CPU {server_cpu * 1000:.0f} ms "
+              f"(best round), per client {AcceptorMetrics.percentiles(latencies)}, {resumed}/{len(latencies)} resumed")
+    print("server acceptor metrics:")
+    print("  " + server_stats.decode().replace("\n", "\n  "))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 50, int(sys.argv[2]) if len(sys.argv) > 2 else 3))
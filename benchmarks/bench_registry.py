@@ -0,0 +1,41 @@
+# benchmark: target lookup and CLIENTLIST cost by class size
+# usage: python -m benchmarks.bench_registry
+
+import timeit
+
+from client_registry import ClientRecord, ClientRegistry
+
+CLASS_SIZES = [30, 1000, 10000]
+
+
+def fill(size):
+    registry = ClientRegistry()
+    for i in range(size):
+        registry.add(ClientRecord(object(), f"Student{i}", f"10.0.{i // 250}.{i % 250}", None, None))
+    return registry
+
+
+def per_call(statement, number):
+    return min(timeit.repeat(statement, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    print(f"{'clients':>8} {'by name us':>11} {'by IP us':>9} {'CLIENTLIST us':>14} {'add+remove us':>14}")
+    for size in CLASS_SIZES:
+        registry = fill(size)
+        last = f"student{size - 1}"
+        ip = f"10.0.{(size - 1) // 250}.{(size - 1) % 250}"
+        by_name = per_call(lambda: registry.resolve(last), 10000)
+        by_ip = per_call(lambda: registry.resolve(ip), 10000)
+        client_list = per_call(registry.client_list, 10000)
+
+        def churn():
+            record = ClientRecord(object(), "late", "10.9.9.9", None, None)
+            registry.add(record)
+            registry.remove(record.writer)
+        add_remove = per_call(churn, 10000)
+        print(f"{size:>8} {by_name:>11.2f} {by_ip:>9.2f} {client_list:>14.2f} {add_remove:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
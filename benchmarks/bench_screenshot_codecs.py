@@ -0,0 +1,39 @@
+# benchmark: encode time and size of every screenshot preset the admin can pick
+# usage: python -m benchmarks.bench_screenshot_codecs [rounds]
+
+import statistics
+import sys
+import time
+
+import screen_capture
+from benchmarks.common import sample_screen
+
+RESOLUTIONS = [(1920, 1080), (3840, 2160)]
+WIFI_MBIT = 20  # a shared classroom access point, for the estimated upload time
+
+
+def measure(encoder, image, rounds):
+    """Median encode seconds and the encoded size in bytes."""
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        data = encoder.encode(image)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), len(data)
+
+
+def main(rounds):
+    lines = [f"screenshot encoders on a synthetic desktop, median of {rounds}",
+             f"{'screen':>10} {'encoder':<26} {'encode ms':>10} {'KB':>7} {'upload s':>9}"]
+    for width, height in RESOLUTIONS:
+        image = sample_screen(width, height)
+        for spec in screen_capture.PRESETS:
+            elapsed, size = measure(screen_capture.Encoder.parse(spec), image, rounds)
+            upload = size * 8 / (WIFI_MBIT * 1e6)
+            lines.append(f"{f'{width}x{height}':>10} {spec:<26} {elapsed * 1000:>10.1f} {size / 1024:>7.0f} {upload:>9.2f}")
+    lines.append(f"upload s: estimated on {WIFI_MBIT} Mbit/s Wi-Fi")
+    print("\n".join(lines))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
@@ -0,0 +1,87 @@
+# benchmark: LASTFILE lookup, listing and parsing the directory against the screenshot index
+# usage: python -m benchmarks.bench_screenshot_index [screenshots] [clients]
+
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from db_executor import DatabaseExecutor
+from screenshot_store import ScreenshotStore
+
+ROUNDS = 20
+
+
+def scan_directory(directory, client_name, start_time):
+    """send_last_file before the index: list, regex match and strptime every screenshot ever saved."""
+    files = [f for f in os.listdir(directory) if f.startswith('pic_') and f.endswith(('.png', '.jpg', '.webp'))]
+    client_files = {}
+    for f in files:
+        match = re.match(r'pic_(\w+)_(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})\.(png|jpg|webp)', f)
+        if match:
+            name = match.group(1).upper()
+            file_time = datetime.strptime(match.group(2), "%Y-%m-%d_%H-%M-%S")
+            if file_time >= start_time:
+                client_files.setdefault(name, []).append((file_time, f))
+    return max(client_files[client_name.upper()], key=lambda x: x[0])[1]
+
+
+def median_ms(function, *args):
+    samples = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        function(*args)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main(screenshots, clients):
+    lines = [f"{screenshots} screenshots of {clients} clients, median of {ROUNDS}"]
+    with tempfile.TemporaryDirectory() as directory:
+        # the same screenshots twice: in one flat directory as they used to be saved, and in the store's layout
+        flat, root = os.path.join(directory, "flat"), os.path.join(directory, "screenshots")
+        os.makedirs(flat)
+        start = datetime(2026, 1, 1, 8, 0, 0)
+        for i in range(screenshots):
+            taken = start + timedelta(seconds=i)
+            with open(os.path.join(flat, f"pic_STUDENT{i % clients}_{taken.strftime('%Y-%m-%d_%H-%M-%S')}.png"), "wb") as f:
+                f.write(b"screenshot %d" % i)
+            path = os.path.join(root, f"STUDENT{i % clients}", taken.strftime("%Y-%m-%d"), f"{taken.strftime('%H-%M-%S')}.png")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(b"screenshot %d" % i)
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'index.db')}")
+
+        first = ScreenshotStore(DatabaseExecutor(sessionmaker(bind=engine)()), root, legacy_directory=None)
+        began = time.perf_counter()
+        first.load()  # reads and hashes every file once, the table is empty
+        adopted = time.perf_counter() - began
+        first.database.close()
+        store = ScreenshotStore(DatabaseExecutor(sessionmaker(bind=engine)()), root, legacy_directory=None)
+        began = time.perf_counter()
+        store.load()
+        loaded = time.perf_counter() - began
+
+        expected = scan_directory(flat, "student7", start)
+        assert store.latest("student7", since=start).name == expected
+        day = store.between("student7", start + timedelta(hours=1), start + timedelta(hours=2))
+
+        lines.append(f"  LASTFILE by directory scan  {median_ms(scan_directory, flat, 'student7', start):>9.3f} ms")
+        lines.append(f"  LASTFILE by index           {median_ms(store.latest, 'student7', start):>9.4f} ms")
+        lines.append(f"  range query (one hour)      {median_ms(store.between, 'student7', start, start + timedelta(hours=1)):>9.4f} ms"
+                     f" ({len(day)} screenshots)")
+        lines.append(f"  startup: first run {adopted * 1000:.0f} ms (files indexed and hashed once), "
+                     f"then {loaded * 1000:.0f} ms from the table")
+        store.database.close()
+        engine.dispose()
+    print("\n".join(lines))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000, int(sys.argv[2]) if len(sys.argv) > 2 else 40)
@@ -0,0 +1,80 @@
+# benchmark: screenshot capture -> encode -> send until the server saved it, through a temp file or in memory
+# usage: python -m benchmarks.bench_screenshot_pipeline [rounds]
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import framing
+import screen_capture
+from benchmarks.common import EngineHarness, connect_blocking_client, sample_screen
+
+RESOLUTIONS = [(1920, 1080), (3840, 2160)]
+
+
+def through_disk(sock, image):
+    """The old take_screenshot: save PICTURE_<time>.png, read it back, send it. Returns (encode + disk, send) seconds."""
+    start = time.perf_counter()
+    image.save("PICTURE_bench.png")
+    with open("PICTURE_bench.png", "rb") as f:
+        data = f.read()
+    encoded = time.perf_counter()
+    screen_capture.send(sock, memoryview(data))
+    return encoded - start, time.perf_counter() - encoded
+
+
+SAME_AS_DISK = screen_capture.Encoder.parse("png level=6")  # PIL's default level, what the temp file got
+
+
+def in_memory(sock, image):
+    start = time.perf_counter()
+    data = SAME_AS_DISK.encode(image)
+    encoded = time.perf_counter()
+    screen_capture.send(sock, data)
+    return encoded - start, time.perf_counter() - encoded
+
+
+async def measure(harness, sock, image, pipeline, rounds):
+    """Median (capture, encode, send, total until the admin heard it was saved) in seconds."""
+    loop = asyncio.get_running_loop()
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        if screen_capture.pyautogui is not None:
+            await loop.run_in_executor(None, screen_capture.grab)
+        captured = time.perf_counter()
+        encode, send = await loop.run_in_executor(None, pipeline, sock, image)
+        await harness.screenshots_saved()
+        samples.append((captured - start, encode, send, time.perf_counter() - start))
+    return [statistics.median(column) for column in zip(*samples)]
+
+
+async def main(rounds):
+    harness = EngineHarness()
+    await harness.start()
+    loop = asyncio.get_running_loop()
+    sock = await loop.run_in_executor(None, connect_blocking_client, harness.ports["client"], "shot")
+    await framing.read_frame(harness.msg_reader)
+    results = []
+    try:
+        for width, height in RESOLUTIONS:
+            image = sample_screen(width, height)
+            for label, pipeline in (("temp file", through_disk), ("in memory", in_memory)):
+                results.append((f"{width}x{height}", label, *(await measure(harness, sock, image, pipeline, rounds))))
+    finally:
+        sock.close()
+        await harness.stop()
+        if os.path.exists("PICTURE_bench.png"):
+            os.remove("PICTURE_bench.png")
+
+    capture_note = "" if screen_capture.pyautogui is not None else " (no display here: prepared frames, capture not timed)"
+    print(f"capture -> encode -> send -> saved on the server, median of {rounds}{capture_note}")
+    print(f"{'screen':>10} {'pipeline':>10} {'capture ms':>11} {'encode ms':>10} {'send ms':>8} {'total ms':>9}")
+    for screen, label, capture, encode, send, total in results:
+        print(f"{screen:>10} {label:>10} {capture * 1000:>11.1f} {encode * 1000:>10.1f} {send * 1000:>8.1f} {total * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5))
@@ -0,0 +1,116 @@
+# benchmark: a semester of screenshots, disk usage and directory sizes with the storage engine against saving every file
+# usage: python -m benchmarks.bench_screenshot_storage [clients] [days] [screenshots per day]
+
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import screen_capture
+from benchmarks.common import sample_screen
+from db_executor import DatabaseExecutor
+from screenshot_store import RetentionPolicy, ScreenshotStore
+
+WIDTH, HEIGHT = 640, 360  # small screens keep the run short, the ratios hold for 1080p
+IDLE = 0.5  # share of screenshots of a screen that did not change since the last one
+MAX_AGE_DAYS = 30
+MAX_BYTES = 64 * 1024 * 1024
+
+
+def screenshots(clients, days, per_day):
+    """(client, taken, PNG bytes) of a semester of school days, a student's screen changes between lessons or not at all."""
+    encoder = screen_capture.Encoder.parse("png level=1")
+    desktop = np.asarray(sample_screen(WIDTH, HEIGHT))
+    rng = np.random.default_rng(3)
+    last = {}
+    start = datetime(2026, 2, 2, 8, 0, 0)
+    for day in range(days):
+        for shot in range(per_day):
+            taken = start + timedelta(days=day, hours=8 * shot / per_day)
+            for client in range(clients):
+                name = f"student{client}"
+                if name not in last or rng.random() >= IDLE:
+                    screen = desktop.copy()
+                    top, left = rng.integers(0, HEIGHT - 60), rng.integers(0, WIDTH - 200)
+                    screen[top:top + 60, left:left + 200] = rng.integers(0, 256, 3)  # another window, typed text
+                    screen[top + 20:top + 31, left + 10:left + 190][rng.random((11, 180)) < 0.3] = 20
+                    last[name] = bytes(encoder.encode(Image.fromarray(screen)))
+                yield name, taken + timedelta(seconds=client), last[name]
+
+
+def disk_usage(root):
+    """(bytes on disk counting every inode once, files, largest directory in entries)."""
+    inodes, files, largest = {}, 0, 0
+    for directory, subdirectories, names in os.walk(root):
+        largest = max(largest, len(names) + len(subdirectories))
+        for name in names:
+            stat = os.stat(os.path.join(directory, name))
+            inodes[stat.st_ino] = stat.st_size
+            files += 1
+    return sum(inodes.values()), files, largest
+
+
+async def main(clients, days, per_day):
+    lines = [f"{clients} clients, {days} school days, {per_day} screenshots a day each ({IDLE:.0%} of an idle screen), "
+             f"{WIDTH}x{HEIGHT} PNG; keep {MAX_AGE_DAYS} days within {MAX_BYTES // (1024 * 1024)} MB, WebP after a day"]
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'store.db')}")
+        store = ScreenshotStore(DatabaseExecutor(sessionmaker(bind=engine)()), os.path.join(directory, "screenshots"), legacy_directory=None,
+                                policy=RetentionPolicy(max_age_days=MAX_AGE_DAYS, max_bytes=MAX_BYTES),
+                                transcode_after=24 * 3600, transcode_batch=10 ** 6)  # one pass a day instead of every 10 minutes
+        quiet = contextlib.redirect_stdout(io.StringIO())
+        with quiet:
+            store.load()
+        received = count = 0
+        save_times, compact_times = [], []
+        day = None
+        for name, taken, data in screenshots(clients, days, per_day):
+            if day is not None and taken.date() != day:
+                start = time.perf_counter()
+                await store.compact(now=taken)  # the compactor runs overnight
+                compact_times.append(time.perf_counter() - start)
+            day = taken.date()
+            start = time.perf_counter()
+            await store.save(name, data, "png", taken=taken)
+            save_times.append(time.perf_counter() - start)
+            received += len(data)
+            count += 1
+
+        on_disk, files, largest = disk_usage(store.root)
+        assert on_disk == store.disk_bytes, (on_disk, store.disk_bytes)
+        assert all(store.latest(f"student{client}") is not None for client in range(clients))
+        lines.append(f"  every file kept, one directory:   {received / 1e6:>8.1f} MB in {count} files, "
+                     f"{count} entries in the directory")
+        lines.append(f"  storage engine:                   {on_disk / 1e6:>8.1f} MB in {files} files, "
+                     f"at most {largest} entries in a directory (a day after the last pass)")
+        lines.append(f"  deduplicated {store.deduplicated} screenshots, transcoded {store.transcoded} "
+                     f"({store.transcode_saved / 1e6:.1f} MB saved), removed {store.removed}")
+        lines.append(f"  save median {statistics.median(save_times) * 1000:.2f} ms, compaction pass median "
+                     f"{statistics.median(compact_times) * 1000:.0f} ms, max {max(compact_times) * 1000:.0f} ms "
+                     f"(transcoding a day of screenshots)")
+        store.database.close()  # the rows of the last saves are written
+        restarted = ScreenshotStore(DatabaseExecutor(sessionmaker(bind=engine)()), store.root, legacy_directory=None)
+        start = time.perf_counter()
+        with quiet:
+            restarted.load()
+        loaded = time.perf_counter() - start
+        assert (len(restarted), restarted.disk_bytes) == (len(store), store.disk_bytes)
+        lines.append(f"  restart: index of {len(restarted)} screenshots loaded in {loaded * 1000:.0f} ms")
+        restarted.database.close()
+        engine.dispose()
+    print("\n".join(lines))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 30, int(sys.argv[2]) if len(sys.argv) > 2 else 90,
+                     int(sys.argv[3]) if len(sys.argv) > 3 else 4))
@@ -0,0 +1,76 @@
+# benchmark: admin command latency while several students upload screenshots at once
+# usage: python -m benchmarks.bench_screenshot_uploads [uploaders] [megabytes]
+
+import asyncio
+import multiprocessing
+import os
+import statistics
+import sys
+import threading
+import time
+
+import framing
+from benchmarks.common import EngineHarness, connect_blocking_client
+
+
+def upload(sock, data):
+    # same frames as ClientApp.take_screenshot
+    framing.send_frame(sock, framing.PIC_BEGIN, framing.pack_fields(size=len(data)))
+    view = memoryview(data)
+    for start in range(0, len(data), framing.CHUNK_SIZE):
+        framing.send_frame(sock, framing.PIC_CHUNK, view[start:start + framing.CHUNK_SIZE])
+    framing.send_frame(sock, framing.PIC_END)
+
+
+def students_process(port, uploaders, megabytes, connected, go):
+    """Runs the students in their own process so their TLS work does not share the server's core."""
+    data = os.urandom(megabytes * 1024 * 1024)
+    socks = [connect_blocking_client(port, f"student{i}") for i in range(uploaders)]
+    connected.set()
+    go.wait()
+    threads = [threading.Thread(target=upload, args=(sock, data)) for sock in socks]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    time.sleep(1)  # keep the connections open until the server read everything
+    for sock in socks:
+        sock.close()
+
+
+async def main(uploaders, megabytes):
+    harness = EngineHarness()
+    await harness.start()
+    target_reader, target_writer = await harness.connect_client("target")
+
+    connected, go = multiprocessing.Event(), multiprocessing.Event()
+    students = multiprocessing.Process(target=students_process,
+                                       args=(harness.ports["client"], uploaders, megabytes, connected, go))
+    students.start()
+    await asyncio.get_running_loop().run_in_executor(None, connected.wait)
+
+    latencies = []
+    go.set()
+    start = time.perf_counter()
+    saved = asyncio.create_task(harness.screenshots_saved(uploaders))  # the notices come on the msg socket
+    while not saved.done():
+        sent = time.perf_counter()
+        await harness.admin_command("BLOCK: target")
+        await framing.read_frame(target_reader)
+        await framing.read_frame(harness.admin_reader)  # the report of the command
+        latencies.append(time.perf_counter() - sent)
+        await asyncio.sleep(0.005)
+    total = time.perf_counter() - start
+
+    students.join()
+    target_writer.close()
+    await harness.stop()
+
+    print(f"{uploaders} uploads of {megabytes} MB finished in {total * 1000:.0f} ms")
+    print(f"BLOCK latency during uploads: median {statistics.median(latencies) * 1000:.2f} ms, "
+          f"max {max(latencies) * 1000:.2f} ms over {len(latencies)} commands")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    asyncio.run(main(*(args + [8, 4][len(args):])))
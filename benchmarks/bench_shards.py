@@ -0,0 +1,61 @@
+# benchmark: single process server vs worker processes for screenshot uploads and file hand-outs
+# usage: python -m benchmarks.bench_shards [uploaders] [megabytes]
+
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+
+import framing
+from benchmarks.bench_screenshot_uploads import students_process
+from benchmarks.common import EngineHarness, receive_file
+
+SHARDS = [0, 2, 4]
+FILE_CLIENTS = 20
+
+
+async def run(shards, uploaders, megabytes):
+    harness = EngineHarness(shards=shards)
+    await harness.start()
+
+    # screenshots: all students upload at once, until the admin was told about every file
+    connected, go = multiprocessing.Event(), multiprocessing.Event()
+    students = multiprocessing.Process(target=students_process,
+                                       args=(harness.ports["client"], uploaders, megabytes, connected, go))
+    students.start()
+    await asyncio.get_running_loop().run_in_executor(None, connected.wait)
+    start = time.perf_counter()
+    go.set()
+    await harness.screenshots_saved(uploaders)
+    uploads = time.perf_counter() - start
+    await asyncio.get_running_loop().run_in_executor(None, students.join)
+    await asyncio.sleep(0.2)
+
+    # a 4 MB hand-out to a class
+    clients = [await harness.connect_client(f"pupil{i}") for i in range(FILE_CLIENTS)]
+    data = os.urandom(4 * 1024 * 1024)
+    start = time.perf_counter()
+    receiving = asyncio.gather(*(receive_file(reader, writer) for reader, writer in clients))
+    await harness.admin_send_file("ALL", "handout.png", data)
+    await receiving
+    handout = time.perf_counter() - start
+    await framing.read_frame(harness.admin_reader)
+
+    for _, writer in clients:
+        writer.close()
+    await harness.stop()
+    return uploads, handout
+
+
+async def main(uploaders, megabytes):
+    results = [(shards, *await run(shards, uploaders, megabytes)) for shards in SHARDS]
+    print(f"{os.cpu_count()} CPUs, {uploaders} uploads of {megabytes} MB, 4 MB to {FILE_CLIENTS} clients")
+    print(f"{'workers':>8} {'uploads ms':>11} {'MB/s':>7} {'hand-out ms':>12}")
+    for shards, uploads, handout in results:
+        print(f"{shards or 'none':>8} {uploads * 1000:>11.0f} {uploaders * megabytes / uploads:>7.1f} {handout * 1000:>12.0f}")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    asyncio.run(main(*(args + [8, 4][len(args):])))
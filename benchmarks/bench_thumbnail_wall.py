@@ -0,0 +1,107 @@
+# benchmark: a look at the whole class, SCREENSHOT + LASTFILE per student against one WALL
+# usage: python -m benchmarks.bench_thumbnail_wall [clients]
+
+import asyncio
+import sys
+import time
+
+import framing
+import screen_capture
+from benchmarks.common import EngineHarness, sample_screen
+
+CANVAS = "800x450"  # about the admin's screenshot canvas
+
+
+class Student:
+    """Answers SCREENSHOT like client.py, from a prepared screen encoded once per requested spec."""
+
+    encoded = {}  # spec -> (bytes, extension, encode seconds), shared by all students
+    screen = None
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    def screenshot(cls, spec):
+        if spec not in cls.encoded:
+            encoder = screen_capture.Encoder.parse(spec)
+            if cls.screen is None:
+                cls.screen = sample_screen(1920, 1080)
+            start = time.perf_counter()
+            data = encoder.encode(cls.screen)
+            cls.encoded[spec] = (bytes(data), encoder.extension, time.perf_counter() - start)
+        return cls.encoded[spec]
+
+    async def run(self):
+        try:
+            while True:
+                frame_type, payload = await framing.read_frame(self.reader)
+                if frame_type == framing.TEXT and payload.startswith(b"SCREENSHOT"):
+                    data, extension, _ = self.screenshot(payload.decode()[len("SCREENSHOT"):].strip())
+                    framing.write_frame(self.writer, framing.PIC_BEGIN, framing.pack_fields(size=len(data), format=extension))
+                    for start in range(0, len(data), framing.CHUNK_SIZE):
+                        framing.write_frame(self.writer, framing.PIC_CHUNK, data[start:start + framing.CHUNK_SIZE])
+                    framing.write_frame(self.writer, framing.PIC_END)
+                    await self.writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+
+async def one_by_one(harness, names):
+    """What the admin did before: a screenshot and a LASTFILE for each student in turn."""
+    uploaded = received = 0
+    start = time.perf_counter()
+    for name in names:
+        await harness.admin_command(f"SCREENSHOT png level=1: {name}")
+        await framing.read_frame(harness.admin_reader)  # the report of the command
+        await harness.screenshots_saved()
+        await harness.admin_command(f"LASTFILE - {name}")
+        _, payload = await framing.read_frame(harness.admin_reader)
+        received += len(payload)
+        uploaded += len(Student.encoded["png level=1"][0])
+    return time.perf_counter() - start, uploaded, received
+
+
+async def wall(harness, clients):
+    start = time.perf_counter()
+    await harness.admin_command(f"WALL {CANVAS}")
+    frame_type, payload = await framing.read_frame(harness.admin_reader)
+    elapsed = time.perf_counter() - start
+    assert frame_type == framing.FILE, bytes(payload)
+    spec = [spec for spec in Student.encoded if spec.startswith("jpeg")][0]
+    return elapsed, len(Student.encoded[spec][0]) * clients, len(payload), spec
+
+
+async def main(clients):
+    harness = EngineHarness()
+    await harness.start()
+    names = [f"wall{i}" for i in range(clients)]
+    students = [Student(*await harness.connect_client(name)) for name in names]
+    tasks = [asyncio.create_task(student.run()) for student in students]
+    try:
+        Student.screenshot("png level=1")  # encoded before the clock starts, timed separately
+        before = await one_by_one(harness, names)
+        await wall(harness, clients)  # warm up: the JPEG spec is encoded once
+        after = await wall(harness, clients)
+    finally:
+        for student in students:
+            student.writer.close()
+        await harness.stop()
+        for task in tasks:
+            task.cancel()
+
+    lines = [f"{clients} students at 1920x1080, admin canvas {CANVAS}"]
+    elapsed, uploaded, received = before
+    lines.append(f"  SCREENSHOT + LASTFILE each: {elapsed * 1000:>6.0f} ms, clients -> server {uploaded / 1e6:>6.1f} MB, "
+                 f"server -> admin {received / 1e6:>6.2f} MB in {2 * clients} round trips "
+                 f"(+{Student.encoded['png level=1'][2] * 1000:.0f} ms encoding on every student)")
+    elapsed, uploaded, received, spec = after
+    lines.append(f"  WALL:                       {elapsed * 1000:>6.0f} ms, clients -> server {uploaded / 1e6:>6.1f} MB, "
+                 f"server -> admin {received / 1e6:>6.2f} MB in 1 round trip "
+                 f"(+{Student.encoded[spec][2] * 1000:.0f} ms encoding on every student, {spec})")
+    print("\n".join(lines))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 30))
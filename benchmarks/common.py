@@ -0,0 +1,189 @@
+# shared helpers for the benchmark scripts
+# run the benchmarks from the project root, e.g. python -m benchmarks.bench_broadcast
+
+import asyncio
+import contextlib
+import hashlib
+import io
+import os
+import socket
+import tempfile
+
+import acceptor
+import framing
+from async_server import AsyncServerEngine
+from file_cache import FileCache
+from reconnect import client_ssl_context
+from screenshot_store import ScreenshotStore
+from shards import ShardedServerEngine
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def server_ssl_context():
+    return acceptor.server_ssl_context(certfile="server.pem", keyfile="server.key")
+
+
+def connect_blocking_client(port, name):
+    """Connect and register a client the way client.py does (blocking TLS socket)."""
+    sock = client_ssl_context().wrap_socket(socket.create_connection(("127.0.0.1", port)), server_hostname="127.0.0.1")
+    framing.send_text(sock, name)
+    response = framing.recv_text(sock)
+    if response != "OK":
+        raise RuntimeError(f"client {name} rejected: {response}")
+    return sock
+
+
+class EngineHarness:
+    """Runs an AsyncServerEngine on localhost with its debug output muted."""
+
+    def __init__(self, session=None, cache_bytes=512 * 1024 * 1024, shards=0, admin_codec=None, **engine_options):
+        self.ports = {name: free_port() for name in ("admin", "admin_test", "client", "msg_clientlist")}
+        self.cache_dir = tempfile.TemporaryDirectory()
+        file_cache = FileCache(self.cache_dir.name, cache_bytes)
+        screenshots = ScreenshotStore(None, os.path.join(self.cache_dir.name, "screenshots"), legacy_directory=None)
+        with contextlib.redirect_stdout(io.StringIO()):
+            screenshots.load()
+        if shards:
+            self.engine = ShardedServerEngine("127.0.0.1", self.ports["admin"], self.ports["admin_test"], self.ports["client"],
+                                              self.ports["msg_clientlist"], server_ssl_context(), "server.pem", "server.key",
+                                              shards, session, file_cache=file_cache, screenshot_store=screenshots,
+                                              quiet_workers=True)
+        else:
+            self.engine = AsyncServerEngine("127.0.0.1", self.ports["admin"], self.ports["admin_test"], self.ports["client"],
+                                            self.ports["msg_clientlist"], server_ssl_context(), session, file_cache=file_cache,
+                                            screenshot_store=screenshots, **engine_options)
+        self.admin_codec = admin_codec  # compression the admin negotiates, None for none
+        self.task = None
+        self.quiet = contextlib.redirect_stdout(io.StringIO())
+
+    async def start(self):
+        self.quiet.__enter__()
+        self.task = asyncio.create_task(self.engine.serve())
+        await self.engine.ready.wait()
+
+        # the admin opens its three connections like admin.py does
+        self.admin_reader, self.admin_writer = await asyncio.open_connection(
+            "127.0.0.1", self.ports["admin"], ssl=client_ssl_context())
+        if self.admin_codec:
+            framing.write_frame(self.admin_writer, framing.COMPRESS, self.admin_codec.encode())
+            await framing.read_frame(self.admin_reader)
+        self.test_reader, self.test_writer = await asyncio.open_connection("127.0.0.1", self.ports["admin_test"])
+        self.msg_reader, self.msg_writer = await asyncio.open_connection("127.0.0.1", self.ports["msg_clientlist"])
+        await framing.read_frame(self.msg_reader)  # "refresh client list, admin connected"
+
+    async def admin_command(self, command):
+        framing.write_frame(self.admin_writer, framing.TEXT, command.encode(), codec=self.admin_codec)
+        await self.admin_writer.drain()
+
+    async def admin_send_file(self, target, name, data):
+        """
+        SENDFILE like admin.py: command and FILE_OFFER, then FILE_BEGIN, FILE_CHUNK..., FILE_END
+        if the server asks for the content. Returns True if the file was uploaded.
+        """
+        await self.admin_command(f"SENDFILE {name}: {target}")
+        framing.write_frame(self.admin_writer, framing.FILE_OFFER,
+                            framing.pack_file_offer(hashlib.sha256(data).digest(), name, len(data)))
+        await self.admin_writer.drain()
+        frame_type, _ = await framing.read_frame(self.admin_reader)
+        if frame_type == framing.FILE_HAVE:
+            return False
+        framing.write_frame(self.admin_writer, framing.FILE_BEGIN, framing.pack_file_begin(name, len(data)))
+        view = memoryview(data)
+        for start in range(0, len(data), framing.CHUNK_SIZE):
+            framing.write_frame(self.admin_writer, framing.FILE_CHUNK, view[start:start + framing.CHUNK_SIZE],
+                                codec=self.admin_codec)
+            await self.admin_writer.drain()
+        framing.write_frame(self.admin_writer, framing.FILE_END)
+        await self.admin_writer.drain()
+        return True
+
+    async def connect_client(self, name, codec=None):
+        """Connect and register a client, with codec it announces the compression it decodes like client.py."""
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.ports["client"], ssl=client_ssl_context())
+        if codec:
+            framing.write_frame(writer, framing.COMPRESS, codec.encode())
+        framing.write_frame(writer, framing.TEXT, name.encode())
+        await writer.drain()
+        if codec:
+            await framing.read_frame(reader)  # the server's COMPRESS answer
+        _, response = await framing.read_frame(reader)
+        if response != b"OK":
+            raise RuntimeError(f"client {name} rejected: {bytes(response)!r}")
+        await framing.read_frame(self.msg_reader)  # "refresh client list, new client connected"
+        return reader, writer
+
+    async def screenshots_saved(self, count=1):
+        """Wait for count "SCREENSHOT SAVED AS" notices on the msg socket, passing over the client list ones."""
+        while count:
+            _, message = await framing.read_frame(self.msg_reader)
+            if message.startswith(b"SCREENSHOT SAVED AS"):
+                count -= 1
+
+    async def stop(self):
+        self.admin_writer.close()
+        await self.task
+        self.quiet.__exit__(None, None, None)
+        self.cache_dir.cleanup()
+
+
+async def receive_file(reader, writer, cache=None):
+    """
+    Read a streamed file like client.py does, returns (name, content).
+    A FILE_OFFER is answered from cache (a dict digest -> content) if given.
+    """
+    frame_type, payload = await framing.read_frame(reader)
+    digest = None
+    if frame_type == framing.FILE_OFFER:
+        digest, name, _ = framing.unpack_file_offer(payload)
+        if cache is not None and digest in cache:
+            framing.write_frame(writer, framing.FILE_HAVE, digest)
+            await writer.drain()
+            return name, cache[digest]
+        framing.write_frame(writer, framing.FILE_NEED, digest)
+        await writer.drain()
+        frame_type, payload = await framing.read_frame(reader)
+    assert frame_type == framing.FILE_BEGIN, frame_type
+    name, size = framing.unpack_file_begin(payload)
+    content = bytearray(size)
+    received = 0
+    while True:
+        frame_type, chunk = await framing.read_frame(reader)
+        if frame_type == framing.FILE_END:
+            if cache is not None and digest is not None:
+                cache[digest] = content
+            return name, content
+        content[received:received + len(chunk)] = chunk
+        received += len(chunk)
+
+
+def sample_screen(width, height, seed=0):
+    """
+    A synthetic desktop for the screenshot benchmarks (there is no display here):
+    wallpaper gradient, windows with title bars and lines of "text", and a photo.
+    """
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    screen = np.empty((height, width, 3), np.uint8)
+    screen[..., 0] = 40 + 60 * x // width
+    screen[..., 1] = 70 + 80 * y // height
+    screen[..., 2] = 140
+    for _ in range(4):
+        w, h = width * rng.integers(30, 60) // 100, height * rng.integers(30, 60) // 100
+        left, top = rng.integers(0, width - w), rng.integers(0, height - h)
+        screen[top:top + h, left:left + w] = 250
+        screen[top:top + 30, left:left + w] = rng.integers(0, 255, 3)
+        for line in range(top + 40, top + h - 16, 18):  # glyph-like dark runs on every text line
+            row = screen[line:line + 11, left + 10:left + w - 10]
+            row[rng.random(row.shape[:2]) < 0.3] = rng.integers(0, 90)
+    ph, pw = height // 3, width // 4
+    photo = (y[:ph, :pw, None] * 255 // ph + rng.normal(0, 18, (ph, pw, 3))).clip(0, 255)
+    screen[height - ph - 40:height - 40, width - pw - 40:width - 40] = photo.astype(np.uint8)
+    return Image.fromarray(screen)
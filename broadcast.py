@@ -0,0 +1,167 @@
+# fan-out of commands and files to clients
+
+import asyncio
+import time
+from collections import deque
+
+import framing
+
+
+class ClientSender:
+    """
+    Outgoing side of one client connection: a send queue drained by its own
+    writer task. Every frame for the client goes through it, so frames keep their
+    order and a slow client only delays its own queue.
+    The queue is bounded by max_queued bytes: a client that stopped reading and
+    falls further behind than that is disconnected instead of growing the
+    server's memory (it reconnects and gets a fresh queue).
+    """
+
+    def __init__(self, writer, name, ip, send_timeout=30.0, max_queued=8 * 1024 * 1024, write_buffer=1024 * 1024,
+                 codec=None):
+        self.writer = writer
+        self.name = name
+        self.ip = ip
+        self.codec = codec  # compression the client negotiated, None for none
+        self.send_timeout = send_timeout
+        self.max_queued = max_queued
+        self.queue = asyncio.Queue()
+        self.queued_bytes = 0
+        self.closed = False
+        # let the transport buffer a few chunks before drain() waits for the socket to be writable
+        writer.transport.set_write_buffer_limits(high=write_buffer)
+        self.task = asyncio.create_task(self.run())
+
+    def send(self, header, parts):
+        """Queue an encoded frame, returns a future with the seconds it took until written."""
+        future = asyncio.get_running_loop().create_future()
+        size = len(header) + sum(len(part) for part in parts)
+        if not self.closed and self.queued_bytes and self.queued_bytes + size > self.max_queued:
+            print(f"[ERROR] Send queue of {self.name} is full ({self.queued_bytes} bytes), disconnecting")
+            self.drop()
+        if self.closed:
+            future.set_exception(ConnectionError(f"{self.name} disconnected"))
+        else:
+            self.queued_bytes += size
+            self.queue.put_nowait((header, parts, size, future, time.perf_counter()))
+        return future
+
+    def send_frame(self, frame_type, *parts):
+        flags, parts = framing.compress(frame_type, parts, self.codec)
+        return self.send(framing.pack_header(frame_type, sum(len(part) for part in parts), flags), parts)
+
+    def send_text(self, text):
+        return self.send_frame(framing.TEXT, text.encode())
+
+    async def run(self):
+        future = None
+        try:
+            while True:
+                header, parts, size, future, queued_at = await self.queue.get()
+                try:
+                    self.writer.write(header)
+                    for part in parts:
+                        self.writer.write(part)
+                    await asyncio.wait_for(self.writer.drain(), self.send_timeout)
+                except Exception as e:
+                    # a client that cannot take data any more is dropped, its reader then sees the close
+                    print(f"[ERROR] Sending to {self.name} failed: {e!r}")
+                    if not future.done():
+                        future.set_exception(ConnectionError(f"send to {self.name} failed: {e!r}"))
+                    self.drop()
+                    return
+                if self.closed:  # dropped while this frame was written
+                    return
+                self.queued_bytes -= size
+                if not future.done():
+                    future.set_result(time.perf_counter() - queued_at)
+        finally:
+            # stopped by close() in the middle of a frame (CancelledError is not an Exception) or dropped:
+            # whoever waits for the frame being written and the ones queued behind it must not wait forever
+            if future is not None and not future.done():
+                future.set_exception(ConnectionError(f"{self.name} disconnected"))
+            self.fail_pending()
+
+    def drop(self):
+        # abort instead of close: a graceful close would wait for the unsent data to be flushed
+        self.closed = True
+        self.writer.transport.abort()
+        self.fail_pending()
+
+    def fail_pending(self):
+        while not self.queue.empty():
+            future = self.queue.get_nowait()[3]
+            if not future.done():
+                future.set_exception(ConnectionError(f"{self.name} disconnected"))
+        self.queued_bytes = 0
+
+    def close(self):
+        self.closed = True
+        self.task.cancel()
+        self.fail_pending()
+
+
+def broadcast(senders, frame_type, *parts):
+    """
+    Send one frame to many clients at once. The frame is encoded (compressed) once
+    per codec the clients use and the payload parts are shared read-only by every
+    queue, nothing is copied per client.
+    All clients are written concurrently, so the total time is close to the
+    slowest client instead of the sum over all clients.
+    The frame is queued on every client right away; the returned awaitable gives
+    a list of (sender, seconds or exception) once every client was written.
+    """
+    frame = framing.EncodedFrame(frame_type, *parts)
+    futures = [sender.send(*frame.encode(sender.codec)) for sender in senders]
+    return collect_results(senders, futures)
+
+
+async def collect_results(senders, futures):
+    results = await asyncio.gather(*futures, return_exceptions=True)
+    return list(zip(senders, results))
+
+
+class StreamFanOut:
+    """
+    Forwards a stream of frames (a file arriving chunk by chunk) to many clients
+    as it comes in. Each client may have at most `window` frames queued; when a
+    client is that far behind, send() waits for it, which in turn stops reading
+    from the uploader. The server therefore never holds more than window chunks
+    per client, whatever the size of the file.
+    """
+
+    def __init__(self, senders, window=8):
+        self.window = window
+        self.pending = {sender: deque() for sender in senders}
+        self.codecs = {sender.codec for sender in senders}
+        self.failed = {}
+        self.started = time.perf_counter()
+
+    async def send(self, frame_type, *parts):
+        await self.send_encoded(framing.EncodedFrame(frame_type, *parts))
+
+    async def send_encoded(self, frame):
+        # compressing a chunk takes milliseconds: it is done once per codec, off the event loop
+        for codec in self.codecs:
+            if codec is not None and codec not in frame.encodings:
+                await asyncio.get_running_loop().run_in_executor(None, frame.encode, codec)
+        for sender, pending in self.pending.items():
+            if sender in self.failed:
+                continue
+            try:
+                while len(pending) >= self.window:
+                    await pending.popleft()
+            except Exception as e:
+                self.failed[sender] = e
+                continue
+            pending.append(sender.send(*frame.encode(sender.codec)))
+
+    async def finish(self):
+        """Wait until every client got the whole stream, returns a list of (sender, seconds or exception)."""
+        results = await asyncio.gather(*(self.wait_for_client(sender, pending) for sender, pending in self.pending.items()))
+        return list(zip(self.pending, results))
+
+    async def wait_for_client(self, sender, pending):
+        outcomes = await asyncio.gather(*pending, return_exceptions=True)
+        error = self.failed.get(sender) or next((o for o in outcomes if isinstance(o, Exception)), None)
+        return error if error else time.perf_counter() - self.started
@@ -1,17 +1,19 @@
 # client code
 
-import socket
 import ctypes 
-import pyautogui
+import hashlib
 import time
-from datetime import datetime
 import tkinter as tk
 from tkinter import messagebox
 import threading
 import queue
 from PIL import Image, ImageTk
 import io
-import ssl
+import framing
+import screen_capture
+import tile_delta
+from reconnect import ServerConnector
+from file_cache import FileCache
 
 class ClientApp:
     def __init__(self, master):
@@ -25,12 +27,22 @@ class ClientApp:
         self.master.maxsize(width=400, height=400) #width=999, height=999
         
         self.connected = False
+        self.registered = False  # our name was accepted once, connection losses are retried from then on
+        self.connector = None  # ServerConnector, created with the first connect
         self.shutdown = False
         self.name_accepted = True
         self.client_name = None
         self.timer_active = False  # Timer is initially inactive
         self.test_timer_id = None
         self.time_left = 60  # Default time for countdown
+        self.incoming_file = None  # (file name, buffer, bytes received) while a file is streamed in
+        self.offered_file = None  # hash of the file the server is sending after we answered FILE_NEED
+        self.file_cache = FileCache("received_files", max_bytes=256 * 1024 * 1024)  # files received before, by hash
+        self.save_screenshots = False  # keep a PICTURE_<time> copy of every screenshot sent to the server
+        self.socket_lock = threading.Lock()  # frames from the receive thread, the GUI and the live view must not interleave
+        self.monitor_lock = threading.Lock()
+        self.monitor_settings = None  # (seconds per frame, encoder) while the admin watches our screen live
+        self.monitor_thread = None
         self.create_name_screen()
 
     def create_name_screen(self):
@@ -197,7 +209,8 @@ class ClientApp:
                 self.message_display.config(state=tk.DISABLED)
                 self.message_display.see(tk.END)
 
-                self.client_socket.sendall(f"msg {self.client_name}: {message}".encode())
+                with self.socket_lock:
+                    framing.send_text(self.client_socket, f"msg {self.client_name}: {message}", self.connector.codec)
                 self.message_entry.delete(0, tk.END)
             else:
                 messagebox.showinfo("Empty Message", "Please type a message before sending.")
@@ -244,33 +257,25 @@ class ClientApp:
         self.user32.BlockInput(False)
         self.log_message("Keyboard is now unblocked.")
 
-    def take_screenshot(self):
+    def take_screenshot(self, spec=""):
         try:
-            # Generate a filename based on the current date and time
-            current_time = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-            screenshot_filename = f"PICTURE_{current_time}.png"
-            # Take a screenshot using pyautogui and save it locally
-            screenshot = pyautogui.screenshot()
-            screenshot.save(screenshot_filename)
-            self.log_message(f"Screenshot saved as {screenshot_filename}")
+            try:
+                encoder = screen_capture.Encoder.parse(spec) if spec else screen_capture.DEFAULT_ENCODER
+            except ValueError as e:
+                self.log_message(f"Bad screenshot settings '{spec}': {e}, using {screen_capture.DEFAULT_ENCODER}")
+                encoder = screen_capture.DEFAULT_ENCODER
+            # Take a screenshot using pyautogui, encoded in memory - nothing is written to disk unless asked for
+            screenshot = screen_capture.grab()
+            data = encoder.encode(screenshot)
+            if self.save_screenshots:
+                screenshot_filename = screen_capture.save(data, encoder.extension)
+                self.log_message(f"Screenshot saved as {screenshot_filename}")
 
             try:
                 print ("sending screenshot to server")
-                self.client_socket.sendall(b"PIC_START")
-
-                # Open the screenshot file in binary mode and read it in chunks
-                with open(screenshot_filename, "rb") as f: 
-                    num = 0
-                    while True:
-                        num+=1
-                        chunk = f.read(1024)
-                        if not chunk:
-                            break  # Stop when the file is fully read
-
-                        self.client_socket.sendall(chunk)  # Send chunk
-                        # print ("sent chunk ",num)
-                
-                self.client_socket.sendall(b"PIC_END")
+                # The upload is split into chunk frames so the server can receive it incrementally
+                with self.socket_lock:
+                    screen_capture.send(self.client_socket, data, encoder.extension)
                 print("Screenshot sent successfully.")
 
             except Exception as e:
@@ -278,6 +283,51 @@ class ClientApp:
         except Exception as e:
             self.log_message(f"Error taking screenshot: {e}")
 
+    def handle_monitor(self, args):
+        if args.upper() == "STOP":
+            with self.monitor_lock:
+                self.monitor_settings = None
+            self.log_message("Live view stopped.")
+            return
+        fps, _, spec = args.partition(" ")
+        try:
+            interval = 1 / min(max(float(fps), 0.2), 30.0)
+            encoder = screen_capture.Encoder.parse(spec) if spec else screen_capture.DEFAULT_ENCODER
+        except ValueError as e:
+            self.log_message(f"Bad live view settings '{args}': {e}")
+            return
+        with self.monitor_lock:
+            self.monitor_settings = (interval, encoder)
+            if self.monitor_thread is None:
+                self.monitor_thread = threading.Thread(target=self.run_monitor, daemon=True)
+                self.monitor_thread.start()
+        self.log_message(f"Live view started, {1 / interval:g} frames per second, {encoder}")
+
+    def run_monitor(self):
+        # grab the screen at the admin's rate and send the tiles that changed since the last frame
+        tiles = tile_delta.TileEncoder()
+        connection = None  # the socket the last delta went out on
+        while True:
+            with self.monitor_lock:
+                if self.monitor_settings is None or not self.running:
+                    self.monitor_thread = None
+                    return
+                interval, encoder = self.monitor_settings
+            started = time.monotonic()
+            try:
+                if self.client_socket is not connection:
+                    # a new connection: the server forgot our screen, start with every tile
+                    connection = self.client_socket
+                    tiles.reset()
+                delta = tiles.encode(screen_capture.grab(), encoder)
+                if delta is not None and connection is not None:
+                    with self.socket_lock:
+                        framing.send_frame(connection, framing.SCREEN_DELTA, delta)
+            except Exception as e:
+                print(f"[ERROR] Live view frame failed: {e}")
+                connection = None
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
     def load_questions_from_content(self, content):
         # load questions from test
         try:
@@ -317,20 +367,36 @@ class ClientApp:
                     score += 1
             # Calculate percentage grade
             s = int((score / len(questions)) * 100)
-            # Send the score to the server
-            self.client_socket.sendall(f"TEST_ANSWER {s}: {self.client_name}".encode())
+            with self.socket_lock:
+                framing.send_text(self.client_socket, f"TEST_ANSWER {s}: {self.client_name}", self.connector.codec)
             print ("sent")
+            self.send_test_responses(selected_answers, questions)
             #self.client_socket.sendall(b"TEST_ANSWER 2")
             messagebox.showinfo("Results", f"You got {score}/{len(questions)} correct!")
         except Exception as e:
             self.log_message(f"Error checking answers: {e}")
             messagebox.showerror("Error", f"An error occurred while checking answers: {e}")
 
+    def send_test_responses(self, selected_answers, questions):
+        # every answer (0 = not answered) for the server's item analysis, after the score: a test the
+        # frame cannot hold (numbers above 255, too many questions) is only graded
+        try:
+            file_name, digest = self.current_test
+            answers = [var.get() for var in selected_answers]
+            key = [q["answer"] or 0 for q in questions]
+            options = [len(q["options"]) for q in questions]
+            responses = framing.pack_test_responses(digest, file_name, answers, key, options)
+            with self.socket_lock:
+                framing.send_frame(self.client_socket, framing.TEST_RESPONSES, responses)
+        except Exception as e:
+            self.log_message(f"Answers not sent for the item analysis: {e}")
+
     def create_test_gui(self, filename):
         # creating the test
         try:
             # Step 1: Load questions from the received file content
             questions = self.load_questions_from_content(self.received_file_content)
+            self.current_test = (filename, hashlib.sha256(self.received_file_content).digest())  # the test the answers are for
 
             # Step 2: Setup canvas for test display
             self.canvas.delete("all")
@@ -419,11 +485,23 @@ class ClientApp:
             messagebox.showerror("Error", f"An error occurred while submitting the answers: {e}")
 
 
-    def handle_message(self, message):
+    def handle_message(self, frame_type, message):
         # handle reccived messages from server
         try:
+            # Handle file data transfer (e.g., .txt files or png image data), streamed in chunks
+            if frame_type == framing.PING:
+                # the server checks that we are still here
+                with self.socket_lock:
+                    framing.send_frame(self.client_socket, framing.PONG)
+
+            elif frame_type == framing.FILE_OFFER:
+                self.handle_file_offer(message)
+
+            elif frame_type in (framing.FILE_BEGIN, framing.FILE_CHUNK, framing.FILE_END, framing.FILE_ABORT):
+                self.handle_file_frame(frame_type, message)
+
             # Handle block/unblock requests
-            if message.startswith(b"BLOCK"):
+            elif message.startswith(b"BLOCK"):
                 self.log_message("Received block request")
                 self.block_keyboard()
 
@@ -440,54 +518,106 @@ class ClientApp:
                 self.log_message(f"Received message: {msg}")
                 self.display_message(f"admin: {msg}")  # Display the message in the Text widget
 
-            # Handle file data transfer (e.g., .txt files or png image data)
-            elif message.startswith(b"DATA_NAME"):
-                while b"DATA_END" not in message:
-                    chunk = self.client_socket.recv(1024)
-                    message += chunk
-                message = message.replace(b'DATA_NAME', b'').replace(b'DATA_END', b'')
-                msg = message.split(b'DATA_START')
-                file_name = msg[0].strip().decode()
-                content = msg[1].strip()
-
-                self.log_message(f"Received data file: {file_name}")
-                
-                self.received_filename = file_name
-                self.received_file_content = content  # Store content for downloading
-                self.download_button.config(state=tk.NORMAL)  # Enable download button
-                
-                self.canvas.delete("all")
-                if ".txt" in file_name.lower(): # Handle text file
-                    if "test" in file_name.lower(): # Handle test file
-                        print("answering a test")
-                        self.client_socket.sendall(f"{self.client_name} is answering a test".encode())
-                        self.download_button.config(state=tk.DISABLED)  # Disabled until finish test
-                        self.create_test_gui(file_name)
-                    else: # Regular text file
-                        print ("regular file")
-                        content = content.replace(b'\n', b'')
-                        self.canvas.create_text(10, 10, text=content, font=("Arial", 14), fill="blue", anchor="nw")
-                else: # Handle non-text files (png)
-                    try:
-                        image_data = io.BytesIO(content)
-                        image = Image.open(image_data)
-                        photo = ImageTk.PhotoImage(image)
-                        self.canvas.image = photo  # Keep a reference to the image
-                        self.canvas.create_image(10, 10, anchor="nw", image=photo)
-                    except:
-                        self.log_message("Error processing image")
-                        
-                self.canvas.config(scrollregion=self.canvas.bbox("all"))
-
             # Handle screenshot requests
             elif message.startswith(b"SCREENSHOT"):
-                self.take_screenshot()
+                # "SCREENSHOT" or "SCREENSHOT <encoder spec>" chosen by the admin
+                self.take_screenshot(message.decode()[len("SCREENSHOT"):].strip())
+
+            # live view of our screen: "MONITOR <frames per second> [encoder spec]" or "MONITOR STOP"
+            elif message.startswith(b"MONITOR"):
+                self.handle_monitor(message.decode()[len("MONITOR"):].strip())
             else:
                 self.log_message(f"Unknown command: {message}") # Log unknown message types
                 
         except Exception as e:
             self.log_message(f"Error handling message: {e}")  # Log any errors that occur during message handling
 
+    def handle_file_offer(self, message):
+        # the server offers a file by its hash - if we received it before it is taken from the cache
+        digest, file_name, size = framing.unpack_file_offer(message)
+        path = self.file_cache.lookup(digest, size)
+        if path is None:
+            self.offered_file = digest
+            with self.socket_lock:
+                framing.send_frame(self.client_socket, framing.FILE_NEED, digest)
+            return
+        with self.socket_lock:
+            framing.send_frame(self.client_socket, framing.FILE_HAVE, digest)
+        with open(path, "rb") as f:
+            content = f.read()
+        print(f"{file_name} taken from the file cache")
+        self.handle_file(file_name, content)
+
+    def cache_file(self, digest, content):
+        # keep a received file so the next offer of the same content is answered with FILE_HAVE
+        try:
+            entry = self.file_cache.writer(digest, len(content))
+            if entry is not None:
+                entry.write(content)
+                if not entry.commit():
+                    print("received file does not match the offered hash, not cached")
+        except OSError as e:
+            print(f"Error caching received file: {e}")
+
+    def handle_file_frame(self, frame_type, message):
+        # collect a streamed file into one buffer allocated from the announced size
+        if frame_type == framing.FILE_BEGIN:
+            file_name, size = framing.unpack_file_begin(message)
+            self.incoming_file = (file_name, bytearray(size), 0)
+        elif self.incoming_file is None:
+            self.log_message("Error: file data received without a file start")
+        elif frame_type == framing.FILE_CHUNK:
+            file_name, content, received = self.incoming_file
+            content[received:received + len(message)] = message
+            self.incoming_file = (file_name, content, received + len(message))
+        elif frame_type == framing.FILE_ABORT:
+            self.log_message(f"File transfer of {self.incoming_file[0]} was cancelled")
+            self.incoming_file = None
+            self.offered_file = None
+        else:
+            file_name, content, received = self.incoming_file
+            digest = self.offered_file
+            self.incoming_file = None
+            self.offered_file = None
+            if received != len(content):
+                self.log_message(f"Error: {file_name} is incomplete ({received}/{len(content)} bytes)")
+                return
+            if digest is not None:
+                self.cache_file(digest, content)
+            self.handle_file(file_name, content)
+
+    def handle_file(self, file_name, content):
+        # display a file received from the admin (through the server)
+        self.log_message(f"Received data file: {file_name}")
+
+        self.received_filename = file_name
+        self.received_file_content = content  # Store content for downloading
+        self.download_button.config(state=tk.NORMAL)  # Enable download button
+
+        self.canvas.delete("all")
+        if ".txt" in file_name.lower(): # Handle text file
+            if "test" in file_name.lower(): # Handle test file
+                print("answering a test")
+                with self.socket_lock:
+                    framing.send_text(self.client_socket, f"{self.client_name} is answering a test")
+                self.download_button.config(state=tk.DISABLED)  # Disabled until finish test
+                self.create_test_gui(file_name)
+            else: # Regular text file
+                print ("regular file")
+                content = content.replace(b'\n', b'')
+                self.canvas.create_text(10, 10, text=content, font=("Arial", 14), fill="blue", anchor="nw")
+        else: # Handle non-text files (png)
+            try:
+                image_data = io.BytesIO(content)
+                image = Image.open(image_data)
+                photo = ImageTk.PhotoImage(image)
+                self.canvas.image = photo  # Keep a reference to the image
+                self.canvas.create_image(10, 10, anchor="nw", image=photo)
+            except:
+                self.log_message("Error processing image")
+
+        self.canvas.config(scrollregion=self.canvas.bbox("all"))
+
     def download_file(self):
         # download txt or png files
         try:
@@ -528,41 +658,45 @@ class ClientApp:
 
     def run_client(self):
         # this function is running the client, checking with the server if the name is already exists, and listening for messages
+        if self.connector is None:
+            self.connector = ServerConnector(self.server_ip, self.client_port)
         while True and self.running:  # Keep retrying until we successfully connect
             try:
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-
-                ssl_context = ssl.create_default_context()
-                ssl_context.check_hostname = False  # Disable hostname verification
-                ssl_context.verify_mode = ssl.CERT_NONE  # Don't require a trusted CA
-
-                self.client_socket = ssl_context.wrap_socket(sock, server_hostname=self.server_ip)
+                self.client_socket = None
                 try:
-                    self.client_socket.connect((self.server_ip, self.client_port))
+                    # resumes the TLS session of the last connection if the server still knows it
+                    self.client_socket = self.connector.connect()
                     self.connected = True
                     self.log_message("Connected to the server. Waiting for messages...")
                 except ConnectionRefusedError as e:
-                    if self.connected == False:
-                        self.running = False
                     # Handle the case where the connection is refused
                     print(f"Connection refused: {e}")
+                    if self.registered:
+                        # we were in the class before: the server is restarting, keep trying
+                        self.wait_to_reconnect("Connection refused")
+                        continue
+                    self.running = False
                     self.log_message("Connection refused. Server might not be running.")
                     self.start_button.config(state=tk.NORMAL)
                     return  # Exit the loop or retry if you want
 
-                # Send client name to server
-                name_message = f"{self.client_name}".encode()
-                print ("sending client name to server ",name_message,"&&")
-                self.client_socket.sendall(name_message)
-
-
-                # Receive server response
-                response = self.client_socket.recv(1024).decode().strip()
+                # Send client name to server (with the compression we understand) and receive its response
+                print ("sending client name to server ",self.client_name,"&&")
+                response = self.connector.register(self.client_socket, self.client_name).strip()
                 print(f"[CLIENT] Server responded with: '{response}'")  # Debug log
 
                 if response.lower() == "ok":
                     print(f"[CLIENT] Name '{self.client_name}' accepted! Proceeding to main chat...")
+                    if self.client_socket.session_reused:
+                        print("[CLIENT] TLS session resumed")
+                    self.connector.accepted(self.client_socket)
                     self.name_accepted = True
+                    self.registered = True
+                elif self.registered:
+                    # reconnecting: the server did not notice yet that our old connection is gone
+                    self.client_socket.close()
+                    self.wait_to_reconnect("Server still has our old connection")
+                    continue
                 else:
                     print(f"[CLIENT] Name '{self.client_name}' was rejected. Re-entering name selection...")
                     self.log_message("Error: Client name already in use. Restarting name entry...")
@@ -590,27 +724,38 @@ class ClientApp:
                     if self.shutdown:  # <-- Check if shutting down
                         break
                     print ("awaiting message from server")
-                    message = self.client_socket.recv(1024)
-                    if not message:
+                    try:
+                        frame_type, message = framing.recv_frame(self.client_socket)
+                    except ConnectionError:
                         print ("server ended connection")
                         break
-                    self.handle_message(message)
+                    self.handle_message(frame_type, message)
+
+                if self.running and not self.shutdown:
+                    self.client_socket.close()
+                    self.wait_to_reconnect("Connection to the server lost")
 
 
             except Exception as e:
                 print ("error in client")
                 self.log_message(f"Error on client: {e}")
                 self.client_socket = None  # Ensure socket is reset on failure
+                if self.running and not self.shutdown:
+                    self.wait_to_reconnect("Reconnecting")
             
             finally:
-                if self.name_accepted == True:
-                    if self.client_socket:  # Only clean up if a valid connection was made
-                        if self.running:
-                            self.cleanup(confirm=False) #confirm=True
-                else:
+                if self.name_accepted == False:
                     print("name didnt accepted")
                     break
 
+    def wait_to_reconnect(self, reason):
+        # jittered exponential backoff, so the whole class does not reconnect in the same instant
+        self.incoming_file = None
+        self.offered_file = None
+        delay = self.connector.backoff.next_delay()
+        self.log_message(f"{reason}, reconnecting in {delay:.1f} s...")
+        time.sleep(delay)
+
 
     def cleanup(self, confirm=True):
         # cleanning up the client and closing
@@ -621,7 +766,8 @@ class ClientApp:
         try:
             msg = f"shutting down - {self.client_name}"
             print("msg- ", msg)              
-            self.client_socket.sendall(msg.encode())
+            with self.socket_lock:
+                framing.send_text(self.client_socket, msg)
             print("Cleaning up before exit...")
             self.running = False
             self.shutdown = True  # <-- Set shutdown flag
@@ -0,0 +1,111 @@
+# registry of the connected clients
+
+"""
+ClientRegistry is the single place that knows which clients are connected.
+Every client is one ClientRecord, reachable by its stream writer, its name
+(case-insensitive, like the admin types it) and its IP. All indexes are
+updated together on add / remove so they cannot drift apart, and every lookup
+is a dictionary access whatever the size of the class.
+"""
+
+import time
+
+
+class ClientRecord:
+    """One connected client."""
+
+    __slots__ = ("writer", "name", "ip", "sender", "upload", "offer", "last_seen", "screen")
+
+    def __init__(self, writer, name, ip, sender, upload):
+        self.writer = writer
+        self.name = name
+        self.ip = ip
+        self.sender = sender  # ClientSender, all frames to the client
+        self.upload = upload  # ScreenshotUpload in progress
+        self.offer = None  # (digest, future) while the client is asked for a file
+        self.last_seen = time.monotonic()  # when the last frame from the client arrived
+        self.screen = None  # TileHistory of the live view, once the client sent a screen delta
+
+
+class ClientRegistry:
+    def __init__(self):
+        self.by_writer = {}  # writer -> ClientRecord
+        self.by_name = {}  # casefolded name -> ClientRecord
+        self.by_ip = {}  # IP -> {writer: ClientRecord}, in connection order
+        self.all_records = None  # cached list of every record, rebuilt after a change
+        self.rendered_list = None  # cached CLIENTLIST reply, rebuilt after a change
+
+    def __len__(self):
+        return len(self.by_writer)
+
+    def __contains__(self, writer):
+        return writer in self.by_writer
+
+    def __iter__(self):
+        return iter(self.records())
+
+    def get(self, writer):
+        return self.by_writer.get(writer)
+
+    def find_name(self, name):
+        return self.by_name.get(name.casefold())
+
+    def name_in_use(self, name):
+        return name.casefold() in self.by_name
+
+    def names_for_ip(self, ip):
+        return [record.name for record in self.by_ip.get(ip, {}).values()]
+
+    def add(self, record):
+        self.by_writer[record.writer] = record
+        self.by_name[record.name.casefold()] = record
+        self.by_ip.setdefault(record.ip, {})[record.writer] = record
+        self.changed()
+
+    def remove(self, writer):
+        """Remove a client from every index, returns its record or None if it was not registered."""
+        record = self.by_writer.pop(writer, None)
+        if record is None:
+            return None
+        if self.by_name.get(record.name.casefold()) is record:
+            del self.by_name[record.name.casefold()]
+        same_ip = self.by_ip.get(record.ip)
+        if same_ip is not None:
+            same_ip.pop(writer, None)
+            if not same_ip:
+                del self.by_ip[record.ip]
+        self.changed()
+        return record
+
+    def changed(self):
+        self.all_records = None
+        self.rendered_list = None
+
+    def records(self):
+        if self.all_records is None:
+            self.all_records = list(self.by_writer.values())
+        return self.all_records
+
+    def resolve(self, target):
+        """
+        Return the records matching an admin target, or None if nothing matches.
+        - "all" or "*": every client
+        - a client name (any case)
+        - an IP: every client connected from it
+        """
+        target = target.casefold()
+        if target == "all" or target == "*":
+            return self.records()
+        record = self.by_name.get(target)
+        if record is not None:
+            return [record]
+        same_ip = self.by_ip.get(target)
+        if same_ip:
+            return list(same_ip.values())
+        return None
+
+    def client_list(self):
+        """The CLIENTLIST reply: "name (ip), name (ip), ..." or "empty"."""
+        if self.rendered_list is None:
+            self.rendered_list = ", ".join(f"{record.name} ({record.ip})" for record in self.by_writer.values()) or "empty"
+        return self.rendered_list
@@ -0,0 +1,157 @@
+# database code
+
+from datetime import datetime
+from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy import create_engine, event, text, Boolean, Column, Integer, Float, String, Text, LargeBinary, DateTime
+
+
+# SQLite settings of every connection: with the write-ahead log a commit appends to
+# students.db-wal instead of rewriting pages and a journal, and synchronous=NORMAL
+# syncs the log at checkpoints instead of at every commit (a power cut may lose the
+# last commits, the database stays consistent)
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",  # ms to wait for another writer instead of failing at once
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",  # KB of page cache
+)
+
+
+def make_engine(url="sqlite:///students.db", echo=False, pragmas=PRAGMAS):
+    """An engine for url, echo=True logs every SQL statement to stdout."""
+    db_engine = create_engine(url, echo=echo)
+    if url.startswith("sqlite"):
+        @event.listens_for(db_engine, "connect")
+        def tune_sqlite(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+    return db_engine
+
+
+# --- Database Setup ---
+# Set up a SQLite database to log student test submissions
+engine = make_engine()
+class Base(DeclarativeBase):
+    pass  #Base = declarative_base()
+
+# Table to store grades
+class Student(Base):
+    __tablename__ = 'students'
+    id = Column(Integer, primary_key=True, autoincrement=True, unique=True)
+    name = Column(String(15), nullable=False, index=True)
+    date_time = Column(DateTime, default=datetime.utcnow, index=True)
+    grade = Column(Integer, nullable=False)
+
+
+# Table of the screenshots saved by the server (see screenshot_store.py)
+class Screenshot(Base):
+    __tablename__ = 'screenshots'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    client = Column(String(64), nullable=False, index=True)  # upper case, like in the file name
+    taken = Column(DateTime, nullable=False)
+    path = Column(String(255), nullable=False, unique=True)
+    size = Column(Integer, nullable=False)
+    sha256 = Column(String(64), nullable=False)
+
+
+# Running totals of the grades of a student, and of the whole class in the row
+# with whole_class set (and an empty name), updated with every batch of grades
+# inserted (see grade_stats.py)
+class GradeStat(Base):
+    __tablename__ = 'grade_stats'
+    name = Column(String(15), primary_key=True)
+    whole_class = Column(Boolean, primary_key=True)  # the class row, apart from the students whatever their names
+    count = Column(Integer, nullable=False)
+    total = Column(Float, nullable=False)  # sum of the grades
+    squares = Column(Float, nullable=False)  # sum of the squared grades
+    low = Column(Float, nullable=False)
+    high = Column(Float, nullable=False)
+    dated = Column(Integer, nullable=False)  # grades with a date, the trend is fitted on them
+    dated_grades = Column(Float, nullable=False)  # sum of the grades with a date
+    days = Column(Float, nullable=False)  # sums of d, d*d and d*grade, d = days since grade_stats.EPOCH
+    days_squares = Column(Float, nullable=False)
+    days_grades = Column(Float, nullable=False)
+
+
+# Histogram of the grades of a student (or of the class), a row per bucket that is not empty
+class GradeBucket(Base):
+    __tablename__ = 'grade_buckets'
+    name = Column(String(15), primary_key=True)
+    whole_class = Column(Boolean, primary_key=True)
+    bucket = Column(Integer, primary_key=True)  # grades 10*bucket to 10*bucket+9, 100 goes to bucket 9
+    count = Column(Integer, nullable=False)
+
+
+# The answers to the tests, a row per test holding each column of its answers
+# matrix as one array (see item_analysis.py)
+class TestAnswers(Base):
+    __tablename__ = 'test_answers'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    digest = Column(String(64), nullable=False, unique=True)  # sha256 of the test file
+    name = Column(String(255), nullable=False)  # test file name
+    questions = Column(Integer, nullable=False)
+    key = Column(LargeBinary, nullable=False)  # the right option of every question, a byte each
+    options = Column(LargeBinary, nullable=False)  # how many options every question has, a byte each
+    responses = Column(Integer, nullable=False)  # rows of the answers matrix
+    students = Column(Text, nullable=False)  # the student of every row, a line each
+    submitted = Column(LargeBinary, nullable=False)  # unix time of every row, float64
+    answers = Column(LargeBinary, nullable=False)  # responses x questions option numbers, a byte each, 0 = not answered
+
+
+def create_grade_stats(connection):
+    """Migration 2: the grade summary tables, filled from the grades already stored."""
+    from grade_stats import rebuild  # grade_stats imports the tables from here
+
+    GradeStat.__table__.create(connection, checkfirst=True)
+    GradeBucket.__table__.create(connection, checkfirst=True)
+    rebuild(connection)
+
+
+# Schema changes of students.db files made by older versions, in order. A step
+# is SQL text or a function of the connection. The number of the migrations
+# applied is kept in the file's PRAGMA user_version.
+MIGRATIONS = (
+    # 1: indexes for the GETGRADES filters (grade_query.py)
+    ("CREATE INDEX IF NOT EXISTS ix_students_name ON students (name)",
+     "CREATE INDEX IF NOT EXISTS ix_students_date_time ON students (date_time)"),
+    # 2: GRADESTATS (grade_stats.py)
+    (create_grade_stats,),
+    # 3: the answers of every test, for ITEMANALYSIS (item_analysis.py)
+    (lambda connection: TestAnswers.__table__.create(connection, checkfirst=True),),
+    # 4: the class summary rows marked by whole_class, they had the name "*" that a student can have too
+    ("DROP TABLE IF EXISTS grade_buckets", "DROP TABLE IF EXISTS grade_stats", create_grade_stats),
+)
+
+
+def migrate(db_engine=None):
+    """Apply the migrations a database file does not have yet, returns how many were applied."""
+    db_engine = db_engine if db_engine is not None else engine
+    Student.__table__.create(db_engine, checkfirst=True)
+    with db_engine.begin() as connection:
+        version = connection.exec_driver_sql("PRAGMA user_version").scalar()
+        for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            for statement in statements:
+                if callable(statement):
+                    statement(connection)
+                else:
+                    connection.execute(text(statement))
+            connection.exec_driver_sql(f"PRAGMA user_version = {number}")
+            print(f"database migrated to version {number}")
+    return max(len(MIGRATIONS) - version, 0)
+
+
+# Initialize DB session
+def init_db(echo=False):
+    # Create the table
+    #Base.metadata.create_all(engine)
+
+    engine.echo = echo  # log every SQL statement
+    migrate(engine)
+
+    # Create a session
+    Session = sessionmaker(bind=engine)
+    session = Session()
+    return session
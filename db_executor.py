@@ -0,0 +1,50 @@
+# the thread that runs every database call of the server
+
+"""
+SQLAlchemy and SQLite block: a slow query, or a commit waiting for a locked
+students.db, stalls every connection if it runs on the event loop.
+DatabaseExecutor owns the server's session and runs all the work on it on one
+worker thread, in the order it was handed in. The loop gets an asyncio future
+per call and goes on serving the sockets while the thread works.
+
+Every call is a function taking the session as its first argument. It must
+return plain values (tuples, numbers, strings), not ORM objects, since those
+belong to the session of the DB thread.
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DatabaseExecutor:
+    def __init__(self, session):
+        self.session = session  # only used on the DB thread from here on
+        self.thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+        self.calls = 0
+        self.busy = 0.0  # seconds the thread spent in calls
+
+    def run(self, function, *args, **kwargs):
+        """Run function(session, *args, **kwargs) on the DB thread, returns an asyncio future of its result."""
+        self.calls += 1
+        return asyncio.get_running_loop().run_in_executor(self.thread, self.timed, function, args, kwargs)
+
+    def call(self, function, *args, **kwargs):
+        """Run function(session, ...) on the DB thread and wait for its result, for startup code outside the event loop."""
+        self.calls += 1
+        return self.thread.submit(self.timed, function, args, kwargs).result()
+
+    def timed(self, function, args, kwargs):
+        start = time.perf_counter()
+        try:
+            return function(self.session, *args, **kwargs)
+        finally:
+            self.busy += time.perf_counter() - start
+
+    def close(self):
+        """Finish the calls handed in so far, close the session and stop the thread. Blocks until then."""
+        self.thread.submit(self.session.close)
+        self.thread.shutdown(wait=True)
+
+    def summary(self):
+        return f"database: {self.calls} calls, {self.busy * 1000:.0f} ms on the DB thread"
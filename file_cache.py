@@ -0,0 +1,111 @@
+# content-addressed store of the files the admin hands out
+
+import hashlib
+import os
+from collections import OrderedDict
+
+
+class CacheEntryWriter:
+    """Writes one file into the cache while it is being relayed, it only becomes visible after commit()."""
+
+    def __init__(self, cache, digest, size):
+        self.cache = cache
+        self.digest = digest
+        self.size = size
+        self.checksum = hashlib.sha256()
+        self.temp_path = cache.path(digest) + ".part"
+        self.file = open(self.temp_path, "wb")
+
+    def write(self, chunk):
+        self.checksum.update(chunk)
+        self.file.write(chunk)
+
+    def commit(self):
+        """Add the file to the cache, returns False if the content does not match the offered hash."""
+        self.file.close()
+        if self.checksum.digest() != self.digest:
+            os.remove(self.temp_path)
+            return False
+        os.replace(self.temp_path, self.cache.path(self.digest))
+        self.cache.add(self.digest, self.size)
+        return True
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+class FileCache:
+    """
+    Files keyed by the sha256 of their content, kept in one directory on disk.
+    A handout that was already uploaded once (the same test for the next class)
+    is found by its hash, so the admin does not have to upload it again.
+    The total size is bounded, the least recently used files are evicted first.
+    """
+
+    def __init__(self, directory="file_cache", max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # digest -> size, least recently used first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self.load()
+
+    def load(self):
+        """Index the files left over from the last run, oldest first."""
+        files = []
+        for file_name in os.listdir(self.directory):
+            path = os.path.join(self.directory, file_name)
+            if file_name.endswith(".part"):
+                os.remove(path)  # an upload that never finished
+                continue
+            try:
+                digest = bytes.fromhex(file_name)
+            except ValueError:
+                continue
+            files.append((os.path.getmtime(path), digest, os.path.getsize(path)))
+        for _, digest, size in sorted(files):
+            self.entries[digest] = size
+            self.total_bytes += size
+        self.evict()
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest.hex())
+
+    def lookup(self, digest, size):
+        """Return the path of the cached file, or None if it has to be uploaded."""
+        if self.entries.get(digest) != size:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(digest)
+        os.utime(self.path(digest))  # keep the LRU order across restarts
+        self.hits += 1
+        return self.path(digest)
+
+    def writer(self, digest, size):
+        """Return a CacheEntryWriter for an upload, or None if the file is too large to be cached."""
+        if size > self.max_bytes:
+            return None
+        return CacheEntryWriter(self, digest, size)
+
+    def add(self, digest, size):
+        self.total_bytes += size - self.entries.pop(digest, 0)
+        self.entries[digest] = size
+        self.evict()
+
+    def evict(self):
+        while self.total_bytes > self.max_bytes and self.entries:
+            digest, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(self.path(digest))
+            except FileNotFoundError:
+                pass
+            print(f"file cache: evicted {digest.hex()[:12]} ({size} bytes)")
+
+    def summary(self):
+        return (f"files: {len(self.entries)}, {self.total_bytes} of {self.max_bytes} bytes, "
+                f"hits: {self.hits}, misses: {self.misses}")
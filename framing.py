@@ -0,0 +1,328 @@
+# framing protocol shared by the server, client and admin
+
+import lzma
+import struct
+import zlib
+
+"""
+Every message on every socket is sent as one frame:
+
+    magic (2 bytes) | type (1 byte) | flags (1 byte) | payload length (4 bytes) | payload
+
+The receiver reads the 8 byte header, then exactly `length` payload bytes into a
+buffer allocated once for the whole payload, so no marker has to be searched for
+and large screenshots and files are received in linear time.
+
+Text, files and file chunks may be compressed (zlib or lzma, marked in the
+flags byte). Each side announces the codecs it can decode with a COMPRESS frame
+when it connects and the sender only compresses for a peer that announced one.
+Small payloads and payloads that are already compressed (PNG, JPEG, docx...)
+are sent as they are. Receivers decompress transparently in recv_frame / read_frame.
+"""
+
+MAGIC = b"YB"
+HEADER = struct.Struct("!2sBBI")  # magic, type, flags, payload length
+HEADER_SIZE = HEADER.size
+MAX_PAYLOAD = 256 * 1024 * 1024  # refuse frames above 256 MB
+RECV_CHUNK = 64 * 1024
+
+# Frame types
+TEXT = 1       # commands, replies and notifications (utf-8 text)
+FILE = 2       # a file: name length (2 bytes) | name | content
+PIC_BEGIN = 3  # a client starts a screenshot upload, fields: size=<bytes>
+PIC_CHUNK = 4  # the next part of the screenshot
+PIC_END = 5    # the screenshot upload is complete
+FILE_BEGIN = 6  # a streamed file starts: size (8 bytes) | name
+FILE_CHUNK = 7  # the next part of the streamed file
+FILE_END = 8    # the streamed file is complete
+FILE_ABORT = 9  # the streamed file was cut off, drop what was received
+FILE_OFFER = 10  # the admin offers a file by its content: sha256 (32 bytes) | size (8 bytes) | name
+FILE_HAVE = 11   # the server already has the offered content, no upload follows
+FILE_NEED = 12   # the server does not have it, the admin streams FILE_BEGIN / FILE_CHUNK... / FILE_END
+PING = 13  # the server checks an idle client, no payload
+PONG = 14  # the client's answer to PING
+COMPRESS = 15  # the codecs the sender can decode, e.g. b"zlib lzma", sent once after connecting
+SCREEN_DELTA = 16  # live view: the tiles of a client's screen that changed (tile_delta), to the admin as name length (2 bytes) | name | delta
+GRADE_ROWS = 17  # the next rows of a GETGRADES page, one grade per line (utf-8 text)
+GRADE_END = 18   # the GETGRADES page is complete, fields: rows=<count> next=<before= of the next page, 0 if none>
+TEST_RESPONSES = 19  # a client finished a test: sha256 of the test file (32 bytes) | questions (2 bytes) |
+                     # answers | key | options (a byte per question each, answer 0 = not answered) | test file name
+
+# Flags
+FLAG_ZLIB = 0x01  # the payload is zlib compressed
+FLAG_LZMA = 0x02  # the payload is lzma (xz) compressed
+
+FILE_NAME = struct.Struct("!H")
+FILE_SIZE = struct.Struct("!Q")
+QUESTIONS = struct.Struct("!H")  # question count of a TEST_RESPONSES payload
+MAX_QUESTIONS = 0xFFFF
+DIGEST_SIZE = 32  # sha256
+CHUNK_SIZE = 256 * 1024  # payload size of PIC_CHUNK / FILE_CHUNK frames
+
+# Compression
+CODECS = {"zlib": FLAG_ZLIB, "lzma": FLAG_LZMA}
+PREFERRED_CODECS = ("zlib", "lzma")  # we decode all of them and send with the first one the peer decodes
+COMPRESSIBLE = {TEXT, FILE, FILE_CHUNK, GRADE_ROWS}  # screenshots are PNG already, control frames are tiny
+COMPRESS_MIN = 1024  # smaller payloads are sent as they are
+ZLIB_LEVEL = 6
+LZMA_PRESET = 1  # higher presets are several times slower for a few percent
+COMPRESSED_MAGIC = (b"\x89PNG", b"\xff\xd8\xff", b"GIF8", b"RIFF", b"PK\x03\x04", b"\x1f\x8b", b"\xfd7zXZ", b"7z\xbc\xaf")
+SAMPLE_SIZE = 4096  # bytes test-compressed to recognize data without a known magic
+
+
+class FrameError(Exception):
+    """Raised when the peer sends bytes that are not a valid frame."""
+
+
+def pack_header(frame_type, length, flags=0):
+    if length > MAX_PAYLOAD:
+        raise FrameError(f"frame payload too large: {length} bytes")
+    return HEADER.pack(MAGIC, frame_type, flags, length)
+
+
+def unpack_header(header):
+    magic, frame_type, flags, length = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise FrameError(f"bad frame magic {bytes(magic)!r}")
+    if length > MAX_PAYLOAD:
+        raise FrameError(f"frame payload too large: {length} bytes")
+    return frame_type, flags, length
+
+
+def codec_offer(preferred=PREFERRED_CODECS):
+    """Payload of our COMPRESS frame."""
+    return " ".join(preferred).encode()
+
+
+def choose_codec(payload, preferred=PREFERRED_CODECS):
+    """The codec to send with to a peer whose COMPRESS payload is given, or None."""
+    offered = bytes(payload).decode(errors="ignore").split()
+    return next((codec for codec in preferred if codec in offered), None)
+
+
+def codec_for_flags(flags):
+    """The codec a payload with these flags was compressed with, or None."""
+    return next((codec for codec, flag in CODECS.items() if flags & flag), None)
+
+
+def incompressible(data):
+    """True for PNG, JPEG, zip (docx)... and for data of which a sample does not shrink."""
+    if bytes(data[:8]).startswith(COMPRESSED_MAGIC):
+        return True
+    sample = data[:SAMPLE_SIZE]
+    return len(zlib.compress(sample, 1)) > len(sample) * 0.9
+
+
+def compress(frame_type, parts, codec):
+    """Return (flags, parts) to send: the parts compressed with codec, or unchanged if that does not pay off."""
+    size = sum(len(part) for part in parts)
+    if codec is None or size < COMPRESS_MIN or frame_type not in COMPRESSIBLE or incompressible(parts[-1]):
+        return 0, parts
+    data = parts[0] if len(parts) == 1 else b"".join(parts)
+    if codec == "zlib":
+        packed = zlib.compress(data, ZLIB_LEVEL)
+    else:
+        packed = lzma.compress(data, preset=LZMA_PRESET)
+    if len(packed) >= size:
+        return 0, parts
+    return CODECS[codec], (packed,)
+
+
+def decompress(flags, payload):
+    if flags & FLAG_ZLIB:
+        decompressor = zlib.decompressobj()
+    elif flags & FLAG_LZMA:
+        decompressor = lzma.LZMADecompressor()
+    else:
+        return payload
+    try:
+        data = decompressor.decompress(payload, MAX_PAYLOAD)
+    except (zlib.error, lzma.LZMAError) as e:
+        raise FrameError(f"bad compressed payload: {e}")
+    if not decompressor.eof:
+        raise FrameError(f"compressed payload truncated or larger than {MAX_PAYLOAD} bytes")
+    return data
+
+
+class EncodedFrame:
+    """
+    One frame going to many peers. It is encoded once per codec the peers use
+    and the payload parts are shared read-only, nothing is copied per peer.
+    """
+
+    def __init__(self, frame_type, *parts):
+        self.frame_type = frame_type
+        self.parts = tuple(memoryview(part).toreadonly() for part in parts)
+        self.encodings = {}  # codec -> (header, parts)
+
+    def add_encoding(self, codec, flags, payload):
+        """Use a payload that arrived compressed with codec as it is for peers of that codec."""
+        self.encodings[codec] = (pack_header(self.frame_type, len(payload), flags), (memoryview(payload).toreadonly(),))
+
+    def encode(self, codec=None):
+        """Return (header, parts) for a peer that decodes codec."""
+        encoding = self.encodings.get(codec)
+        if encoding is None:
+            flags, parts = compress(self.frame_type, self.parts, codec)
+            encoding = (pack_header(self.frame_type, sum(len(part) for part in parts), flags), parts)
+            self.encodings[codec] = encoding
+        return encoding
+
+
+def file_parts(file_name, data):
+    """Return the parts of a FILE payload, to be passed to send_frame / write_frame."""
+    name = file_name.encode()
+    return FILE_NAME.pack(len(name)), name, data
+
+
+def pack_file_begin(file_name, size):
+    return FILE_SIZE.pack(size) + file_name.encode()
+
+
+def unpack_file_begin(payload):
+    """Return (file name, size) of a FILE_BEGIN payload."""
+    if len(payload) < FILE_SIZE.size:
+        raise FrameError("file begin too short")
+    (size,) = FILE_SIZE.unpack_from(payload)
+    try:
+        return bytes(payload[FILE_SIZE.size:]).decode(), size
+    except UnicodeDecodeError as e:
+        raise FrameError(f"bad file name: {e}")
+
+
+def pack_file_offer(digest, file_name, size):
+    return digest + FILE_SIZE.pack(size) + file_name.encode()
+
+
+def unpack_file_offer(payload):
+    """Return (digest, file name, size) of a FILE_OFFER payload."""
+    if len(payload) < DIGEST_SIZE + FILE_SIZE.size:
+        raise FrameError("file offer too short")
+    digest = bytes(payload[:DIGEST_SIZE])
+    file_name, size = unpack_file_begin(memoryview(payload)[DIGEST_SIZE:])
+    return digest, file_name, size
+
+
+def pack_test_responses(digest, file_name, answers, key, options):
+    """
+    answers, key and options are sequences of option numbers (0-255), one per
+    question. Raises FrameError if they do not fit the frame.
+    """
+    questions = len(answers)
+    if not questions == len(key) == len(options):
+        raise FrameError(f"{questions} answers, {len(key)} keys and {len(options)} option counts")
+    if questions > MAX_QUESTIONS:
+        raise FrameError(f"{questions} questions, at most {MAX_QUESTIONS} fit in test responses")
+    try:
+        columns = bytes(answers) + bytes(key) + bytes(options)
+    except (TypeError, ValueError) as e:
+        raise FrameError(f"test responses must be numbers 0-255: {e}")
+    return digest + QUESTIONS.pack(questions) + columns + file_name.encode()
+
+
+def unpack_test_responses(payload):
+    """Return (digest, file name, answers, key, options) of a TEST_RESPONSES payload, the last three as bytes."""
+    if len(payload) < DIGEST_SIZE + QUESTIONS.size:
+        raise FrameError("test responses too short")
+    (questions,) = QUESTIONS.unpack_from(payload, DIGEST_SIZE)
+    start = DIGEST_SIZE + QUESTIONS.size
+    if len(payload) < start + 3 * questions:
+        raise FrameError(f"test responses of {questions} questions too short")
+    view = memoryview(payload)
+    answers, key, options = (bytes(view[start + i * questions:start + (i + 1) * questions]) for i in range(3))
+    return bytes(view[:DIGEST_SIZE]), bytes(view[start + 3 * questions:]).decode(), answers, key, options
+
+
+def pack_fields(**fields):
+    """Encode small key=value metadata (e.g. PIC_BEGIN) as a frame payload."""
+    return " ".join(f"{key}={value}" for key, value in fields.items()).encode()
+
+
+def unpack_fields(payload):
+    try:
+        return dict(item.split("=", 1) for item in payload.decode().split())
+    except ValueError:
+        raise FrameError(f"bad frame fields {bytes(payload)!r}")
+
+
+def unpack_file(payload):
+    """Split a FILE payload into (file name, content). The content is a memoryview, not a copy."""
+    view = memoryview(payload)
+    (name_length,) = FILE_NAME.unpack_from(view)
+    name_end = FILE_NAME.size + name_length
+    return bytes(view[FILE_NAME.size:name_end]).decode(), view[name_end:]
+
+
+# --- blocking sockets (client.py, admin.py) ---
+
+def send_frame(sock, frame_type, *parts, codec=None):
+    """Send one frame made of the given byte parts without joining them, compressed with codec if given."""
+    flags, parts = compress(frame_type, parts, codec)
+    sock.sendall(pack_header(frame_type, sum(len(part) for part in parts), flags))
+    for part in parts:
+        sock.sendall(part)
+
+
+def send_text(sock, text, codec=None):
+    send_frame(sock, TEXT, text.encode(), codec=codec)
+
+
+def recv_exact(sock, size):
+    """Read exactly size bytes into a preallocated buffer."""
+    buf = bytearray(size)
+    view = memoryview(buf)
+    pos = 0
+    while pos < size:
+        received = sock.recv_into(view[pos:], min(size - pos, RECV_CHUNK))
+        if not received:
+            raise ConnectionError("connection closed in the middle of a frame")
+        pos += received
+    return buf
+
+
+def recv_frame(sock):
+    """Read one frame and return (frame type, payload)."""
+    frame_type, flags, length = unpack_header(recv_exact(sock, HEADER_SIZE))
+    return frame_type, decompress(flags, recv_exact(sock, length))
+
+
+def recv_text(sock):
+    frame_type, payload = recv_frame(sock)
+    if frame_type != TEXT:
+        raise FrameError(f"expected a text frame, got type {frame_type}")
+    return payload.decode()
+
+
+# --- asyncio streams (async_server.py) ---
+
+def write_frame(writer, frame_type, *parts, codec=None):
+    """Queue one frame on a StreamWriter, compressed with codec if given; the caller awaits writer.drain()."""
+    flags, parts = compress(frame_type, parts, codec)
+    writer.write(pack_header(frame_type, sum(len(part) for part in parts), flags))
+    for part in parts:
+        writer.write(part)
+
+
+async def read_exact(reader, size):
+    """Read exactly size bytes from a StreamReader into a preallocated buffer."""
+    buf = bytearray(size)
+    pos = 0
+    while pos < size:
+        chunk = await reader.read(min(size - pos, RECV_CHUNK))
+        if not chunk:
+            raise ConnectionError("connection closed in the middle of a frame")
+        buf[pos:pos + len(chunk)] = chunk
+        pos += len(chunk)
+    return buf
+
+
+async def read_frame(reader):
+    """Read one frame from a StreamReader and return (frame type, payload)."""
+    frame_type, flags, payload = await read_raw_frame(reader)
+    return frame_type, decompress(flags, payload)
+
+
+async def read_raw_frame(reader):
+    """Read one frame without decompressing it, returns (frame type, flags, payload)."""
+    frame_type, flags, length = unpack_header(await reader.readexactly(HEADER_SIZE))
+    return frame_type, flags, await read_exact(reader, length)
@@ -0,0 +1,103 @@
+# GETGRADES: filtered, paginated reads of the grades table
+
+"""
+GETGRADES reads one page of grades, newest first:
+
+    GETGRADES [name=<student>] [from=YYYY-MM-DD] [to=YYYY-MM-DD] [before=<id>] [limit=<rows>]
+
+Pages are keyset paginated on the row id: the reply ends with the id to pass
+as before= for the next (older) page, so a page costs an index walk of limit
+rows wherever it starts, never an OFFSET scan over the rows before it. The
+name and date filters are served by the indexes on students.name and
+students.date_time (database.MIGRATIONS).
+
+The server streams a page as GRADE_ROWS frames of ROWS_PER_FRAME lines and a
+GRADE_END frame with the row count and the next cursor.
+"""
+
+import shlex
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from database import Student
+
+PAGE_SIZE = 200  # rows of a page when the admin does not ask for a limit
+MAX_PAGE_SIZE = 5000
+ROWS_PER_FRAME = 100
+
+
+class GradeQuery:
+    __slots__ = ("name", "start", "end", "before", "limit")
+
+    def __init__(self, name=None, start=None, end=None, before=None, limit=PAGE_SIZE):
+        self.name = name  # upper case, as save_grade stores it
+        self.start = start  # date_time >= start
+        self.end = end  # date_time < end
+        self.before = before  # id < before, the cursor of the previous page
+        self.limit = limit
+
+    @classmethod
+    def parse(cls, args):
+        """A query from the arguments of GETGRADES, raises ValueError with a message for the admin if they are not valid."""
+        query = cls()
+        try:
+            tokens = shlex.split(args)  # name="dan cohen"
+        except ValueError as e:
+            raise ValueError(f"GETGRADES arguments: {e}")
+        for token in tokens:
+            key, _, value = token.partition("=")
+            if not value:
+                raise ValueError(f"GETGRADES arguments look like key=value, not {token!r}")
+            if key == "name":
+                query.name = value.upper()
+            elif key in ("from", "to"):
+                try:
+                    day = datetime.strptime(value, "%Y-%m-%d")
+                except ValueError:
+                    raise ValueError(f"GETGRADES {key}= must be a date like 2026-03-01, not {value!r}")
+                if key == "from":
+                    query.start = day
+                else:
+                    query.end = day + timedelta(days=1)  # the whole last day
+            elif key in ("before", "limit"):
+                if not value.isdigit() or int(value) < 1:
+                    raise ValueError(f"GETGRADES {key}= must be a positive number, not {value!r}")
+                setattr(query, key, int(value))
+            else:
+                raise ValueError(f"unknown GETGRADES filter {key!r}, use name=, from=, to=, before= or limit=")
+        query.limit = min(query.limit, MAX_PAGE_SIZE)
+        return query
+
+    def statement(self):
+        table = Student.__table__
+        statement = select(table.c.id, table.c.name, table.c.date_time, table.c.grade)
+        if self.name is not None:
+            statement = statement.where(table.c.name == self.name)
+        if self.start is not None:
+            statement = statement.where(table.c.date_time >= self.start)
+        if self.end is not None:
+            statement = statement.where(table.c.date_time < self.end)
+        if self.before is not None:
+            statement = statement.where(table.c.id < self.before)
+        return statement.order_by(table.c.id.desc()).limit(self.limit + 1)  # one more tells if there is a next page
+
+
+def read_page(session, query):
+    """
+    (rows, cursor of the next page or None) for a query. Runs on the DB
+    thread, holds one page in memory whatever the size of the table.
+    """
+    try:
+        rows = session.execute(query.statement()).all()
+    finally:
+        session.rollback()  # end the read transaction
+    if len(rows) > query.limit:
+        return rows[:query.limit], rows[query.limit - 1][0]
+    return rows, None
+
+
+def format_rows(rows):
+    return "\n".join(f"ID: {row_id}, Name: {name}, Date: {date_time:%Y-%m-%d %H:%M}, Grade: {grade}" if date_time else
+                     f"ID: {row_id}, Name: {name}, Grade: {grade}"
+                     for row_id, name, date_time, grade in rows)
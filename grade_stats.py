@@ -0,0 +1,249 @@
+# GRADESTATS: grade statistics kept up to date with every grade inserted
+
+"""
+The grade_stats table holds running sums for every student, and for the whole
+class in a row of its own (whole_class set, so no student name can be taken
+for it). The sums are the count, the sum and the sum of
+squares of the grades, the lowest and highest grade, and the sums of a
+least-squares line of grade against time (the trend). grade_buckets holds
+the grades histogram.
+
+insert_grades (grade_writer.py) folds every batch of grades into these sums in
+the same transaction as the rows themselves, so GRADESTATS reads one summary
+row and at most BUCKETS bucket rows however long the grades history is.
+rebuild() computes the sums from the whole students table with NumPy. The
+migration that creates the tables uses it (database.MIGRATIONS).
+
+Grades that are not numbers are left out of the statistics: the grade column
+keeps whatever text a GRADE command had.
+"""
+
+import math
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database import GradeBucket, GradeStat
+
+CLASS = None  # stands for the whole class where a student's name goes, its rows are marked by whole_class
+BUCKETS = 10  # histogram buckets of 10 points, 100 is in the last one
+EPOCH = datetime(2000, 1, 1)  # trend sums count days from here, small enough to keep the squares exact in a float
+MIN_SPREAD = 1.0  # days: grades closer together than that have no trend
+BAR = 30  # characters of the longest histogram bar
+FETCH = 65536  # rows read at a time by rebuild()
+
+
+class Totals:
+    """The sums of one student (or the class) for a batch of grades."""
+    __slots__ = ("count", "total", "squares", "low", "high", "dated", "dated_grades", "days", "days_squares",
+                 "days_grades", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = self.squares = 0.0
+        self.low = math.inf
+        self.high = -math.inf
+        self.dated = 0
+        self.dated_grades = self.days = self.days_squares = self.days_grades = 0.0
+        self.buckets = [0] * BUCKETS
+
+    def add(self, grade, date_time):
+        self.count += 1
+        self.total += grade
+        self.squares += grade * grade
+        self.low = min(self.low, grade)
+        self.high = max(self.high, grade)
+        self.buckets[bucket_of(grade)] += 1
+        if date_time is not None:
+            days = (date_time - EPOCH).total_seconds() / 86400
+            self.dated += 1
+            self.dated_grades += grade
+            self.days += days
+            self.days_squares += days * days
+            self.days_grades += days * grade
+
+    def row(self, name):
+        return {**key_columns(name), "count": self.count, "total": self.total, "squares": self.squares, "low": self.low,
+                "high": self.high, "dated": self.dated, "dated_grades": self.dated_grades, "days": self.days,
+                "days_squares": self.days_squares, "days_grades": self.days_grades}
+
+
+def as_number(grade):
+    """The grade as a float, None if it is not a number."""
+    try:
+        grade = float(grade)
+    except (TypeError, ValueError):
+        return None
+    return grade if math.isfinite(grade) else None
+
+
+def key_columns(name):
+    """The key columns of the summary rows of a student, or of the class for CLASS."""
+    return {"name": "", "whole_class": True} if name is CLASS else {"name": name, "whole_class": False}
+
+
+def bucket_of(grade):
+    return min(max(int(grade // 10), 0), BUCKETS - 1)
+
+
+def upsert(table, key, merged):
+    """INSERT of new rows that adds to the row with the same key when there is one (SQLite upsert)."""
+    statement = sqlite_insert(table)
+    return statement.on_conflict_do_update(index_elements=key, set_=merged(table.c, statement.excluded))
+
+
+def merged_stats(old, new):
+    """The columns of a summary row after a batch: the sums add up, the extremes are kept."""
+    columns = {column.name: column + new[column.name] for column in old if not column.primary_key}
+    columns["low"] = func.min(old.low, new.low)
+    columns["high"] = func.max(old.high, new.high)
+    return columns
+
+
+# a batch is added to the summary rows by two executemany statements, without reading them first
+UPSERT_STATS = upsert(GradeStat.__table__, ["name", "whole_class"], merged_stats)
+UPSERT_BUCKETS = upsert(GradeBucket.__table__, ["name", "whole_class", "bucket"],
+                        lambda old, new: {"count": old.count + new.count})
+
+
+def add_to_stats(session, rows):
+    """
+    Fold a batch of new students rows (dicts of name, grade, date_time) into
+    the summary tables, in the caller's transaction. Runs on the DB thread.
+    """
+    batch = {}
+    for row in rows:
+        grade = as_number(row["grade"])
+        if grade is None:
+            continue
+        for name in (row["name"], CLASS):
+            totals = batch.get(name)
+            if totals is None:
+                totals = batch[name] = Totals()
+            totals.add(grade, row.get("date_time"))
+    if not batch:
+        return
+    session.execute(UPSERT_STATS, [totals.row(name) for name, totals in batch.items()])
+    session.execute(UPSERT_BUCKETS, [{**key_columns(name), "bucket": number, "count": count}
+                                     for name, totals in batch.items() for number, count in enumerate(totals.buckets) if count])
+
+
+def rebuild(connection):
+    """Compute the summary tables again from the whole students table, vectorized with NumPy."""
+    # the sqlite3 cursor of the connection: plain tuples, read FETCH rows at a time into arrays
+    cursor = connection.connection.driver_connection.execute(
+        "SELECT name, grade, julianday(date_time) - julianday(?) FROM students "
+        "WHERE typeof(grade) IN ('integer', 'real')", (f"{EPOCH:%Y-%m-%d}",))
+    names, grades, days = [], [], []
+    while rows := cursor.fetchmany(FETCH):
+        columns = list(zip(*rows))
+        names.append(np.array(columns[0]))
+        grades.append(np.array(columns[1], float))
+        days.append(np.array(columns[2], float))  # NULL dates are NaN
+    cursor.close()
+    connection.execute(delete(GradeStat))
+    connection.execute(delete(GradeBucket))
+    if not names:
+        return 0
+    keys, student = np.unique(np.concatenate(names), return_inverse=True)
+    grades = np.concatenate(grades)
+    days = np.concatenate(days)
+    students = len(keys)
+
+    def sums(weights=None, where=slice(None)):
+        return np.bincount(student[where], None if weights is None else weights[where], students)
+
+    dated = ~np.isnan(days)
+    order = np.argsort(student, kind="stable")
+    starts = np.searchsorted(student[order], np.arange(students))
+    columns = {
+        "count": sums(),
+        "total": sums(grades),
+        "squares": sums(grades * grades),
+        "low": np.minimum.reduceat(grades[order], starts),
+        "high": np.maximum.reduceat(grades[order], starts),
+        "dated": sums(where=dated),
+        "dated_grades": sums(grades, dated),
+        "days": sums(days, dated),
+        "days_squares": sums(days * days, dated),
+        "days_grades": sums(days * grades, dated),
+    }
+    histogram = np.bincount(student * BUCKETS + np.clip(grades // 10, 0, BUCKETS - 1).astype(np.intp),
+                            minlength=students * BUCKETS).reshape(students, BUCKETS)
+
+    # the class row: the sums of the students, and the extremes of their extremes
+    keys = keys.tolist() + [CLASS]
+    for column, values in columns.items():
+        whole = values.min() if column == "low" else values.max() if column == "high" else values.sum()
+        columns[column] = values.tolist() + [whole.item()]
+    histogram = np.vstack([histogram, histogram.sum(axis=0)])
+
+    connection.execute(insert(GradeStat), [dict(zip(columns, values), **key_columns(name))
+                                           for name, values in zip(keys, zip(*columns.values()))])
+    filled = np.argwhere(histogram)
+    connection.execute(insert(GradeBucket), [{**key_columns(keys[row]), "bucket": int(bucket),
+                                              "count": int(histogram[row, bucket])} for row, bucket in filled])
+    return len(grades)
+
+
+def parse_name(args):
+    """The student of "GRADESTATS [name=<student>]", None for the whole class. Raises ValueError with a message for the admin."""
+    if not args:
+        return None
+    key, _, value = args.partition("=")
+    if key != "name" or not value or " " in value:
+        raise ValueError(f"use GRADESTATS or GRADESTATS name=<student>, not {args!r}")
+    return value.upper()
+
+
+def read_stats(session, name=None):
+    """
+    (summaries, histogram) for a student, or for the class followed by every
+    student when name is None. A summary is a tuple of the GradeStat columns,
+    the histogram has the bucket counts of the first summary. Runs on the DB thread.
+    """
+    table = GradeStat.__table__
+    try:
+        if name is None:
+            summaries = session.execute(select(table).order_by(table.c.whole_class.desc(), table.c.name)).all()
+        else:
+            summaries = session.execute(select(table).where(table.c.name == name, ~table.c.whole_class)).all()
+        histogram = [0] * BUCKETS
+        if summaries:
+            for number, count in session.execute(select(GradeBucket.bucket, GradeBucket.count)
+                                                 .where(GradeBucket.name == summaries[0].name,
+                                                        GradeBucket.whole_class == summaries[0].whole_class)):
+                histogram[number] = count
+    finally:
+        session.rollback()  # end the read transaction
+    return [tuple(summary) for summary in summaries], histogram
+
+
+def describe(summary):
+    """One line of statistics for a summary tuple of read_stats."""
+    name, whole_class, count, total, squares, low, high, dated, dated_grades, days, days_squares, days_grades = summary
+    average = total / count
+    deviation = math.sqrt(max(squares / count - average * average, 0.0))
+    line = (f"{'class' if whole_class else name}: {count} grades, average {average:.1f}, deviation {deviation:.1f}, "
+            f"lowest {low:g}, highest {high:g}")
+    spread = dated * days_squares - days * days  # dated squared times the variance of the days
+    if dated > 1 and spread > dated * dated * MIN_SPREAD * MIN_SPREAD:
+        slope = (dated * days_grades - days * dated_grades) / spread  # points a day
+        line += f", trend {slope * 7:+.2f} a week"
+    return line
+
+
+def format_stats(summaries, histogram):
+    if not summaries:
+        return "No grades data available."
+    lines = [describe(summaries[0])]
+    largest = max(histogram) or 1
+    for number, count in enumerate(histogram):
+        top = 100 if number == BUCKETS - 1 else number * 10 + 9
+        lines.append(f"  {number * 10:3d}-{top:<3d} {'#' * round(count * BAR / largest):<{BAR}} {count}")
+    if len(summaries) > 1:
+        lines.append("students:")
+        lines.extend(describe(summary) for summary in summaries[1:])
+    return "\n".join(lines)
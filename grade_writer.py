@@ -0,0 +1,122 @@
+# write-behind batching of the grades stored in the database
+
+"""
+A GRADE command used to insert its row and commit at once, a disk sync per
+grade on the event loop. GradeWriter queues the rows instead and writes them
+in one transaction on the DB thread (db_executor.py) when max_batch rows are
+waiting or flush_interval seconds after the first one, so when the admin
+grades a whole class after a test the rows reach the disk together.
+
+Rows are stamped with the time the grade was given, not the time of the
+flush. Whatever reads the students table flushes first (GETGRADES), and the
+server flushes on shutdown, so a queued grade is only lost if the process dies
+within flush_interval.
+
+A batch that fails to commit goes back to the queue and is tried again after
+a delay that doubles with every failure in a row, up to max_retry_delay. Grades
+that still cannot be written when the server stops are logged, a line each, so
+they can be entered again.
+"""
+
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from database import Student
+from grade_stats import add_to_stats
+
+
+class GradeWriter:
+    def __init__(self, database, max_batch=100, flush_interval=0.25, max_retry_delay=30.0):
+        self.database = database  # DatabaseExecutor
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval  # seconds a grade may wait for more to share its transaction
+        self.max_retry_delay = max_retry_delay  # seconds between the tries of a batch that keeps failing
+        self.pending = []  # rows not written yet, oldest first
+        self.timer = None  # TimerHandle of the next flush
+        self.failed_in_row = 0  # failed flushes since the last one that was written
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, name, grade):
+        """Queue a grade, it is written with the next batch."""
+        self.pending.append({"name": name, "grade": grade, "date_time": datetime.utcnow()})
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.flush_interval, self.flush)
+
+    def flush(self):
+        """
+        Hand every queued grade to the DB thread as one transaction. Returns a
+        future of the number of rows written, calls made after it see them.
+        """
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        done = asyncio.get_running_loop().create_future()
+        if not self.pending:
+            done.set_result(0)
+            return done
+        rows, self.pending = self.pending, []
+        if self.database is None:
+            print(f"[ERROR] No database, {len(rows)} grades were not saved")
+            done.set_result(0)
+            return done
+        write = self.database.run(insert_grades, rows)
+        write.add_done_callback(lambda future: self.written_batch(future, rows, done))
+        return done
+
+    def written_batch(self, future, rows, done):
+        error = future.exception() if not future.cancelled() else None
+        if future.cancelled() or error is not None:
+            self.failures += 1
+            self.failed_in_row += 1
+            self.pending = rows + self.pending
+            delay = min(self.flush_interval * 2 ** self.failed_in_row, self.max_retry_delay)
+            print(f"[ERROR] Saving {len(rows)} grades failed, retrying in {delay:.1f} s: {error}")
+            if self.timer is not None:
+                self.timer.cancel()  # a grade queued meanwhile waits for the retry too
+            self.timer = asyncio.get_running_loop().call_later(delay, self.flush)
+            done.set_result(0)
+            return
+        self.failed_in_row = 0
+        self.written += len(rows)
+        self.batches += 1
+        done.set_result(len(rows))
+
+    async def close(self):
+        """Write what is still queued, the server is stopping. Logs every grade that could not be written."""
+        await self.flush()
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.pending:
+            print(f"[ERROR] {len(self.pending)} grades could not be saved and are lost:")
+            for row in self.pending:
+                print(f"[ERROR]   {row['name']} {row['grade']} given {row['date_time']:%Y-%m-%d %H:%M:%S} UTC")
+            self.pending = []
+
+    def summary(self):
+        return (f"grades written: {self.written} in {self.batches} transactions, queued: {len(self.pending)}, "
+                f"failed flushes: {self.failures}")
+
+
+def insert_grades(session, rows):
+    """
+    One executemany and one commit for a batch of grades, with the update of
+    the GRADESTATS sums. Runs on the DB thread.
+    """
+    try:
+        session.execute(insert(Student), rows)
+        add_to_stats(session, rows)
+        session.commit()
+    except SQLAlchemyError:
+        session.rollback()
+        raise
@@ -0,0 +1,164 @@
+# ITEMANALYSIS: the answers of every test and the statistics of its questions
+
+"""
+A client that finishes a test sends every answer it gave (TEST_RESPONSES),
+not only its percentage. test_answers keeps a row per test: the key, the
+number of options of every question and the answers matrix, responses x
+questions, as one byte array. A submission appends a line to the matrix
+with SQL blob concatenation, so it is one statement, and a test is read back
+as one row whatever the size of the class.
+
+analyze() works on a whole matrix at once with NumPy:
+
+    difficulty      share of the students who got a question right
+    discrimination  difficulty among the best GROUP of the students (by
+                    score) minus among the worst GROUP, near 0 or below for
+                    a question that does not tell who knows the material
+    choices         how many students chose every option, 0 = not answered
+    reliability     KR-20 of the whole test
+
+A question with key 0 has no right answer (the test file did not give one):
+it is left out of the scores, and its difficulty and discrimination are NaN.
+"""
+
+import struct
+
+import numpy as np
+from sqlalchemy import LargeBinary, cast, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from database import TestAnswers
+
+GROUP = 0.27  # share of the students in the best and in the worst group
+MIN_DISCRIMINATION = 0.2  # questions below it are marked for a check
+SUBMITTED = struct.Struct("<d")  # unix time of a submission, as stored in test_answers.submitted
+
+
+class ItemAnalysis:
+    __slots__ = ("responses", "keyed", "scores", "difficulty", "discrimination", "choices", "reliability")
+
+    def __init__(self, responses, keyed, scores, difficulty, discrimination, choices, reliability):
+        self.responses = responses
+        self.keyed = keyed  # questions with a key, the ones the scores count
+        self.scores = scores  # right answers of every response
+        self.difficulty = difficulty  # per question
+        self.discrimination = discrimination  # per question
+        self.choices = choices  # questions x options + 1
+        self.reliability = reliability  # None with a single keyed question or when every score is the same
+
+
+def analyze(answers, key, options):
+    """Item analysis of a responses x questions uint8 matrix of option numbers against the key of every question."""
+    responses, questions = answers.shape
+    keyed = key > 0
+    right = (answers == key) & keyed  # an unanswered question (0) is not right when it has no key either
+    scores = right.sum(axis=1)
+    difficulty = np.where(keyed, right.mean(axis=0), np.nan)
+
+    group = max(1, round(responses * GROUP))
+    order = np.argsort(scores, kind="stable")
+    discrimination = np.where(keyed, right[order[-group:]].mean(axis=0) - right[order[:group]].mean(axis=0), np.nan)
+
+    width = int(max(options.max(), answers.max())) + 1
+    choices = np.bincount((answers + np.arange(questions) * width).ravel(),
+                          minlength=questions * width).reshape(questions, width)
+
+    counted = int(keyed.sum())
+    variance = scores.var()
+    reliability = None
+    if counted > 1 and variance > 0:
+        spread = difficulty[keyed] * (1 - difficulty[keyed])
+        reliability = counted / (counted - 1) * (1 - spread.sum() / variance)
+    return ItemAnalysis(responses, counted, scores, difficulty, discrimination, choices, reliability)
+
+
+def add_answers(session, digest, name, student, submitted, answers, key, options):
+    """
+    Append a student's answers to the matrix of a test, the first ones create
+    its row. Raises ValueError when the test stored under the digest has a
+    different number of questions. Runs on the DB thread.
+    """
+    table = TestAnswers.__table__
+    statement = sqlite_insert(table).values(digest=digest, name=name, questions=len(key), key=key, options=options,
+                                            responses=1, students=student + "\n", submitted=SUBMITTED.pack(submitted),
+                                            answers=answers)
+    new = statement.excluded
+    statement = statement.on_conflict_do_update(index_elements=["digest"], set_={
+        "responses": table.c.responses + 1,
+        "students": table.c.students.op("||")(new.students),
+        # || makes text of blobs, the cast gives the same bytes back as a blob
+        "submitted": cast(table.c.submitted.op("||")(new.submitted), LargeBinary),
+        "answers": cast(table.c.answers.op("||")(new.answers), LargeBinary),
+    }, where=table.c.questions == new.questions)  # a line of another length would shift every line after it
+    try:
+        added = session.execute(statement).rowcount
+        session.commit()
+    except SQLAlchemyError:
+        session.rollback()
+        raise
+    if not added:
+        raise ValueError(f"{len(answers)} answers of {student} to {name}, the test has a different number of questions")
+
+
+def read_tests(session, name=None):
+    """(name, questions, key, options, responses, answers) of every test, or of the tests of a file name."""
+    table = TestAnswers.__table__
+    statement = select(table.c.name, table.c.questions, table.c.key, table.c.options, table.c.responses,
+                       table.c.answers).order_by(table.c.id)
+    if name is not None:
+        statement = statement.where(table.c.name == name)
+    try:
+        return [tuple(row) for row in session.execute(statement)]
+    finally:
+        session.rollback()  # end the read transaction
+
+
+def matrix(questions, key, options, responses, answers):
+    """The NumPy arrays of a row of read_tests: answers matrix, key, options."""
+    return (np.frombuffer(answers, np.uint8).reshape(responses, questions), np.frombuffer(key, np.uint8),
+            np.frombuffer(options, np.uint8))
+
+
+def summary_line(name, questions, analysis):
+    reliability = "n/a" if analysis.reliability is None else f"{analysis.reliability:.2f}"
+    average = f"{analysis.scores.mean() / analysis.keyed * 100:.0f}%" if analysis.keyed else "n/a"
+    unkeyed = f" ({questions - analysis.keyed} without a key)" if analysis.keyed < questions else ""
+    return (f"{name}: {analysis.responses} answers, {questions} questions{unkeyed}, "
+            f"average {average}, reliability (KR-20) {reliability}")
+
+
+def question_lines(analysis, key):
+    lines = ["  Q    key  right  discrimination  choices (no answer, 1, 2, ...), * = the right one"]
+    for number, (right, discrimination, choices) in enumerate(zip(analysis.difficulty, analysis.discrimination,
+                                                                   analysis.choices)):
+        if not key[number]:  # no right answer to measure against
+            lines.append(f"  {number + 1:<4d} {'-':<4} {'-':>5}  {'-':>14}  {' '.join(str(count) for count in choices)}")
+            continue
+        counts = " ".join(f"*{count}" if option == key[number] else str(count) for option, count in enumerate(choices))
+        check = "   check" if discrimination < MIN_DISCRIMINATION else ""
+        lines.append(f"  {number + 1:<4d} {key[number]:<4d} {right:5.2f}  {discrimination:+14.2f}  {counts}{check}")
+    return lines
+
+
+def item_report(session, name=None):
+    """
+    The ITEMANALYSIS reply: a line per test, or every question of the tests
+    of a file name. Reads and analyzes on the DB thread.
+    """
+    tests = read_tests(session, name)
+    if not tests:
+        return f"No answers of {name} yet." if name else "No test answers yet."
+    lines = []
+    for test_name, questions, key, options, responses, answers in tests:
+        answers, key, options = matrix(questions, key, options, responses, answers)
+        analysis = analyze(answers, key, options)
+        lines.append(summary_line(test_name, questions, analysis))
+        if name is not None:
+            lines.extend(question_lines(analysis, key))
+    return "\n".join(lines)
+
+
+def report_answers_write(future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"[ERROR] Saving test answers failed: {future.exception()}")
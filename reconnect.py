@@ -0,0 +1,90 @@
+# client side connection to the server: TLS session reuse and retry backoff
+
+"""
+ServerConnector opens the client's TLS connection and registers the client's
+name, negotiating the compression of the frames. It keeps one SSLContext and
+the SSLSession of the last accepted connection, so a reconnect after a dropped
+connection resumes the session (no certificate exchange, no signature by the
+server) instead of running a full handshake. A server that does not know
+the session anymore (it restarted) simply answers with a full handshake.
+
+Retries wait with jittered exponential backoff, so a classroom that loses the
+server at the same moment does not come back in one synchronized storm.
+"""
+
+import random
+import socket
+import ssl
+
+import framing
+
+
+def client_ssl_context():
+    ssl_context = ssl.create_default_context()
+    ssl_context.check_hostname = False  # Disable hostname verification
+    ssl_context.verify_mode = ssl.CERT_NONE  # Don't require a trusted CA
+    return ssl_context
+
+
+class Backoff:
+    """Exponential backoff with full jitter: attempt n waits a random time in [0, min(cap, base * 2**n)]."""
+
+    def __init__(self, base=0.5, cap=30.0):
+        self.base = base
+        self.cap = cap
+        self.attempt = 0
+
+    def next_delay(self):
+        delay = random.uniform(0, min(self.cap, self.base * 2 ** self.attempt))
+        self.attempt += 1
+        return delay
+
+    def reset(self):
+        self.attempt = 0
+
+
+class ServerConnector:
+    def __init__(self, server_ip, port, connect_timeout=10.0):
+        self.server_ip = server_ip
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.ssl_context = client_ssl_context()  # sessions can only be resumed with the context that created them
+        self.session = None  # SSLSession of the last accepted connection
+        self.codec = None  # compression for frames to the server, negotiated on every connect
+        self.backoff = Backoff()
+
+    def connect(self):
+        """Open a TCP connection and run the TLS handshake, resuming the last session if there is one."""
+        sock = socket.create_connection((self.server_ip, self.port), timeout=self.connect_timeout)
+        try:
+            tls_socket = self.ssl_context.wrap_socket(sock, server_hostname=self.server_ip, session=self.session)
+        except BaseException:
+            sock.close()
+            raise
+        tls_socket.settimeout(None)
+        return tls_socket
+
+    def register(self, tls_socket, client_name):
+        """
+        Announce the codecs we decode and our name, returns the server's answer
+        ("OK" or an error). Both frames go out at once, the server answers the
+        COMPRESS frame before it answers the name.
+        """
+        framing.send_frame(tls_socket, framing.COMPRESS, framing.codec_offer())
+        framing.send_text(tls_socket, client_name)
+        frame_type, payload = framing.recv_frame(tls_socket)
+        self.codec = None
+        if frame_type == framing.COMPRESS:
+            self.codec = framing.choose_codec(payload)
+            frame_type, payload = framing.recv_frame(tls_socket)
+        if frame_type != framing.TEXT:
+            raise framing.FrameError(f"expected a text frame, got type {frame_type}")
+        return payload.decode()
+
+    def accepted(self, tls_socket):
+        """
+        The server accepted us: keep the session for the next reconnect. Call it
+        after the first reply was read, TLS 1.3 tickets arrive after the handshake.
+        """
+        self.session = tls_socket.session
+        self.backoff.reset()
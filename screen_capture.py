@@ -0,0 +1,143 @@
+# screenshot capture on the student machine
+
+"""
+A screenshot is grabbed, encoded into an in-memory buffer and streamed to the
+server straight from that buffer: PIC_BEGIN, then PIC_CHUNK frames that are
+memoryview slices of the encoded image (no copies, no temporary file), then
+PIC_END. Keeping a copy on the student's disk is opt-in.
+
+How the screen is encoded is chosen by the admin per request with an encoder
+spec such as "png level=1", "jpeg quality=70 scale=0.5" or "webp quality=60 gray"
+(see Encoder). Full quality PNG is the slowest choice by far on a whole screen.
+"""
+
+import io
+from datetime import datetime
+
+from PIL import Image
+
+import framing
+
+try:
+    import pyautogui
+except ImportError:  # only the student machines need it, the benchmarks use prepared frames
+    pyautogui = None
+
+
+WEBP_METHOD = 0  # fastest WebP effort: about 4x faster than the default for ~15% more bytes on a screen
+
+# the admin's choices, fast and lossless first
+PRESETS = (
+    "png level=1",
+    "png level=6",
+    "jpeg quality=75",
+    "webp quality=75",
+    "jpeg quality=75 scale=0.5",
+    "png level=1 gray",
+)
+
+
+class Encoder:
+    """How a screenshot is encoded, parsed from the admin's spec by Encoder.parse()."""
+
+    FORMATS = {"png": "PNG", "jpeg": "JPEG", "webp": "WEBP"}
+    EXTENSIONS = {"png": "png", "jpeg": "jpg", "webp": "webp"}
+
+    def __init__(self, codec="png", level=1, quality=75, scale=1.0, gray=False):
+        if codec not in self.FORMATS:
+            raise ValueError(f"unknown screenshot codec {codec!r}")
+        if not 0 <= level <= 9:
+            raise ValueError(f"png level must be 0-9, not {level}")
+        if not 1 <= quality <= 100:
+            raise ValueError(f"quality must be 1-100, not {quality}")
+        if not 0 < scale <= 1:
+            raise ValueError(f"scale must be above 0 and at most 1, not {scale}")
+        self.codec = codec
+        self.level = level  # PNG compress_level, 1 is several times faster than the default 6
+        self.quality = quality  # JPEG / WebP quality
+        self.scale = scale  # downscale at source before encoding
+        self.gray = gray
+
+    @classmethod
+    def parse(cls, spec):
+        """Build an encoder from a spec like "jpeg quality=70 scale=0.5 gray", raises ValueError if it is not valid."""
+        options = {}
+        for token in spec.split():
+            key, _, value = token.partition("=")
+            if key in cls.FORMATS and not value:
+                options["codec"] = key
+            elif key == "gray" and not value:
+                options["gray"] = True
+            elif key in ("level", "quality") and value:
+                options[key] = int(value)
+            elif key == "scale" and value:
+                options[key] = float(value)
+            else:
+                raise ValueError(f"unknown screenshot option {token!r}")
+        return cls(**options)
+
+    def __str__(self):
+        spec = f"{self.codec} level={self.level}" if self.codec == "png" else f"{self.codec} quality={self.quality}"
+        if self.scale != 1:
+            spec += f" scale={self.scale:g}"
+        if self.gray:
+            spec += " gray"
+        return spec
+
+    @property
+    def extension(self):
+        return self.EXTENSIONS[self.codec]
+
+    def prepare(self, image):
+        """Grayscale and downscale, cheapest first: fewer channels make the scaling faster."""
+        if self.gray:
+            image = image.convert("L")
+        elif image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        if self.scale != 1:
+            factor = 1 / self.scale
+            if factor == int(factor):
+                image = image.reduce(int(factor))  # box filter on whole pixel blocks, the fastest
+            else:
+                size = (max(1, round(image.width * self.scale)), max(1, round(image.height * self.scale)))
+                image = image.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+        return image
+
+    def encode(self, image):
+        """Encode the image in memory, returns a memoryview of the encoded bytes."""
+        return self.encode_prepared(self.prepare(image))
+
+    def encode_prepared(self, image):
+        """Encode an image that went through prepare() already (the live view encodes tiles of it)."""
+        buffer = io.BytesIO()
+        if self.codec == "png":
+            image.save(buffer, format="PNG", compress_level=self.level)
+        elif self.codec == "jpeg":
+            image.save(buffer, format="JPEG", quality=self.quality)
+        else:
+            image.save(buffer, format="WEBP", quality=self.quality, method=WEBP_METHOD)
+        return buffer.getbuffer()
+
+
+DEFAULT_ENCODER = Encoder()
+
+
+def grab():
+    """The whole screen as a PIL image."""
+    return pyautogui.screenshot()
+
+
+def send(sock, data, extension="png"):
+    """Stream an encoded screenshot in CHUNK_SIZE slices of the buffer."""
+    framing.send_frame(sock, framing.PIC_BEGIN, framing.pack_fields(size=len(data), format=extension))
+    for start in range(0, len(data), framing.CHUNK_SIZE):
+        framing.send_frame(sock, framing.PIC_CHUNK, data[start:start + framing.CHUNK_SIZE])
+    framing.send_frame(sock, framing.PIC_END)
+
+
+def save(data, extension="png"):
+    """Keep a copy of the encoded screenshot, returns its file name."""
+    filename = f"PICTURE_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.{extension}"
+    with open(filename, "wb") as f:
+        f.write(data)
+    return filename
@@ -0,0 +1,501 @@
+# storage of the screenshots saved by the server
+
+"""
+ScreenshotStore keeps the screenshots the clients sent under
+
+    screenshots/<CLIENT>/<YYYY-MM-DD>/<HH-MM-SS>.<ext>
+
+so no directory grows with the semester, and indexes them by client and time:
+who sent it, when, its size and sha256. The index lives in memory (per client,
+oldest first) and in the screenshots table, so LASTFILE is a dictionary access
+and a list index.
+
+A screenshot whose content is stored already (an idle screen sent again) is
+saved as a hard link to that file, so it costs a directory entry and no data.
+
+The compactor (compact(), run in the background by the server) enforces the
+RetentionPolicy: screenshots older than max_age_days are removed, then the
+oldest ones until the disk usage is within max_bytes, always keeping every
+client's newest screenshot. It also re-encodes PNG screenshots older than
+transcode_after seconds to a smaller format (WebP by default), a few per pass.
+
+The table is written on the DB thread (db_executor.py), the index in memory
+is updated at once and the rows follow in the same order. At startup the
+index is loaded from the table, rows whose file is gone are
+dropped, and pic_<CLIENT>_<time>.<ext> files that older versions saved in the
+working directory are moved into the layout.
+"""
+
+import asyncio
+import bisect
+import hashlib
+import heapq
+import os
+import re
+from datetime import datetime, timedelta
+
+from PIL import Image
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+import screen_capture
+from database import Screenshot
+
+LEGACY_NAME = re.compile(r'pic_(\w+)_(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})\.(png|jpg|webp)$')
+UNSAFE_NAME = re.compile(r'[^A-Za-z0-9_-]')  # characters a client key may not have
+SQL_BATCH = 500  # paths per DELETE, below SQLite's limit of bound parameters
+
+
+def client_key(name):
+    """
+    The client's name as it appears in file and directory names. Only letters,
+    digits, _ and - are kept, so a name cannot reach outside its directory; a
+    name with other characters gets a hash of it, two names do not share one.
+    """
+    name = name.upper().replace(" ", "_")
+    key = UNSAFE_NAME.sub("_", name)
+    if key != name or not key:
+        key = f"{key}-{sha256_hex(name.encode())[:8]}"
+    return key
+
+
+def sha256_hex(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def store_file(path, data, source=None):
+    """Write a screenshot, or hard link it to source, a file with the same content. Returns True if it was linked."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if source is not None:
+        try:
+            os.link(source, path)
+            return True
+        except OSError:
+            pass  # no hard links on this file system, or the compactor just removed source: write a copy
+    with open(path, "wb") as f:
+        f.write(data)
+    return False
+
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def link_files(paths, source):
+    """Replace the files at paths by hard links to source, a file with the same content."""
+    for path in paths:
+        try:
+            os.link(source, path + ".link")
+            os.replace(path + ".link", path)
+        except OSError:
+            pass  # keep the copy
+
+
+def remove_files(paths):
+    """Delete screenshots and the day and client directories they leave empty."""
+    directories = set()
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        directories.add(os.path.dirname(path))
+    for directory in sorted(directories, reverse=True):
+        for empty in (directory, os.path.dirname(directory)):
+            try:
+                os.rmdir(empty)
+            except OSError:
+                break  # not empty
+
+
+def transcode_file(paths, new_paths, spec):
+    """
+    Re-encode the screenshot at paths[0] with spec and store it at new_paths
+    (hard links after the first). Returns (size, sha256), or None if the result
+    is not smaller. Runs on a worker thread.
+    """
+    with Image.open(paths[0]) as image:
+        data = bytes(screen_capture.Encoder.parse(spec).encode(image))
+    if len(data) >= os.path.getsize(paths[0]):
+        return None
+    store_file(new_paths[0], data)
+    for new_path in new_paths[1:]:
+        store_file(new_path, data, new_paths[0])
+    return len(data), sha256_hex(data)
+
+
+class RetentionPolicy:
+    def __init__(self, max_age_days=120, max_bytes=2 * 1024 * 1024 * 1024, keep_latest=True):
+        self.max_age = timedelta(days=max_age_days)  # about a semester
+        self.max_bytes = max_bytes  # disk used by the screenshots, every content counted once
+        self.keep_latest = keep_latest  # never remove a client's newest screenshot, LASTFILE may still ask for it
+
+
+class ScreenshotEntry:
+    __slots__ = ("client", "taken", "path", "size", "sha256")
+
+    def __init__(self, client, taken, path, size, sha256):
+        self.client = client
+        self.taken = taken
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+
+    def row(self):
+        return {"client": self.client, "taken": self.taken, "path": self.path, "size": self.size, "sha256": self.sha256}
+
+    @property
+    def name(self):
+        """The file name the admin sees, the one screenshots had before they were sorted into directories."""
+        return f"pic_{self.client}_{self.taken.strftime('%Y-%m-%d_%H-%M-%S')}{os.path.splitext(self.path)[1]}"
+
+
+class ScreenshotStore:
+    def __init__(self, database=None, root="screenshots", legacy_directory=".", policy=None,
+                 transcode="webp quality=80", transcode_after=3600, transcode_batch=20):
+        self.database = database  # DatabaseExecutor, None: the index is kept in memory only
+        self.root = root
+        self.legacy_directory = legacy_directory  # where older versions saved pic_* files, None to leave it alone
+        self.policy = policy if policy is not None else RetentionPolicy()
+        self.transcode = transcode  # encoder spec for old PNG screenshots, None to keep them as they are
+        self.transcode_after = timedelta(seconds=transcode_after)
+        self.transcode_batch = transcode_batch  # contents re-encoded per pass, it is CPU heavy
+        self.keep_format = set()  # sha256 of the PNG screenshots that were not smaller transcoded
+        self.by_client = {}  # client key -> [ScreenshotEntry], oldest first
+        self.times = {}  # client key -> [taken], parallel to by_client for range queries
+        self.by_path = {}  # path -> ScreenshotEntry
+        self.by_hash = {}  # sha256 -> {path: ScreenshotEntry} of the files sharing that content
+        self.reserved = set()  # paths being written, not indexed yet
+        self.disk_bytes = 0  # every content counted once
+        self.deduplicated = 0
+        self.removed = 0
+        self.transcoded = 0
+        self.transcode_saved = 0  # bytes
+
+    def __len__(self):
+        return len(self.by_path)
+
+    def path_for(self, client, taken, extension):
+        stem = os.path.join(self.root, client, taken.strftime("%Y-%m-%d"), taken.strftime("%H-%M-%S"))
+        path, number = f"{stem}.{extension}", 1
+        while path in self.by_path or path in self.reserved:  # more than one screenshot in the same second
+            number += 1
+            path = f"{stem}_{number}.{extension}"
+        return path
+
+    # --- startup ---
+
+    def load(self):
+        """Rebuild the index from the table and the files in the layout."""
+        os.makedirs(self.root, exist_ok=True)
+        moved = self.migrate_legacy_files()
+        rows = []
+        if self.database is not None:
+            try:
+                rows = self.database.call(read_index, moved)
+            except SQLAlchemyError as e:
+                print(f"[ERROR] Cannot read the screenshot table, indexing the files only: {e}")
+                self.database = None
+
+        files = set()
+        for directory, _, names in os.walk(self.root):
+            files.update(os.path.join(directory, name) for name in names)
+        gone = []
+        for row_id, client, taken, path, size, sha256 in rows:
+            if path in files:
+                self.index(ScreenshotEntry(client, taken, path, size, sha256))
+                files.discard(path)
+            else:
+                gone.append(row_id)  # the file was deleted while the server was down
+        adopted = [self.adopt(path) for path in sorted(files)]  # on disk but not in the table
+        inserted = [entry.row() for entry in adopted if entry is not None]
+        if self.database is not None and (gone or inserted):
+            try:
+                self.database.call(write_index, inserted=inserted, deleted_ids=gone)
+            except SQLAlchemyError as e:
+                print(f"[ERROR] Saving the screenshot index failed: {e}")
+        print(f"screenshot store: {len(self)} screenshots of {len(self.by_client)} clients, {self.disk_bytes} bytes on disk")
+
+    def migrate_legacy_files(self):
+        """
+        Move the pic_<CLIENT>_<time>.<ext> files of older versions from the
+        working directory into the layout, files with the same content become
+        hard links to one of them. Returns [(file name, path)] of the moved files.
+        """
+        moved = []
+        if self.legacy_directory is None:
+            return moved
+        first = {}  # sha256 -> path of the first file with that content
+        for name in sorted(os.listdir(self.legacy_directory)):
+            match = LEGACY_NAME.match(name)
+            if not match:
+                continue
+            taken = datetime.strptime(match.group(2), "%Y-%m-%d_%H-%M-%S")
+            path = self.path_for(client_key(match.group(1)), taken, match.group(3))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(os.path.join(self.legacy_directory, name), path)
+            with open(path, "rb") as f:
+                digest = sha256_hex(f.read())
+            if digest in first:
+                link_files([path], first[digest])
+            else:
+                first[digest] = path
+            moved.append((name, path))
+        return moved
+
+    def adopt(self, path):
+        """Index a file found in the layout, its client and time come from its path. Returns its entry."""
+        parts = os.path.relpath(path, self.root).split(os.sep)
+        if len(parts) != 3:
+            return None
+        client, day, file_name = parts
+        try:
+            taken = datetime.strptime(f"{day} {file_name[:8]}", "%Y-%m-%d %H-%M-%S")
+        except ValueError:
+            return None
+        with open(path, "rb") as f:
+            data = f.read()
+        entry = ScreenshotEntry(client, taken, path, len(data), sha256_hex(data))
+        same = self.by_hash.get(entry.sha256)
+        if same:
+            link_files([path], next(iter(same)))
+        self.index(entry)
+        return entry
+
+    # --- saving ---
+
+    async def save(self, client, data, extension="png", taken=None):
+        """Store a screenshot a client sent and return its ScreenshotEntry. Hashing and writing run on worker threads."""
+        loop = asyncio.get_running_loop()
+        key = client_key(client)
+        taken = taken if taken is not None else datetime.now()
+        path = self.path_for(key, taken, extension)
+        self.reserved.add(path)
+        try:
+            digest = await loop.run_in_executor(None, sha256_hex, data)
+            same = self.by_hash.get(digest)
+            source = next(iter(same)) if same else None
+            if await loop.run_in_executor(None, store_file, path, data, source):
+                self.deduplicated += 1
+        finally:
+            self.reserved.discard(path)
+        entry = ScreenshotEntry(key, taken, path, len(data), digest)
+        self.index(entry)
+        self.write(inserted=[entry.row()])
+        return entry
+
+    async def read(self, entry):
+        """The content of a screenshot, read on a worker thread."""
+        return await asyncio.get_running_loop().run_in_executor(None, read_file, entry.path)
+
+    def index(self, entry):
+        self.by_path[entry.path] = entry
+        entries = self.by_client.setdefault(entry.client, [])
+        times = self.times.setdefault(entry.client, [])
+        if entries and entry.taken < times[-1]:
+            position = bisect.bisect_right(times, entry.taken)
+            entries.insert(position, entry)
+            times.insert(position, entry.taken)
+        else:
+            entries.append(entry)
+            times.append(entry.taken)
+        self.add_content(entry)
+
+    def add_content(self, entry):
+        same = self.by_hash.setdefault(entry.sha256, {})
+        if not same:
+            self.disk_bytes += entry.size
+        same[entry.path] = entry
+
+    def remove_content(self, entry):
+        same = self.by_hash[entry.sha256]
+        del same[entry.path]
+        if not same:
+            del self.by_hash[entry.sha256]
+            self.disk_bytes -= entry.size
+
+    def write(self, **changes):
+        """Hand changes of the index to the DB thread, the event loop does not wait for them."""
+        if self.database is not None:
+            self.database.run(write_index, **changes).add_done_callback(report_write)
+
+    # --- queries ---
+
+    def latest(self, client, since=None):
+        """The client's newest screenshot, None if there is none (taken at or after since, if given)."""
+        entries = self.by_client.get(client_key(client))
+        if not entries or (since is not None and entries[-1].taken < since):
+            return None
+        return entries[-1]
+
+    def between(self, client, start=None, end=None):
+        """The client's screenshots taken in [start, end), oldest first."""
+        key = client_key(client)
+        entries, times = self.by_client.get(key, []), self.times.get(key, [])
+        low = bisect.bisect_left(times, start) if start is not None else 0
+        high = bisect.bisect_left(times, end) if end is not None else len(times)
+        return entries[low:high]
+
+    # --- compactor ---
+
+    async def compact(self, now=None):
+        """One pass of the retention policy and the transcoder, returns (screenshots removed, contents transcoded)."""
+        now = now if now is not None else datetime.now()
+        loop = asyncio.get_running_loop()
+        victims = self.expired(now)
+        if victims:
+            # out of the index first, so LASTFILE and dedup stop using them before the files go
+            self.forget(victims)
+            paths = [entry.path for entry in victims]
+            await loop.run_in_executor(None, remove_files, paths)
+            self.write(deleted_paths=paths)
+            self.removed += len(victims)
+
+        transcoded = 0
+        updated = []
+        if self.transcode:
+            extension = screen_capture.Encoder.parse(self.transcode).extension
+            for entries in self.transcode_candidates(now - self.transcode_after):
+                paths = [entry.path for entry in entries]
+                new_paths = [os.path.splitext(path)[0] + "." + extension for path in paths]
+                if any(path in self.by_path or path in self.reserved for path in new_paths):
+                    continue  # a screenshot in that format was taken in the same second
+                try:
+                    result = await loop.run_in_executor(None, transcode_file, paths, new_paths, self.transcode)
+                except (OSError, ValueError) as e:
+                    print(f"[ERROR] Transcoding {paths[0]} failed: {e}")
+                    continue
+                if result is None:
+                    self.keep_format.add(entries[0].sha256)
+                    continue
+                if any(self.by_path.get(entry.path) is not entry for entry in entries):
+                    await loop.run_in_executor(None, remove_files, new_paths)  # removed while it was being encoded
+                    continue
+                same = self.by_hash.get(result[1])
+                if same:
+                    # an idle screen saved again after its first screenshots were transcoded
+                    await loop.run_in_executor(None, link_files, new_paths, next(iter(same)))
+                updated += self.replace_content(entries, new_paths, *result)
+                await loop.run_in_executor(None, remove_files, paths)
+                transcoded += 1
+            if updated:
+                self.write(updated=updated)
+        return len(victims), transcoded
+
+    def expired(self, now):
+        """The screenshots the policy removes: too old, then the oldest of all clients until the quota fits."""
+        policy = self.policy
+        cutoff = now - policy.max_age
+        victims = []
+        candidates = []  # per client: the entries that may still go for the quota, oldest first
+        for client, entries in self.by_client.items():
+            removable = len(entries) - 1 if policy.keep_latest else len(entries)
+            old = min(bisect.bisect_left(self.times[client], cutoff), removable)
+            victims.extend(entries[:old])
+            candidates.append(entries[old:removable])
+
+        # a content is freed with the last file that shares it
+        links = {}
+        disk_bytes = self.disk_bytes
+        for entry in victims:
+            links[entry.sha256] = links.get(entry.sha256, len(self.by_hash[entry.sha256])) - 1
+            if not links[entry.sha256]:
+                disk_bytes -= entry.size
+        if disk_bytes > policy.max_bytes:
+            for entry in heapq.merge(*candidates, key=lambda entry: entry.taken):
+                victims.append(entry)
+                links[entry.sha256] = links.get(entry.sha256, len(self.by_hash[entry.sha256])) - 1
+                if not links[entry.sha256]:
+                    disk_bytes -= entry.size
+                    if disk_bytes <= policy.max_bytes:
+                        break
+        return victims
+
+    def forget(self, victims):
+        """Take the victims out of the index, every client loses a run of its oldest entries."""
+        counts = {}
+        for entry in victims:
+            counts[entry.client] = counts.get(entry.client, 0) + 1
+            del self.by_path[entry.path]
+            self.remove_content(entry)
+        for client, count in counts.items():
+            del self.by_client[client][:count]
+            del self.times[client][:count]
+            if not self.by_client[client]:
+                del self.by_client[client]
+                del self.times[client]
+
+    def transcode_candidates(self, before):
+        """The entries of at most transcode_batch contents stored as PNG and taken before the given time."""
+        candidates = []
+        for sha256, same in self.by_hash.items():
+            entries = list(same.values())
+            if entries[0].path.endswith(".png") and entries[0].taken < before and sha256 not in self.keep_format:
+                candidates.append(entries)
+                if len(candidates) == self.transcode_batch:
+                    break
+        return candidates
+
+    def replace_content(self, entries, new_paths, size, sha256):
+        """Point the entries at their transcoded files, returns [(old path, new values)] for the table."""
+        self.transcode_saved += entries[0].size - size
+        updated = []
+        for entry, new_path in zip(entries, new_paths):
+            self.remove_content(entry)
+            del self.by_path[entry.path]
+            updated.append((entry.path, {"path": new_path, "size": size, "sha256": sha256}))
+            entry.path, entry.size, entry.sha256 = new_path, size, sha256
+            self.by_path[new_path] = entry
+            self.add_content(entry)
+        self.transcoded += 1
+        return updated
+
+    def summary(self):
+        return (f"screenshots: {len(self)} of {len(self.by_client)} clients, {self.disk_bytes} of {self.policy.max_bytes} "
+                f"bytes on disk, deduplicated: {self.deduplicated}, transcoded: {self.transcoded} "
+                f"({self.transcode_saved} bytes saved), removed: {self.removed}")
+
+
+# --- the screenshots table, on the DB thread ---
+
+def read_index(session, moved):
+    """Create the table if needed, follow the files of older versions that moved, return every row oldest first."""
+    try:
+        Screenshot.__table__.create(session.get_bind(), checkfirst=True)
+        for name, path in moved:
+            # rows of the version that indexed the working directory
+            session.query(Screenshot).filter_by(path=name).update({"path": path})
+        # plain rows, no ORM objects: this runs over every screenshot kept
+        rows = session.query(Screenshot.id, Screenshot.client, Screenshot.taken, Screenshot.path, Screenshot.size,
+                             Screenshot.sha256).order_by(Screenshot.taken).all()
+        session.commit()
+        return rows
+    except SQLAlchemyError:
+        session.rollback()
+        raise
+
+
+def write_index(session, inserted=(), deleted_ids=(), deleted_paths=(), updated=()):
+    """Apply changes of the index to the table in one transaction."""
+    try:
+        for start in range(0, len(deleted_ids), SQL_BATCH):
+            session.query(Screenshot).filter(Screenshot.id.in_(deleted_ids[start:start + SQL_BATCH])).delete(
+                synchronize_session=False)
+        for start in range(0, len(deleted_paths), SQL_BATCH):
+            session.query(Screenshot).filter(Screenshot.path.in_(deleted_paths[start:start + SQL_BATCH])).delete(
+                synchronize_session=False)
+        for path, values in updated:
+            session.query(Screenshot).filter_by(path=path).update(values)
+        if inserted:
+            session.execute(insert(Screenshot), inserted)
+        session.commit()
+    except SQLAlchemyError:
+        session.rollback()
+        raise
+
+
+def report_write(future):
+    if not future.cancelled() and future.exception() is not None:
+        # the files are there, the next start indexes the ones missing from the table again
+        print(f"[ERROR] Saving the screenshot index failed: {future.exception()}")
@@ -0,0 +1,64 @@
+# screenshot upload state machine
+
+from framing import FrameError
+
+MAX_SCREENSHOT = 64 * 1024 * 1024  # refuse uploads announced above 64 MB
+EXTENSIONS = ("png", "jpg", "webp")  # image formats a client may send, the extension ends up in a file name
+
+
+class ScreenshotUpload:
+    """
+    Receives one client's screenshot incrementally. The server feeds it every
+    PIC_BEGIN / PIC_CHUNK / PIC_END frame as it arrives on the connection, so an
+    upload never holds up the event loop and each client has its own upload in flight.
+
+    IDLE --begin()--> RECEIVING --feed()*--> RECEIVING --finish()--> IDLE
+    """
+    IDLE = "idle"
+    RECEIVING = "receiving"
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.state = self.IDLE
+        self.buffer = None
+        self.view = None
+        self.expected = 0
+        self.received = 0
+        self.extension = "png"
+
+    def begin(self, expected_size, extension="png"):
+        if self.state != self.IDLE:
+            raise FrameError("screenshot upload already in progress")
+        if not 0 < expected_size <= MAX_SCREENSHOT:
+            raise FrameError(f"bad screenshot size {expected_size}")
+        if extension not in EXTENSIONS:
+            raise FrameError(f"bad screenshot format {extension!r}")
+        # the whole picture is received into one buffer allocated up front
+        self.buffer = bytearray(expected_size)
+        self.view = memoryview(self.buffer)
+        self.expected = expected_size
+        self.received = 0
+        self.extension = extension
+        self.state = self.RECEIVING
+
+    def feed(self, chunk):
+        if self.state != self.RECEIVING:
+            raise FrameError("screenshot chunk received without PIC_BEGIN")
+        end = self.received + len(chunk)
+        if end > self.expected:
+            raise FrameError("screenshot is larger than announced")
+        self.view[self.received:end] = chunk
+        self.received = end
+
+    def finish(self):
+        """Return the complete screenshot and go back to IDLE."""
+        if self.state != self.RECEIVING:
+            raise FrameError("PIC_END received without PIC_BEGIN")
+        if self.received != self.expected:
+            raise FrameError(f"screenshot incomplete: {self.received}/{self.expected} bytes")
+        data = self.buffer
+        self.view.release()
+        self.reset()
+        return data
@@ -0,0 +1,482 @@
+# multi-process server: client connections are spread over worker processes
+
+import asyncio
+import itertools
+import multiprocessing
+import os
+import secrets
+import socket
+import struct
+import sys
+import time
+
+import framing
+from acceptor import ClientAcceptor, server_ssl_context
+from async_server import AsyncServerEngine, new_event_loop, raise_open_file_limit
+from broadcast import ClientSender
+from client_registry import ClientRecord
+from screenshot_upload import ScreenshotUpload
+
+
+"""
+With shards > 0 the server runs as one coordinator and N worker processes.
+Every worker listens on the client port with SO_REUSEPORT, so the kernel spreads
+the students over the workers, and does the TLS work of its own connections.
+The coordinator keeps the admin connections, the database and the file cache
+and talks to the workers over a local connection with its own frames:
+
+    worker -> coordinator               coordinator -> worker
+    HELLO   token | worker index        VERDICT  client id | accepted | reply
+    JOIN    client id | ip | name       DELIVER  seq | client ids | frame for the clients
+    LEAVE   client id                   DROP     client id
+    CLIENT  client id | frame type | payload   (a frame a client sent)
+    ACK     seq | ok flag per client    STATS    (ACCEPTSTATS request / reply)
+
+In the coordinator every remote client is a normal ClientRecord whose writer
+and sender stand in for the real stream, so command routing, broadcasts, file
+relays and offers work exactly like in the single process server.
+"""
+
+HELLO = 1
+JOIN = 2
+VERDICT = 3
+LEAVE = 4
+CLIENT = 5
+DELIVER = 6
+ACK = 7
+DROP = 8
+STATS = 9
+
+TOKEN_SIZE = 16
+CLIENT_ID = struct.Struct("!I")
+JOIN_HEAD = struct.Struct("!IHB")  # client id, ip length, compression flag the client decodes (0 for none)
+VERDICT_HEAD = struct.Struct("!IB")  # client id, accepted
+CLIENT_HEAD = struct.Struct("!IB")  # client id, frame type
+BATCH_HEAD = struct.Struct("!IH")  # seq, number of clients (DELIVER / ACK)
+
+
+# --- coordinator side ---
+
+class RemoteClient:
+    """Stands in for the StreamWriter of a client that is connected to a worker."""
+
+    __slots__ = ("link", "client_id")
+
+    def __init__(self, link, client_id):
+        self.link = link
+        self.client_id = client_id
+
+    def close(self):
+        if self.link.clients.pop(self.client_id, None) is not None:
+            self.link.write(DROP, CLIENT_ID.pack(self.client_id))
+
+
+class RemoteSender:
+    """Stands in for the ClientSender of a client that is connected to a worker."""
+
+    def __init__(self, writer, name, ip, codec=None):
+        self.writer = writer
+        self.name = name
+        self.ip = ip
+        self.codec = codec  # compression the client negotiated with its worker
+        self.closed = False
+
+    def send(self, header, parts):
+        if self.closed:
+            future = asyncio.get_running_loop().create_future()
+            future.set_exception(ConnectionError(f"{self.name} disconnected"))
+            return future
+        return self.writer.link.send(self.writer.client_id, self.name, header, parts)
+
+    def send_frame(self, frame_type, *parts):
+        flags, parts = framing.compress(frame_type, parts, self.codec)
+        return self.send(framing.pack_header(frame_type, sum(len(part) for part in parts), flags), parts)
+
+    def send_text(self, text):
+        return self.send_frame(framing.TEXT, text.encode())
+
+    def close(self):
+        self.closed = True
+
+
+class ShardLink:
+    """
+    The coordinator's connection to one worker. Frames for clients of the worker
+    are collected until the loop is idle: a frame that is sent to many clients
+    at once (a broadcast, a file chunk) crosses to the worker once with the list
+    of client ids. The worker acknowledges it when every client was written,
+    which completes the senders' futures.
+    """
+
+    def __init__(self, index, reader, writer):
+        self.index = index
+        self.reader = reader
+        self.writer = writer
+        self.clients = {}  # client id -> RemoteClient
+        self.pending = []  # [header, parts, client ids, (future, name, queued at)...] not written yet
+        self.waiting = {}  # seq -> [(future, name, queued at)] until the worker acknowledges
+        self.seq = 0
+        self.stats = None  # future of a STATS request
+        self.closed = False
+
+    def write(self, message_type, *parts):
+        if not self.closed:
+            framing.write_frame(self.writer, message_type, *parts)
+
+    def send(self, client_id, name, header, parts):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if self.closed:
+            future.set_exception(ConnectionError(f"{name} disconnected"))
+            return future
+        if self.pending and self.pending[-1][0] == header and self.pending[-1][1] is parts:
+            group = self.pending[-1]
+        else:
+            if not self.pending:
+                loop.call_soon(self.flush)
+            group = [header, parts, [], []]
+            self.pending.append(group)
+        group[2].append(client_id)
+        group[3].append((future, name, time.perf_counter()))
+        return future
+
+    def flush(self):
+        pending, self.pending = self.pending, []
+        for header, parts, client_ids, futures in pending:
+            if self.closed:
+                self.fail(futures)
+                continue
+            self.seq += 1
+            self.waiting[self.seq] = futures
+            ids = struct.pack(f"!{len(client_ids)}I", *client_ids)
+            self.write(DELIVER, BATCH_HEAD.pack(self.seq, len(client_ids)), ids, header, *parts)
+
+    def acknowledged(self, payload):
+        seq, count = BATCH_HEAD.unpack_from(payload)
+        for (future, name, queued_at), ok in zip(self.waiting.pop(seq, []), payload[BATCH_HEAD.size:]):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(time.perf_counter() - queued_at)
+            else:
+                future.set_exception(ConnectionError(f"send to {name} failed"))
+
+    @staticmethod
+    def fail(futures):
+        for future, name, _ in futures:
+            if not future.done():
+                future.set_exception(ConnectionError(f"{name} disconnected"))
+
+    def close(self):
+        self.closed = True
+        for _, _, _, futures in self.pending:
+            self.fail(futures)
+        for futures in self.waiting.values():
+            self.fail(futures)
+        self.pending, self.waiting = [], {}
+        if self.stats is not None and not self.stats.done():
+            self.stats.set_result("worker disconnected")
+        self.writer.close()
+
+
+class ShardedServerEngine(AsyncServerEngine):
+    """AsyncServerEngine whose clients are connected to worker processes instead of this one."""
+
+    def __init__(self, server_ip, admin_port, admin_port_test, client_port, client_msg_clientlist_port, ssl_context,
+                 certfile, keyfile, shards, session=None, client_backlog=1024, handshake_timeout=10.0, file_cache=None,
+                 max_send_queue=8 * 1024 * 1024, screenshot_store=None, quiet_workers=False):
+        if not hasattr(socket, "SO_REUSEPORT"):
+            raise OSError("the multi-process server needs SO_REUSEPORT (Linux, BSD or macOS)")
+        super().__init__(server_ip, admin_port, admin_port_test, client_port, client_msg_clientlist_port, ssl_context,
+                         session, client_backlog=client_backlog, handshake_timeout=handshake_timeout,
+                         file_cache=file_cache, max_send_queue=max_send_queue, screenshot_store=screenshot_store)
+        self.shard_count = shards
+        self.token = secrets.token_bytes(TOKEN_SIZE)  # workers prove they were started by us
+        self.worker_config = {"server_ip": server_ip, "client_port": client_port, "certfile": certfile,
+                              "keyfile": keyfile, "client_backlog": client_backlog,
+                              "handshake_timeout": handshake_timeout, "max_send_queue": max_send_queue}
+        self.quiet_workers = quiet_workers
+        self.links = {}  # worker index -> ShardLink
+        self.workers = []
+        self.shards_ready = asyncio.Event()
+
+    async def start_client_listener(self):
+        """Start the worker processes and wait until all of them listen on the client port."""
+        server = await asyncio.start_server(self.handle_shard, "127.0.0.1", 0)
+        config = dict(self.worker_config, ipc_port=server.sockets[0].getsockname()[1], token=self.token)
+        context = multiprocessing.get_context("spawn")  # a fork would copy the running event loop
+        for index in range(self.shard_count):
+            worker = context.Process(target=run_shard_worker, args=(index, config, self.quiet_workers), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        try:
+            await asyncio.wait_for(self.shards_ready.wait(), 30)
+        except asyncio.TimeoutError:
+            server.close()
+            for worker in self.workers:
+                worker.terminate()
+            raise RuntimeError(f"only {len(self.links)} of {self.shard_count} workers started")
+        print(f"{self.shard_count} worker processes are listening for clients")
+        return server
+
+    async def shutdown(self):
+        # the workers close their clients when their link closes
+        for link in list(self.links.values()):
+            link.close()
+        await super().shutdown()
+        loop = asyncio.get_running_loop()
+        for worker in self.workers:
+            await loop.run_in_executor(None, worker.join, 5)
+            if worker.is_alive():
+                worker.terminate()
+
+    async def handle_admin_command(self, command):
+        if command == "ACCEPTSTATS":  # every worker accepts its own clients
+            await self.wait_for_reports()
+            summaries = await asyncio.gather(*(self.worker_stats(link) for link in self.links.values()))
+            await self.send_text(self.admin_writer, "\n".join(summaries))
+            return
+        await super().handle_admin_command(command)
+
+    async def worker_stats(self, link):
+        link.stats = asyncio.get_running_loop().create_future()
+        link.write(STATS)
+        try:
+            return f"worker {link.index}:\n" + await asyncio.wait_for(link.stats, 5)
+        except asyncio.TimeoutError:
+            return f"worker {link.index}: no answer"
+
+    async def handle_shard(self, reader, writer):
+        task = asyncio.current_task()
+        self.connection_tasks.add(task)
+        try:
+            message_type, payload = await asyncio.wait_for(framing.read_frame(reader), 10)
+            if message_type != HELLO or not secrets.compare_digest(bytes(payload[:TOKEN_SIZE]), self.token):
+                print("[ERROR] Rejected a connection on the worker port")
+                writer.close()
+                return
+            link = ShardLink(int(payload[TOKEN_SIZE:].decode()), reader, writer)
+            self.links[link.index] = link
+            if len(self.links) == self.shard_count:
+                self.shards_ready.set()
+            await self.serve_shard(link)
+        finally:
+            self.connection_tasks.discard(task)
+
+    async def serve_shard(self, link):
+        try:
+            while True:
+                message_type, payload = await framing.read_frame(link.reader)
+                if message_type == ACK:
+                    link.acknowledged(payload)
+                elif message_type == CLIENT:
+                    client_id, frame_type = CLIENT_HEAD.unpack_from(payload)
+                    handle = link.clients.get(client_id)
+                    if handle is not None and handle in self.clients:
+                        await self.handle_client_frame(handle, frame_type, payload[CLIENT_HEAD.size:])
+                elif message_type == JOIN:
+                    await self.join_remote_client(link, payload)
+                elif message_type == LEAVE:
+                    (client_id,) = CLIENT_ID.unpack_from(payload)
+                    handle = link.clients.pop(client_id, None)
+                    record = self.clients.get(handle) if handle is not None else None
+                    if record is not None:
+                        self.remove_client(handle)
+                        print(f"{record.name} disconnected")
+                elif message_type == STATS:
+                    if link.stats is not None and not link.stats.done():
+                        link.stats.set_result(payload.decode())
+        except (asyncio.IncompleteReadError, ConnectionError, framing.FrameError) as e:
+            print(f"worker {link.index} disconnected: {e!r}")
+        finally:
+            link.close()
+            self.links.pop(link.index, None)
+            for handle in list(link.clients.values()):
+                self.remove_client(handle)
+
+    async def join_remote_client(self, link, payload):
+        """A worker accepted a client, register it like register_client does."""
+        client_id, ip_length, codec_flag = JOIN_HEAD.unpack_from(payload)
+        codec = framing.codec_for_flags(codec_flag)
+        client_ip = payload[JOIN_HEAD.size:JOIN_HEAD.size + ip_length].decode()
+        client_name = payload[JOIN_HEAD.size + ip_length:].decode()
+        if not client_name or self.clients.name_in_use(client_name):
+            link.write(VERDICT, VERDICT_HEAD.pack(client_id, 0), b"error- Client name already in use")
+            print(f"Rejected duplicate client name: {client_name}")
+            return
+        link.write(VERDICT, VERDICT_HEAD.pack(client_id, 1))
+
+        handle = RemoteClient(link, client_id)
+        link.clients[client_id] = handle
+        self.clients.add(ClientRecord(handle, client_name, client_ip, RemoteSender(handle, client_name, client_ip, codec),
+                                      ScreenshotUpload()))
+        self.timers.schedule(handle, self.heartbeat_interval)
+        print(f"New client connected from {client_ip} with name: {client_name} (worker {link.index})")
+        await self.notify_admin_msg_clientlist("refresh client list, new client connected")
+
+
+# --- worker side ---
+
+class ShardWorker:
+    """One worker process: accepts clients on the shared port and relays between them and the coordinator."""
+
+    def __init__(self, index, server_ip, client_port, ipc_port, token, certfile, keyfile, client_backlog=1024,
+                 handshake_timeout=10.0, max_send_queue=8 * 1024 * 1024):
+        self.index = index
+        self.server_ip = server_ip
+        self.client_port = client_port
+        self.ipc_port = ipc_port
+        self.token = token
+        self.certfile = certfile
+        self.keyfile = keyfile
+        self.client_backlog = client_backlog
+        self.handshake_timeout = handshake_timeout
+        self.max_send_queue = max_send_queue
+
+        self.ids = itertools.count(1)
+        self.joining = {}  # client id -> (writer, name, ip, future of the coordinator's verdict)
+        self.senders = {}  # client id -> ClientSender
+        self.client_ids = {}  # writer -> client id
+        self.tasks = set()
+
+    async def run(self):
+        # each worker has its own ticket keys: a client resumes only if it lands on the same worker again
+        self.acceptor = ClientAcceptor(server_ssl_context(self.certfile, self.keyfile), backlog=self.client_backlog, handshake_timeout=self.handshake_timeout,
+                                       registration_timeout=self.handshake_timeout)
+
+        self.ipc_reader, self.ipc_writer = await asyncio.open_connection("127.0.0.1", self.ipc_port)
+        server = await self.acceptor.start(self.server_ip, self.client_port, self.handle_client, reuse_port=True)
+        self.write(HELLO, self.token, str(self.index).encode())
+        print(f"worker {self.index} (pid {os.getpid()}) is listening for clients on port {self.client_port}")
+        try:
+            await self.serve_coordinator()
+        finally:
+            server.close()
+            for writer in list(self.client_ids):
+                writer.close()
+            if self.tasks:
+                await asyncio.wait(self.tasks, timeout=2)
+
+    def write(self, message_type, *parts):
+        framing.write_frame(self.ipc_writer, message_type, *parts)
+
+    def track(self, coro):
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def serve_coordinator(self):
+        try:
+            while True:
+                message_type, payload = await framing.read_frame(self.ipc_reader)
+                if message_type == DELIVER:
+                    self.deliver(payload)
+                elif message_type == VERDICT:
+                    self.verdict(payload)
+                elif message_type == DROP:
+                    (client_id,) = CLIENT_ID.unpack_from(payload)
+                    sender = self.senders.get(client_id)
+                    if sender is not None:
+                        sender.close()
+                        sender.writer.close()
+                elif message_type == STATS:
+                    self.write(STATS, self.acceptor.metrics.summary().encode())
+        except (asyncio.IncompleteReadError, ConnectionError):
+            print(f"worker {self.index}: coordinator closed the connection")
+
+    def deliver(self, payload):
+        """Queue a frame on the listed clients, acknowledge once all of them were written."""
+        seq, count = BATCH_HEAD.unpack_from(payload)
+        client_ids = struct.unpack_from(f"!{count}I", payload, BATCH_HEAD.size)
+        frame = memoryview(payload)[BATCH_HEAD.size + 4 * count:].toreadonly()
+        header, body = frame[:framing.HEADER_SIZE], frame[framing.HEADER_SIZE:]
+        futures = []
+        for client_id in client_ids:
+            sender = self.senders.get(client_id)
+            if sender is None:
+                future = asyncio.get_running_loop().create_future()
+                future.set_exception(ConnectionError("client disconnected"))
+                futures.append(future)
+            else:
+                futures.append(sender.send(header, (body,)))
+        self.track(self.acknowledge(seq, futures))
+
+    async def acknowledge(self, seq, futures):
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        self.write(ACK, BATCH_HEAD.pack(seq, len(results)), bytes(not isinstance(r, Exception) for r in results))
+
+    def verdict(self, payload):
+        client_id, accepted = VERDICT_HEAD.unpack_from(payload)
+        entry = self.joining.get(client_id)
+        if entry is None:
+            if accepted:  # the client gave up waiting, the coordinator must forget it again
+                self.write(LEAVE, CLIENT_ID.pack(client_id))
+            return
+        writer, client_name, client_ip, future = entry
+        if accepted:
+            # queued before anything the coordinator sends to the client next
+            sender = ClientSender(writer, client_name, client_ip, max_queued=self.max_send_queue)
+            sender.send_text("OK")
+            self.senders[client_id] = sender
+            self.client_ids[writer] = client_id
+        future.set_result((accepted, bytes(payload[VERDICT_HEAD.size:])))
+
+    async def register(self, writer, client_ip, client_name, codec):
+        """Ask the coordinator whether the name is free, for ClientAcceptor.accept."""
+        client_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.joining[client_id] = (writer, client_name, client_ip, future)
+        ip = client_ip.encode()
+        # the coordinator encodes the client's frames, so it needs to know its codec
+        self.write(JOIN, JOIN_HEAD.pack(client_id, len(ip), framing.CODECS.get(codec, 0)), ip, client_name.encode())
+        try:
+            accepted, reply = await asyncio.wait_for(future, self.handshake_timeout)
+        finally:
+            del self.joining[client_id]
+        if not accepted:
+            framing.write_frame(writer, framing.TEXT, reply)
+            await writer.drain()
+        return accepted
+
+    async def handle_client(self, reader, writer):
+        task = asyncio.current_task()
+        self.tasks.add(task)
+        try:
+            client_name = await self.acceptor.accept(reader, writer, self.register)
+            if client_name is None:
+                return
+            await self.serve_client(reader, writer, client_name)
+        finally:
+            self.tasks.discard(task)
+
+    async def serve_client(self, reader, writer, client_name):
+        client_id = self.client_ids[writer]
+        try:
+            while True:
+                frame_type, payload = await framing.read_frame(reader)
+                self.write(CLIENT, CLIENT_HEAD.pack(client_id, frame_type), payload)
+                await self.ipc_writer.drain()
+        except asyncio.IncompleteReadError:
+            print(f"{client_name} disconnected")
+        except (framing.FrameError, ConnectionError, OSError) as e:
+            print(f"Client Connection error with {client_name}: {e}")
+        finally:
+            self.client_ids.pop(writer, None)
+            sender = self.senders.pop(client_id, None)
+            if sender is not None:
+                sender.close()
+            writer.close()
+            if not self.ipc_writer.is_closing():
+                self.write(LEAVE, CLIENT_ID.pack(client_id))
+
+
+def run_shard_worker(index, config, quiet=False):
+    """Entry point of a worker process."""
+    if quiet:
+        sys.stdout = open(os.devnull, "w")
+    raise_open_file_limit()
+    try:
+        with asyncio.Runner(loop_factory=new_event_loop) as runner:
+            runner.run(ShardWorker(index, **config).run())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,131 @@
+# classroom thumbnail wall: one mosaic of every client's screen
+
+"""
+For WALL the server asks every client for a small screenshot at once (scaled
+down and JPEG encoded on the student's machine), turns each one into a
+thumbnail on a worker thread as soon as it arrives, and composes all of them
+into one mosaic image the size of the admin's screenshot canvas. The admin
+gets the whole class in one JPEG instead of a full-size PNG per student.
+"""
+
+import asyncio
+import io
+import math
+
+from PIL import Image, ImageDraw
+
+DEFAULT_SIZE = (1280, 720)  # mosaic size when the admin does not send its canvas size
+MAX_SIZE = 4096
+ASPECT = 16 / 9  # of a student's screen
+LABEL = 16  # pixels under every thumbnail for the client's name
+BACKGROUND = (30, 30, 30)
+MISSING = (70, 70, 70)
+QUALITY = 80  # JPEG quality of the mosaic
+
+
+def parse_size(args):
+    """(width, height) from "WALL 800x450", the default size if there is none, ValueError if it is not valid."""
+    if not args:
+        return DEFAULT_SIZE
+    width, _, height = args.lower().partition("x")
+    if not width.isdigit() or not height.isdigit():
+        raise ValueError(f"wall size must look like 800x450, not {args}")
+    width, height = int(width), int(height)
+    if not 0 < width <= MAX_SIZE or not 0 < height <= MAX_SIZE:
+        raise ValueError(f"wall size must be 1-{MAX_SIZE} pixels, not {args}")
+    return width, height
+
+
+def layout(count, width, height):
+    """(columns, rows, thumbnail width, thumbnail height) with the largest thumbnails that fit count screens in the mosaic."""
+    best = (1, count, 1, 1)
+    for columns in range(1, count + 1):
+        rows = math.ceil(count / columns)
+        thumb_width = min(width // columns, int((height // rows - LABEL) * ASPECT))
+        if thumb_width > best[2]:
+            best = (columns, rows, thumb_width, max(1, round(thumb_width / ASPECT)))
+    return best
+
+
+def capture_spec(thumb_width):
+    """
+    The screenshot encoder the clients are asked for: shrunk on the student's
+    machine by a whole factor to about the thumbnail size (for a 1920 pixel
+    wide screen) and sent as JPEG, a few KB per client.
+    """
+    scale = 1.0
+    while scale > 0.125 and 1920 * scale / 2 >= thumb_width:
+        scale /= 2
+    return f"jpeg quality=80 scale={scale:g}"
+
+
+def thumbnail(data, size):
+    """Decode one screenshot and shrink it to fit size. Runs on a worker thread."""
+    image = Image.open(io.BytesIO(data))
+    image.draft("RGB", size)  # JPEG decodes at 1/2, 1/4 or 1/8 of its size directly
+    image = image.convert("RGB")
+    image.thumbnail(size, Image.Resampling.BILINEAR)
+    return image
+
+
+def compose(shots, columns, rows, thumb_size):
+    """The mosaic of (name, thumbnail or None) as JPEG bytes. Runs on a worker thread."""
+    thumb_width, thumb_height = thumb_size
+    cell_width, cell_height = thumb_width, thumb_height + LABEL
+    mosaic = Image.new("RGB", (columns * cell_width, rows * cell_height), BACKGROUND)
+    draw = ImageDraw.Draw(mosaic)
+    for position, (name, image) in enumerate(shots):
+        left, top = (position % columns) * cell_width, (position // columns) * cell_height
+        if image is None:
+            draw.rectangle((left + 1, top + 1, left + thumb_width - 2, top + thumb_height - 2), fill=MISSING)
+            draw.text((left + 6, top + 6), "no screenshot", fill="white")
+        else:
+            mosaic.paste(image, (left + (thumb_width - image.width) // 2, top + (thumb_height - image.height) // 2))
+        draw.text((left + 4, top + thumb_height + 2), name, fill="white")
+    buffer = io.BytesIO()
+    mosaic.save(buffer, format="JPEG", quality=QUALITY)
+    return buffer.getvalue()
+
+
+class WallRequest:
+    """The screenshots of one WALL, by the client's writer, thumbnailed as they arrive."""
+
+    def __init__(self, records, thumb_size):
+        self.thumb_size = thumb_size
+        self.names = [record.name for record in records]
+        self.thumbnails = {record.writer: asyncio.get_running_loop().create_future() for record in records}
+        self.done = False
+
+    def asked(self, writer, sent):
+        """sent: the future of the SCREENSHOT command to the client, a client that could not be asked gets an empty cell."""
+        sent.add_done_callback(lambda future: self.fail(writer) if future.cancelled() or future.exception() else None)
+
+    def deliver(self, writer, data):
+        """A client's screenshot arrived: shrink it on a worker thread. Screenshots after the deadline are dropped."""
+        future = self.thumbnails[writer]
+        if self.done or future.done():
+            return
+        work = asyncio.get_running_loop().run_in_executor(None, thumbnail, data, self.thumb_size)
+        asyncio.ensure_future(work).add_done_callback(lambda task: self.finished(future, task))
+
+    def fail(self, writer):
+        """The client could not be asked or disconnected, its cell stays empty."""
+        future = self.thumbnails.get(writer)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    @staticmethod
+    def finished(future, task):
+        if future.done():
+            return
+        if task.cancelled() or task.exception() is not None:
+            future.set_result(None)  # not an image we can read
+        else:
+            future.set_result(task.result())
+
+    async def collect(self, timeout):
+        """(name, thumbnail or None) of every client, in the order of the client list, after at most timeout seconds."""
+        futures = list(self.thumbnails.values())
+        await asyncio.wait(futures, timeout=timeout)
+        self.done = True
+        return [(name, future.result() if future.done() else None) for name, future in zip(self.names, futures)]
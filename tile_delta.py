@@ -0,0 +1,201 @@
+# live screen monitoring: tile based delta encoding of a student's screen
+
+"""
+The screen is cut into TILE x TILE squares. Every frame the client compares
+the new screen with the previous one, tile by tile, in one vectorized NumPy
+pass and sends only the tiles that changed: their indices and one "atlas"
+image with the tiles side by side, encoded like a screenshot (see
+screen_capture.Encoder). A frame whose size or color mode changed carries
+every tile, so the receiver can always rebuild the screen from it.
+
+SCREEN_DELTA payload:
+    width, height, tile, atlas columns, tile count (HEAD) | tile indices (uint16 each) | atlas image
+
+TileEncoder   - the client: screen -> delta
+TileCanvas    - the admin: delta -> reconstructed screen
+TileHistory   - the server: remembers, without decoding anything, which delta
+                holds the current content of every tile, so it can replay the
+                screen to an admin who starts watching or fell behind.
+"""
+
+import io
+import struct
+
+import numpy as np
+from PIL import Image
+
+TILE = 64  # pixels, a row of a tile is a whole number of uint64 words for 1 and 3 channels
+ATLAS_COLUMNS = 32  # tiles per row of the atlas image (2048 pixels wide)
+HEAD = struct.Struct("!HHHHH")  # width, height, tile, atlas columns, tile count
+INDEX = np.dtype(">u2")
+
+
+def grid(width, height, tile):
+    """(rows, columns) of tiles covering the screen, the last ones hang over the edge."""
+    return -(-height // tile), -(-width // tile)
+
+
+def parse_head(payload):
+    """(width, height, tile, atlas columns, tile indices, offset of the atlas image) of a delta."""
+    if len(payload) < HEAD.size:
+        raise ValueError("screen delta too short")
+    width, height, tile, columns, count = HEAD.unpack_from(payload)
+    if not width or not height or not tile or not columns:
+        raise ValueError("screen delta with an empty screen")
+    end = HEAD.size + count * INDEX.itemsize
+    if len(payload) < end:
+        raise ValueError("screen delta cut short")
+    indices = np.frombuffer(payload, INDEX, count, HEAD.size).astype(np.intp)
+    rows, cols = grid(width, height, tile)
+    if count and indices.max() >= rows * cols:
+        raise ValueError("screen delta tile index outside the screen")
+    return width, height, tile, columns, indices, end
+
+
+class TileEncoder:
+    """Turns consecutive screens of one client into deltas. Not thread safe, one per monitoring loop."""
+
+    def __init__(self, tile=TILE):
+        self.tile = tile
+        self.previous = None  # padded (rows*tile, cols*tile, channels) array of the last frame sent
+        self.spare = None  # buffer the next frame is copied into, swapped with previous
+        self.size = None
+
+    def reset(self):
+        """Forget the last frame, the next delta carries every tile (a new connection, a new viewer)."""
+        self.previous = self.spare = self.size = None
+
+    def encode(self, image, encoder):
+        """
+        Delta of the screen since the last call, encoded with encoder (a
+        screen_capture.Encoder, its scale / gray are applied first).
+        Returns None if nothing changed.
+        """
+        frame = np.asarray(encoder.prepare(image))
+        if frame.ndim == 2:
+            frame = frame[:, :, None]
+        height, width, channels = frame.shape
+        tile = self.tile
+        rows, cols = grid(width, height, tile)
+        key = self.previous is None or self.size != (width, height, channels)
+        if key:
+            self.previous = np.zeros((rows * tile, cols * tile, channels), np.uint8)
+            self.spare = np.zeros_like(self.previous)
+            self.size = (width, height, channels)
+
+        current = self.spare
+        current[:height, :width] = frame
+        if key:
+            changed = np.arange(rows * cols)
+        else:
+            # compare 8 bytes at a time: a tile row is tile*channels bytes, a multiple of 8
+            words = (rows, tile, cols, tile * channels * current.itemsize // 8)
+            new = current.reshape(rows, tile, cols, -1).view(np.uint64).reshape(words)
+            old = self.previous.reshape(rows, tile, cols, -1).view(np.uint64).reshape(words)
+            changed = np.flatnonzero(np.not_equal(new, old).any(axis=(1, 3)))
+        self.spare, self.previous = self.previous, current
+        if not len(changed):
+            return None
+
+        tiles = current.reshape(rows, tile, cols, tile, channels)[changed // cols, :, changed % cols]
+        atlas = self.atlas(tiles)
+        head = HEAD.pack(width, height, tile, min(len(changed), ATLAS_COLUMNS), len(changed))
+        return b"".join((head, changed.astype(INDEX).tobytes(), encoder.encode_prepared(atlas)))
+
+    def atlas(self, tiles):
+        """The tiles (n, tile, tile, channels) laid out ATLAS_COLUMNS to a row, as one image."""
+        count, tile, _, channels = tiles.shape
+        columns = min(count, ATLAS_COLUMNS)
+        rows = -(-count // columns)
+        if rows * columns != count:
+            tiles = np.concatenate((tiles, np.zeros((rows * columns - count, tile, tile, channels), np.uint8)))
+        sheet = tiles.reshape(rows, columns, tile, tile, channels).swapaxes(1, 2).reshape(rows * tile, columns * tile, channels)
+        return Image.fromarray(sheet[:, :, 0] if channels == 1 else sheet)
+
+
+class TileCanvas:
+    """The reconstructed screen of one client on the admin's side."""
+
+    def __init__(self):
+        self.frame = None  # padded (rows*tile, cols*tile, channels) array
+        self.size = None  # (width, height) of the screen
+
+    def apply(self, payload):
+        """Paint a delta on the screen, raises ValueError for a malformed one."""
+        width, height, tile, columns, indices, offset = parse_head(payload)
+        try:
+            atlas = Image.open(io.BytesIO(payload[offset:]))
+            atlas.load()
+        except Exception as e:
+            raise ValueError(f"bad screen delta image: {e}") from e
+        sheet = np.asarray(atlas.convert("L" if atlas.mode in ("L", "1", "P") else "RGB"))
+        if sheet.ndim == 2:
+            sheet = sheet[:, :, None]
+        channels = sheet.shape[2]
+        rows, cols = grid(width, height, tile)
+        atlas_rows = -(-len(indices) // columns)
+        if sheet.shape[:2] != (atlas_rows * tile, columns * tile):
+            raise ValueError("screen delta image does not match its tiles")
+
+        shape = (rows * tile, cols * tile, channels)
+        if self.frame is None or self.frame.shape != shape or self.size != (width, height):
+            self.frame = np.zeros(shape, np.uint8)  # a new geometry comes with every tile
+            self.size = (width, height)
+        tiles = sheet.reshape(atlas_rows, tile, columns, tile, channels).swapaxes(1, 2).reshape(-1, tile, tile, channels)
+        self.frame.reshape(rows, tile, cols, tile, channels)[indices // cols, :, indices % cols] = tiles[:len(indices)]
+
+    def image(self):
+        """The current screen as a PIL image, None before the first delta."""
+        if self.frame is None:
+            return None
+        width, height = self.size
+        screen = self.frame[:height, :width]
+        return Image.fromarray(screen[:, :, 0] if screen.shape[2] == 1 else screen)
+
+
+class TileHistory:
+    """
+    The deltas of one client that still hold the current content of at least
+    one tile. Applying them in order rebuilds the screen, so the server can
+    bring a new viewer up to date without decoding or encoding any image.
+    """
+
+    def __init__(self):
+        self.geometry = None  # (width, height, tile)
+        self.owner = None  # per tile: sequence number of the delta holding it, -1 if none
+        self.deltas = {}  # sequence number -> payload, in arrival order
+        self.references = {}  # sequence number -> number of tiles it holds
+        self.sequence = 0
+        self.behind = False  # a delta did not reach the admin, replay before the next one
+
+    def apply(self, payload):
+        """Remember a delta, drop the ones whose tiles were all painted over. Raises ValueError for a malformed one."""
+        width, height, tile, _, indices, _ = parse_head(payload)
+        indices = np.unique(indices)
+        if self.geometry != (width, height, tile):
+            rows, cols = grid(width, height, tile)
+            self.geometry = (width, height, tile)
+            self.owner = np.full(rows * cols, -1, np.int64)
+            self.deltas.clear()
+            self.references.clear()
+        if not len(indices):
+            return
+        previous, counts = np.unique(self.owner[indices], return_counts=True)
+        for sequence, count in zip(previous.tolist(), counts.tolist()):
+            if sequence < 0:
+                continue
+            self.references[sequence] -= count
+            if not self.references[sequence]:
+                del self.references[sequence]
+                del self.deltas[sequence]
+        self.owner[indices] = self.sequence
+        self.deltas[self.sequence] = bytes(payload)
+        self.references[self.sequence] = len(indices)
+        self.sequence += 1
+
+    def replay(self):
+        """The deltas that rebuild the current screen, oldest first."""
+        return list(self.deltas.values())
+
+    def replay_bytes(self):
+        return sum(len(delta) for delta in self.deltas.values())
@@ -0,0 +1,52 @@
+# timer wheel for the connection deadlines
+
+"""
+TimerWheel keeps one deadline per key (a client's stream writer) in a ring of
+slots, one slot per tick. Scheduling or cancelling a key is a set operation
+and every tick only looks at the keys that fall due in it, so the cost of a
+tick does not grow with the number of connected clients.
+
+Delays longer than the wheel are clamped to its last slot: the key comes up
+early and the owner checks the real deadline and schedules it again.
+"""
+
+
+class TimerWheel:
+    def __init__(self, tick=1.0, slots=64):
+        self.tick = tick  # seconds per slot
+        self.slots = [set() for _ in range(slots)]
+        self.position = 0  # slot of the current tick
+        self.slot_of = {}  # key -> index of the slot it waits in
+
+    def __len__(self):
+        return len(self.slot_of)
+
+    def __contains__(self, key):
+        return key in self.slot_of
+
+    def schedule(self, key, delay):
+        """(Re)schedule key to come up in delay seconds, at least one tick from now."""
+        slots = self.slots
+        ticks = int(delay / self.tick) + 1
+        if ticks >= len(slots):
+            ticks = len(slots) - 1
+        slot = self.slot_of.get(key)
+        if slot is not None:
+            slots[slot].discard(key)
+        slot = (self.position + ticks) % len(slots)
+        slots[slot].add(key)
+        self.slot_of[key] = slot
+
+    def cancel(self, key):
+        slot = self.slot_of.pop(key, None)
+        if slot is not None:
+            self.slots[slot].discard(key)
+
+    def advance(self):
+        """Move one tick forward, returns the keys that are due (they are no longer scheduled)."""
+        self.position = (self.position + 1) % len(self.slots)
+        due = self.slots[self.position]
+        self.slots[self.position] = set()
+        for key in due:
+            del self.slot_of[key]
+        return due